@@ -1,6 +1,8 @@
-from application import create_app, db
-from application.models import Config, Category  # Import your Config model
-from application.utils import ini_users  # Assuming ini_users is in utils.py
+import click
+
+from application import create_app
+from application.bootstrap import bootstrap
+from application.migrations import upgrade
 
 app = create_app()
 
@@ -9,20 +11,123 @@ def initialize_database():
     Initializes the database, creates tables, and ensures default records exist.
     """
     with app.app_context():
-        db.create_all()  # Create all tables if they don't already exist
-        
-        # Ensure there is at least one Config record
-        if not Config.query.first():
-            default_config = Config(stopwords='')
-            db.session.add(default_config)
-            db.session.commit()
-        Category.get_or_create_default()
-        # Initialize default users or other essential data
-        ini_users()
-        try:
-            db.session.execute("ALTER TABLE newspaper_issue ADD FULLTEXT INDEX idx_fulltext_content (content);")
-        except:
-            pass
+        bootstrap()
+
+@app.cli.command('init')
+def init_command():
+    """
+    Creates the tables, applies migrations and creates the default records.
+    Run once per deploy (e.g. as a Cloud Run job) before the app serves traffic.
+    """
+    bootstrap(log=click.echo)
+    click.echo('Database initialized.')
+
+@app.cli.command('import-archive')
+@click.argument('source', type=click.Path(exists=True))
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None, help='Text extraction processes (default: CPU count).')
+@click.option('--upload-workers', type=int, default=8, help='Concurrent uploads to the bucket.')
+@click.option('--batch-size', type=int, default=50, help='Issues inserted per transaction.')
+def import_archive_command(source, manifest, workers, upload_workers, batch_size):
+    """
+    Bulk imports a directory or zip of PDFs described by a CSV/JSON manifest.
+    Safe to re-run after a crash: already imported files are skipped.
+    """
+    from application.bulk_import import import_archive, ManifestError
+
+    try:
+        stats = import_archive(source, manifest, workers=workers, upload_workers=upload_workers,
+                               batch_size=batch_size, log=click.echo)
+    except ManifestError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Imported {stats['imported']}, skipped {stats['skipped']}, failed {stats['failed']} "
+        f"in {stats['seconds']:.1f}s ({stats['files_per_sec']:.2f} files/s, {stats['mb_per_sec']:.2f} MB/s)"
+    )
+
+@app.cli.command('backfill-pages')
+@click.option('--workers', type=int, default=None, help='Text extraction processes (default: CPU count).')
+def backfill_pages_command(workers):
+    """
+    Extracts per-page text for issues uploaded before pages were stored.
+    """
+    from application.ingest import backfill_pages
+
+    done = backfill_pages(workers=workers, log=click.echo)
+    click.echo(f'Backfilled {done} issues.')
+
+@app.cli.command('prepare-text')
+def prepare_text_command():
+    """
+    Computes the sizes, ETags and compressed forms of page text stored before they existed.
+    """
+    from application.text_pages import prepare_page_text
+
+    done = prepare_page_text(log=click.echo)
+    click.echo(f'Prepared {done} issues.')
+
+@app.cli.command('backfill-previews')
+@click.option('--workers', type=int, default=None, help='Rendering processes (default: CPU count).')
+def backfill_previews_command(workers):
+    """
+    Renders thumbnails and page previews for issues uploaded before previews existed.
+    """
+    from application.previews import backfill_previews
+    from application.utils import update_cache
+
+    done = backfill_previews(workers=workers, log=click.echo)
+    update_cache()
+    click.echo(f'Backfilled {done} issues.')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """
+    Rebuilds the search index of the configured SEARCH_BACKEND from the database.
+    """
+    from application.search import get_search_backend
+
+    count = get_search_backend().rebuild()
+    click.echo(f'Indexed {count} issues.')
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """
+    Recomputes the per-day issue counts behind the archive calendar.
+    """
+    from application.rollup import rebuild_issue_counts
+    from application.utils import update_cache
+
+    rows = rebuild_issue_counts()
+    update_cache()
+    click.echo(f'Wrote {rows} rollup rows.')
+
+@app.cli.command('warm-cache')
+@click.option('--months', type=int, default=None, help='Recent months to warm (default: WARMUP_MONTHS).')
+@click.option('--budget', type=float, default=None, help='Time budget in seconds (default: WARMUP_BUDGET_SEC).')
+def warm_cache_command(months, budget):
+    """
+    Precomputes the landing page, archive calendar and recent months for every view power.
+    Useful after a deploy when the cache is shared between processes.
+    """
+    from application.warmup import warm_cache
+
+    warm_cache(months=months, budget_sec=budget, log=click.echo)
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List applied and pending migrations without applying any.')
+def migrate_command(status):
+    """
+    Applies pending schema migrations (application/migrations.py).
+    """
+    from application.migrations import MIGRATIONS, applied_versions
+
+    if status:
+        applied = applied_versions()
+        for version, description, _ in MIGRATIONS:
+            click.echo(f"{version:4d} {'applied' if version in applied else 'pending'}  {description}")
+        return
+    count = upgrade(log=click.echo)
+    click.echo(f'Applied {count} migrations.')
 
 if __name__ == "__main__":
     # Initialize the database before running the app
@@ -5,24 +5,25 @@ from flask_caching import Cache
 from config import Config
 
 
-from sqlalchemy import text
-
 db = SQLAlchemy()
 login_manager = LoginManager()
 cache = Cache()
 
-def create_app():
+def create_app(config: dict = None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)  # e.g. benchmarks running against a throwaway database
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     cache.init_app(app)
 
-    # Set up Google Cloud credentials
+    # Set up Google Cloud credentials; the client itself is created on first use (storage.get_storage)
     import os
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = Config.init_google_cloud_storage()
+    if app.config.get('STORAGE_BACKEND', 'gcs') == 'gcs':
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = app.config['GOOGLE_SERVICE_ACCOUNT_FILE']
 
     # Register blueprints
     from .routes import main_bp, page_not_found
@@ -30,26 +31,24 @@ def create_app():
 
     app.register_error_handler(404, page_not_found)
 
-
-    # Initializes the database, creates tables, and ensures default records exist.
-    from .models import Config as db_Config, Category  # Import your Config model
-    from .utils import ini_users  # Assuming ini_users is in utils.py
-    # print("ini1!!!")
-    with app.app_context():
-        db.create_all()  # Create all tables if they don't already exist
-
-        # Ensure there is at least one Config record
-        if not db_Config.query.first():
-            default_config = db_Config(stopwords='')
-            db.session.add(default_config)
-            db.session.commit()
-        Category.get_or_create_default()
-        # Initialize default users or other essential data
-        ini_users()
-        try:
-            sql = text('ALTER TABLE newspaper_issue ADD FULLTEXT INDEX idx_fulltext_content (content);')
-            db.session.execute(sql)
-        except:
-            pass
+    # Request, database and cache metrics for /metrics and the Server-Timing header
+    from . import metrics
+    metrics.init_app(app)
+    # Flags queries repeated within one request (N+1 patterns); off unless QUERY_AUDIT is set
+    from . import query_audit
+    query_audit.init_app(app)
+
+    # Schema and seed data are set up once per database by `flask --app app init`,
+    # not by every worker at every start
+    if app.config.get('BOOTSTRAP_ON_STARTUP', False):
+        from .bootstrap import bootstrap
+        with app.app_context():
+            bootstrap(log=app.logger.info)
+
+    # Fill this process's cache in the background, so the first visitors get warm pages
+    if app.config.get('WARMUP_ON_STARTUP', False):
+        from .warmup import schedule_warmup
+        with app.app_context():
+            schedule_warmup(delay=0)
 
     return app
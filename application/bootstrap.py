@@ -0,0 +1,33 @@
+from .models import db, Config, Category, NewspaperIssue, IssueCount
+from .migrations import upgrade
+from .rollup import rebuild_issue_counts
+from .utils import ini_users
+
+
+def bootstrap(log=None) -> None:
+    """
+    Prepares a database for the app: creates missing tables, applies pending
+    migrations, and creates the default records (the Config row, the
+    'Uncategorized' category and the admin user). Safe to run repeatedly.
+
+    This is one-shot work, run by `flask --app app init` on deploy rather than
+    by `create_app`, so workers and cold starts do not pay for it.
+
+    Args:
+        log (callable): Receives a line per step that changed something.
+    """
+    db.create_all()  # Create all tables if they don't already exist
+    upgrade(log=log)
+
+    # Ensure there is at least one Config record
+    if not Config.query.first():
+        db.session.add(Config(stopwords=''))
+        db.session.commit()
+    Category.get_or_create_default()
+    # Initialize default users or other essential data
+    ini_users()
+    # Fill the archive rollup on databases created before it existed
+    if not IssueCount.query.first() and NewspaperIssue.query.first():
+        rows = rebuild_issue_counts()
+        if log is not None:
+            log(f'Wrote {rows} rollup rows.')
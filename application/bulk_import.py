@@ -0,0 +1,251 @@
+import os
+import csv
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import datetime
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+from .models import db, NewspaperIssue, Category, IngestionJob
+from .ingest import extract_pdf_pages, set_issue_pages
+from .utils import update_cache
+from .search import get_search_backend
+from .storage import get_storage
+from .previews import render_pdf_previews, set_issue_previews, preview_renderer_options
+from .rollup import issue_count_key, adjust_issue_counts
+
+MANIFEST_FIELDS = ('file', 'title', 'author', 'issued_time', 'category', 'view_power')
+
+# Manifest fields holding text; JSON manifests may also leave the optional ones null
+TEXT_FIELDS = ('file', 'title', 'author', 'issued_time', 'category')
+REQUIRED_FIELDS = ('file', 'title', 'issued_time')
+
+
+class ManifestError(ValueError):
+    """
+    Raised when a manifest or one of its entries is invalid. Nothing is imported.
+    """
+
+
+def read_manifest(manifest_path: str) -> list:
+    """
+    Reads a bulk import manifest. CSV files need a header row; JSON files hold a
+    list of objects. Both use the keys in `MANIFEST_FIELDS`, where `file` is the
+    path of the PDF relative to the import source.
+
+    Args:
+        manifest_path (str): Path of a `.csv` or `.json` manifest.
+
+    Returns:
+        list[dict]: One normalized entry per issue.
+
+    Raises:
+        ManifestError: If the manifest is not a list of entries, or an entry
+            misses its file, title or issued_time or has a value of the wrong type.
+    """
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, encoding='utf-8') as f:
+            try:
+                rows = json.load(f)
+            except ValueError as e:
+                raise ManifestError(f'The manifest is not valid JSON: {e}') from None
+        if not isinstance(rows, list):
+            raise ManifestError('A JSON manifest must hold a list of entries.')
+    else:
+        with open(manifest_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+    return [_manifest_entry(line, row) for line, row in enumerate(rows, start=1)]
+
+
+def _manifest_entry(line: int, row) -> dict:
+    if not isinstance(row, dict):
+        raise ManifestError(f'Manifest entry {line} must be an object, not {type(row).__name__}.')
+    for name in TEXT_FIELDS:
+        if row.get(name) is not None and not isinstance(row[name], str):
+            raise ManifestError(f"Manifest entry {line}: '{name}' must be text, not {type(row[name]).__name__}.")
+    values = {name: (row.get(name) or '').strip() for name in TEXT_FIELDS}
+    if not all(values[name] for name in REQUIRED_FIELDS):
+        raise ManifestError(f"Manifest entry {line} needs 'file', 'title' and 'issued_time'.")
+
+    try:
+        values['issued_time'] = datetime.datetime.strptime(values['issued_time'], '%Y-%m-%d').date()
+    except ValueError:
+        raise ManifestError(f"Manifest entry {line}: 'issued_time' must be a YYYY-MM-DD date, "
+                            f"not {values['issued_time']!r}.") from None
+
+    # An int in JSON manifests, a string in CSV ones; empty means the default
+    view_power = row.get('view_power')
+    if view_power is None or view_power == '':
+        view_power = 1
+    elif isinstance(view_power, str) and view_power.strip().isdigit():
+        view_power = int(view_power)
+    elif isinstance(view_power, bool) or not isinstance(view_power, int):
+        raise ManifestError(f"Manifest entry {line}: 'view_power' must be a whole number, not {view_power!r}.")
+    if not 0 <= view_power <= 5:
+        raise ManifestError(f"Manifest entry {line}: 'view_power' must be between 0 and 5, not {view_power}.")
+    values['view_power'] = view_power
+    return values
+
+
+def content_blob_name(path: str) -> str:
+    """
+    Names a blob after the hash of the file content, so re-running an import
+    overwrites the same blob and already imported files can be recognised.
+
+    Args:
+        path (str): The local path of the file.
+
+    Returns:
+        str: The blob name, e.g. `3f2a...e1.pdf`.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32] + os.path.splitext(path)[1].lower()
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_archive(source: str, manifest_path: str, workers: int = None, upload_workers: int = 8,
+                   batch_size: int = 50, log=print) -> dict:
+    """
+    Imports a directory or zip file of PDFs described by a manifest.
+
+    Each batch is staged locally, its text is extracted across a process pool
+    while the blobs are uploaded concurrently, and its rows are inserted in one
+    transaction. Files whose blob is already referenced by an issue are skipped,
+    so an interrupted import can simply be run again. The cache is refreshed
+    once at the end.
+
+    Args:
+        source (str): A directory or a `.zip` file containing the PDFs.
+        manifest_path (str): The CSV/JSON manifest (see `read_manifest`).
+        workers (int): Extraction processes; defaults to the CPU count.
+        upload_workers (int): Concurrent uploads to the bucket.
+        batch_size (int): Issues inserted per transaction.
+        log (callable): Receives progress lines.
+
+    Returns:
+        dict: Counts of imported, skipped and failed files plus throughput.
+    """
+    entries = read_manifest(manifest_path)
+    archive = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else None
+    staging_dir = tempfile.mkdtemp(prefix='miniarchive_import_')
+
+    storage = get_storage()
+    imported_blobs = {blob for (blob,) in db.session.query(NewspaperIssue.file_blob)}
+    categories = {c.name: c for c in Category.query.all()}
+    default_category = Category.get_or_create_default()
+    search_backend = get_search_backend()
+    preview_options = preview_renderer_options() if current_app.config.get('PREVIEWS_ENABLED', True) else None
+
+    stats = {'imported': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    started = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as process_pool, \
+                ThreadPoolExecutor(max_workers=upload_workers) as upload_pool:
+            for batch in _batches(entries, batch_size):
+                # Stage the batch locally and drop files imported by a previous run
+                staged = []
+                batch_issues = []
+                for entry in batch:
+                    try:
+                        if archive is not None:
+                            path = archive.extract(entry['file'], staging_dir)
+                        else:
+                            path = os.path.join(source, entry['file'])
+                        blob_name = content_blob_name(path)
+                    except (KeyError, OSError) as e:
+                        stats['failed'] += 1
+                        log(f"Cannot read {entry['file']}: {e}")
+                        continue
+                    if blob_name in imported_blobs:
+                        stats['skipped'] += 1
+                        continue
+                    imported_blobs.add(blob_name)
+                    staged.append((entry, path, blob_name))
+
+                extractions = [process_pool.submit(extract_pdf_pages, path) for _, path, _ in staged]
+                renderings = [process_pool.submit(render_pdf_previews, path, **preview_options) if preview_options else None
+                              for _, path, _ in staged]
+                uploads = [upload_pool.submit(storage.put, blob_name, path, 'application/pdf')
+                           for _, path, blob_name in staged]
+
+                for (entry, path, blob_name), extraction, rendering, upload in zip(staged, extractions, renderings, uploads):
+                    try:
+                        upload.result()
+                    except Exception as e:
+                        stats['failed'] += 1
+                        imported_blobs.discard(blob_name)
+                        log(f"Upload failed for {entry['file']}: {e}")
+                        continue
+
+                    category_name = entry['category'] or default_category.name
+                    category = categories.get(category_name)
+                    if category is None:
+                        category = Category(name=category_name)
+                        db.session.add(category)
+                        categories[category_name] = category
+
+                    issue = NewspaperIssue(
+                        title=entry['title'],
+                        author=entry['author'],
+                        issued_time=entry['issued_time'],
+                        view_power=entry['view_power'],
+                        file_blob=blob_name,
+                        category=category,
+                        content='',
+                    )
+                    try:
+                        set_issue_pages(issue, extraction.result())
+                    except Exception as e:
+                        # Keep the issue and leave a failed job that can be retried from the admin page
+                        db.session.add(IngestionJob(issue=issue, file_blob=blob_name, status='failed', error=str(e)))
+                        stats['failed'] += 1
+                        log(f"Extraction failed for {entry['file']}: {e}")
+                    else:
+                        stats['imported'] += 1
+                        if rendering is not None:
+                            try:
+                                set_issue_previews(issue, rendering.result(), executor=upload_pool)
+                            except Exception as e:
+                                log(f"Previews failed for {entry['file']}: {e}")
+                    stats['bytes'] += os.path.getsize(path)
+                    db.session.add(issue)
+                    adjust_issue_counts(added=issue_count_key(issue))
+                    batch_issues.append(issue)
+
+                db.session.commit()
+                for issue in batch_issues:
+                    search_backend.index_issue(issue)
+
+                if archive is not None:
+                    for _, path, _ in staged:
+                        os.remove(path)
+
+                elapsed = time.perf_counter() - started
+                log(f"{stats['imported'] + stats['skipped'] + stats['failed']}/{len(entries)} files, "
+                    f"{stats['imported'] / elapsed:.2f} files/s, {stats['bytes'] / elapsed / 1e6:.2f} MB/s")
+    finally:
+        if archive is not None:
+            archive.close()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    update_cache()
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = elapsed
+    stats['files_per_sec'] = stats['imported'] / elapsed if elapsed else 0.0
+    stats['mb_per_sec'] = stats['bytes'] / elapsed / 1e6 if elapsed else 0.0
+    return stats
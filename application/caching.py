@@ -0,0 +1,165 @@
+import uuid
+from functools import wraps
+
+from flask import current_app
+from flask_login import current_user
+
+from . import cache
+
+TAG_PREFIX = 'tag:'
+ENTRY_PREFIX = 'tagged:'
+
+# Every tagged entry also carries this tag, so one call can drop them all
+ALL_ISSUES_TAG = 'issues'
+
+# Invalidated by every change to any issue; its version is the corpus generation
+CORPUS_TAG = 'corpus'
+
+
+def current_tier() -> int:
+    """
+    Returns the permission tier of the current user, which is their view power.
+    Users of the same tier see the same issues, so they share cache entries.
+
+    Returns:
+        int: The view power, or 0 for anonymous users.
+    """
+    if current_user and current_user.is_authenticated:
+        return current_user.view_power
+    return 0
+
+
+def _tag_versions(tags) -> dict:
+    """
+    Reads the current version token of each tag, creating tokens for tags that
+    have none yet (never invalidated, or evicted).
+    """
+    tags = sorted(set(tags))
+    keys = [TAG_PREFIX + tag for tag in tags]
+    versions = dict(zip(tags, cache.get_many(*keys))) if keys else {}
+    for tag, version in versions.items():
+        if version is None:
+            # add() keeps a token another process created first
+            cache.add(TAG_PREFIX + tag, uuid.uuid4().hex, timeout=0)
+            versions[tag] = cache.get(TAG_PREFIX + tag)
+    return versions
+
+
+def invalidate_tags(*tags) -> None:
+    """
+    Invalidates every cache entry carrying any of the given tags, for every tier.
+
+    Args:
+        *tags (str): Tags such as `issue:12`, `month:2024-03`, `day:2024-03-05`, `category:3`.
+    """
+    if tags:
+        cache.set_many({TAG_PREFIX + tag: uuid.uuid4().hex for tag in set(tags)}, timeout=0)
+        # Processes keeping local copies of shared entries must re-read the tags
+        broadcast = getattr(cache.cache, 'broadcast_invalidation', None)
+        if broadcast is not None:
+            broadcast()
+
+
+def corpus_generation() -> str:
+    """
+    Returns the current corpus generation: a token that changes whenever any
+    issue is added, edited or deleted. Caches spanning the whole corpus, such
+    as search results, put it in their keys instead of tracking what they cover.
+
+    Returns:
+        str: The generation token.
+    """
+    return _tag_versions([CORPUS_TAG])[CORPUS_TAG]
+
+
+def tags_version(*tags) -> str:
+    """
+    Returns a token that changes whenever any of the tags is invalidated, for
+    validators such as page ETags.
+
+    Args:
+        *tags (str): The tags.
+
+    Returns:
+        str: The token, or None if the cache keeps no versions (e.g. `NullCache`),
+        in which case nothing can be validated.
+    """
+    versions = _tag_versions(tags)
+    if any(version is None for version in versions.values()):
+        return None
+    return ':'.join(versions[tag] for tag in sorted(versions))
+
+
+def shared_cache_enabled() -> bool:
+    """
+    Returns whether the cache is the shared `TieredCache`, whose invalidations
+    reach every worker process within `CACHE_L1_CHECK_SEC`. With a per-process
+    cache, an invalidation only reaches the process that made it.
+
+    Returns:
+        bool: True if `CACHE_TYPE` is `TieredCache`.
+    """
+    return current_app.config.get('CACHE_TYPE', '').endswith('TieredCache')
+
+
+def tag_cached(tags, result_tags=None, timeout=86400):
+    """
+    Caches a function by its positional arguments and attaches tags to the entry.
+    An entry is served only while none of its tags has been invalidated.
+
+    Functions whose result depends on the viewer take the view power as an
+    argument, so the tier is part of the key.
+
+    Args:
+        tags (callable): Returns the tags of a call, given the call's arguments.
+        result_tags (callable): Returns additional tags derived from the result.
+        timeout (int | callable): Lifetime of an entry in seconds, or a function
+            returning it, for lifetimes read from the config.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(f):
+        name = f'{f.__module__}.{f.__qualname__}'
+
+        @wraps(f)
+        def wrapper(*args):
+            key = ENTRY_PREFIX + name + ':' + ':'.join(str(arg) for arg in args)
+            entry = cache.get(key)
+            if entry is not None:
+                versions, value = entry
+                if _tag_versions(versions) == versions:
+                    return value
+
+            # Read the argument tags before computing, so an invalidation racing
+            # with the computation leaves the stored entry already stale
+            call_tags = [ALL_ISSUES_TAG, *tags(*args)]
+            versions = _tag_versions(call_tags)
+            value = f(*args)
+            if result_tags is not None:
+                versions.update(_tag_versions(result_tags(value)))
+            cache.set(key, (versions, value), timeout=timeout() if callable(timeout) else timeout)
+            return value
+
+        wrapper.uncached = f
+        return wrapper
+    return decorator
+
+
+def issue_tags(issue) -> list:
+    """
+    Returns the tags of every cache entry an issue can appear in.
+
+    Args:
+        issue (NewspaperIssue): The issue.
+
+    Returns:
+        list[str]: Its issue, category, month and day tags, plus `archive` and `corpus`.
+    """
+    tags = [f'issue:{issue.id}', 'archive', CORPUS_TAG]
+    if issue.category_id is not None:
+        tags.append(f'category:{issue.category_id}')
+    if issue.issued_time is not None:
+        tags.append(f'month:{issue.issued_time:%Y-%m}')
+        tags.append(f'day:{issue.issued_time:%Y-%m-%d}')
+    return tags
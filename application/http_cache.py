@@ -0,0 +1,82 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, session, make_response, Response
+from flask_login import current_user
+
+from .caching import current_tier, tags_version, CORPUS_TAG
+
+# What the archive pages show besides issues: category names and the About text
+PAGE_TAGS = (CORPUS_TAG, 'categories', 'about')
+
+
+def page_etag(tags) -> str:
+    """
+    Returns the ETag of a page for the current user. A URL shows the same
+    thing to every user of a tier and role, until one of its tags is
+    invalidated or a new release changes the templates, so the ETag is derived
+    from those and can be computed without touching the database.
+
+    Args:
+        tags (iterable[str]): The tags of the data the page shows.
+
+    Returns:
+        str: The ETag, or None if the cache keeps no tag versions.
+    """
+    version = tags_version(*tags)
+    if version is None:
+        return None
+    role = current_user.role if current_user.is_authenticated else 'anonymous'
+    # The full path: every month and day page shares its endpoint
+    key = f"{request.full_path}|{current_tier()}|{role}|{version}|{current_app.config.get('PAGE_ETAG_SALT', '')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _cache_headers(response: Response) -> Response:
+    if current_user.is_authenticated:
+        # Kept by the browser, but revalidated on every visit
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        # Shared caches (the domain proxy worker) may keep it; browsers revalidate
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = current_app.config.get('PUBLIC_PAGE_MAX_AGE_SEC', 60)
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_page(tags=PAGE_TAGS):
+    """
+    Sends an ETag with a page and answers `If-None-Match` with `304 Not
+    Modified` before the view runs, so revalidations cost neither queries nor
+    template rendering. Place it below `login_required`.
+
+    Responses carrying flashed messages are never validated, since they differ
+    from the page a client may hold.
+
+    Args:
+        tags (iterable[str]): The tags of the data the page shows; defaults to
+            `PAGE_TAGS`, which every change to issues, categories or the About
+            text invalidates.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = None if '_flashes' in session else page_etag(tags)
+            if etag is None:
+                return view(*args, **kwargs)
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            return _cache_headers(response)
+        return wrapper
+    return decorator
@@ -0,0 +1,223 @@
+import time
+import random
+from collections import Counter, deque
+from threading import Lock
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+# Responses worth another attempt: the worker or its upstream is overloaded or restarting
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_clients = {}
+_clients_lock = Lock()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised without any network I/O while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream after repeated failures.
+
+    After `failure_threshold` consecutive failed calls the breaker opens and
+    every call fails fast. Once `reset_after` seconds have passed, a single trial
+    call is let through (half-open); its success closes the breaker again, its
+    failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        Returns 'closed', 'open' or 'half-open'.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.trial_running or time.monotonic() - self.opened_at >= self.reset_after:
+                return 'half-open'
+            return 'open'
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may go out now. A True answer in the half-open
+        state reserves the single trial call.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class HTTPClient:
+    """
+    An HTTP client for one upstream service, shared by all threads of a process.
+
+    Connections are kept alive in a pool, every attempt is bounded by connect
+    and read timeouts, failed attempts are retried with jittered exponential
+    backoff, and a `CircuitBreaker` fails calls fast while the upstream is down.
+    Latency and error counts are kept for `stats`.
+    """
+
+    def __init__(self, connect_timeout: float = 2.0, read_timeout: float = 5.0, retries: int = 2,
+                 backoff: float = 0.2, pool_size: int = 10, breaker: CircuitBreaker = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # Retries are done here, so the breaker and the metrics see every attempt
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.counters = Counter()
+        self.latencies = deque(maxlen=1000)  # seconds, most recent attempts
+        self.stats_lock = Lock()
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        """
+        Sends a GET request, retrying connection errors, timeouts and
+        `RETRY_STATUSES` responses.
+
+        Args:
+            url (str): The URL.
+            params (dict): Query string parameters.
+
+        Returns:
+            requests.Response: The last response. Other error statuses are
+            returned as is; call `raise_for_status` to reject them.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            requests.RequestException: If the last attempt failed.
+        """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f'Circuit open for {url}')
+
+        try:
+            response = self._send(url, params)
+        except BaseException:
+            # Whatever the error, the call must settle the breaker: an unsettled
+            # half-open trial would keep it open for good
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500 or response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            # 4xx: the upstream is up and answering, so it is not a reason to stop calling it
+            self.breaker.record_success()
+        return response
+
+    def _send(self, url: str, params: dict) -> requests.Response:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count('retries')
+                # Full jitter keeps retrying processes from hitting the upstream in lockstep
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._record(start, 'timeouts' if isinstance(e, requests.Timeout) else 'connection_errors')
+                if attempt == self.retries:
+                    raise
+                continue
+            except Exception:
+                self._record(start, 'unexpected_errors')
+                raise
+
+            if response.status_code in RETRY_STATUSES or response.status_code >= 500:
+                self._record(start, 'error_statuses')
+                if attempt == self.retries or response.status_code not in RETRY_STATUSES:
+                    return response
+                response.close()
+                continue
+
+            # Counted apart from 'ok', so an upstream rejecting every call shows in the stats
+            self._record(start, 'client_error_statuses' if response.status_code >= 400 else 'ok')
+            return response
+
+    def _count(self, event: str) -> None:
+        with self.stats_lock:
+            self.counters[event] += 1
+
+    def _record(self, start: float, outcome: str) -> None:
+        latency = time.perf_counter() - start
+        with self.stats_lock:
+            self.counters['attempts'] += 1
+            self.counters[outcome] += 1
+            self.latencies.append(latency)
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of this client, its error rate, the latency
+        percentiles of recent attempts in milliseconds, and the breaker state.
+
+        Returns:
+            dict: The statistics.
+        """
+        with self.stats_lock:
+            stats = dict(self.counters)
+            latencies = sorted(self.latencies)
+        attempts = stats.get('attempts', 0)
+        failed = attempts - stats.get('ok', 0)
+        stats['error_rate'] = failed / attempts if attempts else 0.0
+        for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            stats[name] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2) if latencies else None
+        stats['circuit'] = self.breaker.state
+        return stats
+
+
+def get_worker_client() -> HTTPClient:
+    """
+    Returns the process-wide client for the Cloudflare proxy worker, configured by
+    the `WORKER_*` settings.
+
+    Returns:
+        HTTPClient: The client.
+    """
+    with _clients_lock:
+        if 'worker' not in _clients:
+            config = current_app.config
+            _clients['worker'] = HTTPClient(
+                connect_timeout=config.get('WORKER_CONNECT_TIMEOUT_SEC', 2.0),
+                read_timeout=config.get('WORKER_READ_TIMEOUT_SEC', 5.0),
+                retries=config.get('WORKER_RETRIES', 2),
+                backoff=config.get('WORKER_RETRY_BACKOFF_SEC', 0.2),
+                pool_size=config.get('WORKER_POOL_SIZE', 10),
+                breaker=CircuitBreaker(config.get('WORKER_BREAKER_FAILURES', 5),
+                                       config.get('WORKER_BREAKER_RESET_SEC', 30.0)),
+            )
+        return _clients['worker']
@@ -0,0 +1,283 @@
+import os
+import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+
+from flask import current_app
+
+from .models import db, IngestionJob, NewspaperIssue, IssuePage
+from .storage import get_storage
+from .text_pages import encoded_pages
+
+_executor_lock = Lock()
+_process_pool = None
+_job_threads = None
+
+
+def extract_pdf_pages(path: str) -> list:
+    """
+    Extracts the text of a PDF file page by page.
+
+    This runs inside a worker process of the ingestion pool, so it must not
+    touch the database or the Flask application.
+
+    Args:
+        path (str): The local path of the PDF file.
+
+    Returns:
+        list[str]: The lower-cased text of each page, in page order.
+    """
+    import pdfplumber
+
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            pages.append((page.extract_text() or '').lower())
+            page.flush_cache()  # Keep memory flat on long documents
+    return pages
+
+
+def set_issue_pages(issue: NewspaperIssue, pages: list) -> None:
+    """
+    Replaces the page rows of an issue and rebuilds its full-text `content`.
+    The caller commits.
+
+    Args:
+        issue (NewspaperIssue): The issue, persisted or pending.
+        pages (list[str]): The text of each page, in page order.
+    """
+    if issue.id is not None:
+        IssuePage.query.filter_by(issue_id=issue.id).delete()
+    # Sizes, ETags and compressed forms are computed once here, never per request
+    for page_no, (page_text, columns) in enumerate(zip(pages, encoded_pages(pages)), start=1):
+        db.session.add(IssuePage(issue=issue, page_no=page_no, text=page_text, **columns))
+    issue.content = '\n'.join(pages)
+
+
+def _get_executors() -> tuple:
+    """
+    Lazily creates the process pool doing the extraction and the thread pool
+    driving the jobs. Both are sized by `INGEST_WORKERS`.
+
+    Returns:
+        tuple: (ProcessPoolExecutor, ThreadPoolExecutor)
+    """
+    global _process_pool, _job_threads
+    with _executor_lock:
+        if _process_pool is None:
+            workers = current_app.config.get('INGEST_WORKERS', 2)
+            _process_pool = ProcessPoolExecutor(max_workers=workers)
+            _job_threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+    return _process_pool, _job_threads
+
+
+def spool_path(file_blob: str) -> str:
+    """
+    Returns the local path where the file of a blob waits for extraction.
+
+    Args:
+        file_blob (str): The name of the blob in the storage bucket.
+
+    Returns:
+        str: The path inside `INGEST_SPOOL_DIR`.
+    """
+    spool_dir = current_app.config['INGEST_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+    return os.path.join(spool_dir, file_blob)
+
+
+def enqueue_ingestion(issue: NewspaperIssue) -> IngestionJob:
+    """
+    Creates an ingestion job for the issue's current file and hands it to the
+    background workers. The spooled file must already exist at `spool_path`.
+
+    Args:
+        issue (NewspaperIssue): A committed issue whose `file_blob` is a PDF.
+
+    Returns:
+        IngestionJob: The queued job.
+    """
+    job = IngestionJob(issue=issue, file_blob=issue.file_blob, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    _submit(job.id)
+    return job
+
+
+def retry_job(job: IngestionJob) -> bool:
+    """
+    Requeues a failed or stale job. If the spooled file is gone (for example the
+    job was created by another instance), it is downloaded again from the bucket.
+
+    Args:
+        job (IngestionJob): The job to retry.
+
+    Returns:
+        bool: True if the job was requeued, False if it is not retryable.
+    """
+    if not is_retryable(job):
+        return False
+
+    path = spool_path(job.file_blob)
+    if not os.path.exists(path):
+        get_storage().download(job.file_blob, path)
+
+    job.status = 'queued'
+    job.error = None
+    db.session.commit()
+    _submit(job.id)
+    return True
+
+
+def is_retryable(job: IngestionJob) -> bool:
+    """
+    A job can be retried when it failed, or when it has been queued or running
+    for longer than `INGEST_STALE_AFTER_SEC` (its worker most likely died).
+    """
+    if job.status == 'failed':
+        return True
+    if job.status in ('queued', 'running') and job.updated_at:
+        stale_after = datetime.timedelta(seconds=current_app.config.get('INGEST_STALE_AFTER_SEC', 1800))
+        return datetime.datetime.utcnow() - job.updated_at > stale_after
+    return False
+
+
+def _submit(job_id: int) -> None:
+    _, job_threads = _get_executors()
+    job_threads.submit(_run_job, current_app._get_current_object(), job_id)
+
+
+def _run_job(app, job_id: int) -> None:
+    """
+    Runs one job: marks it running, extracts the text, renders the previews and,
+    with `PDF_OPTIMIZE`, optimizes the file in the process pool, and writes the
+    results to the issue. Executed on an ingestion thread. A failure to render
+    previews or to optimize is logged but does not fail the job.
+    """
+    from .utils import update_cache
+    from .search import get_search_backend
+    from .previews import render_pdf_previews, set_issue_previews, preview_renderer_options
+    from .optimize import optimize_pdf, pdf_optimizer_options, is_optimized, store_optimized_pdf
+
+    with app.app_context():
+        job = db.session.get(IngestionJob, job_id)
+        if job is None:
+            return
+        job.status = 'running'
+        job.attempts += 1
+        db.session.commit()
+
+        path = spool_path(job.file_blob)
+        optimized_path = path + '.optimized'
+        try:
+            process_pool, _ = _get_executors()
+            extraction = process_pool.submit(extract_pdf_pages, path)
+            rendering = None
+            if app.config.get('PREVIEWS_ENABLED', True):
+                rendering = process_pool.submit(render_pdf_previews, path, **preview_renderer_options())
+            optimization = None
+            # A retried job finds the optimized file in the bucket; its original is already archived
+            if app.config.get('PDF_OPTIMIZE', False) and not is_optimized(job.issue_id, job.file_blob):
+                optimization = process_pool.submit(optimize_pdf, path, optimized_path, **pdf_optimizer_options())
+            pages = extraction.result()
+
+            issue = job.issue
+            if issue.file_blob != job.file_blob:
+                # The file was replaced while this job waited; a newer job owns the content
+                job.status = 'done'
+                db.session.commit()
+            else:
+                set_issue_pages(issue, pages)
+                if rendering is not None:
+                    try:
+                        set_issue_previews(issue, rendering.result())
+                    except Exception as e:
+                        app.logger.warning(f'Previews of issue {issue.id} failed: {e}')
+                if optimization is not None:
+                    try:
+                        store_optimized_pdf(issue, path, optimized_path, optimization.result())
+                    except Exception as e:
+                        app.logger.warning(f'Optimizing the file of issue {issue.id} failed: {e}')
+                job.status = 'done'
+                db.session.commit()
+                update_cache(issue)
+                get_search_backend().index_issue(issue)
+            os.remove(path)
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(IngestionJob, job_id)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)
+                db.session.commit()
+            app.logger.error(f'Ingestion job {job_id} failed: {e}')
+        finally:
+            if os.path.exists(optimized_path):
+                os.remove(optimized_path)
+            db.session.remove()
+
+
+def backfill_pages(workers: int = None, log=print) -> int:
+    """
+    Extracts per-page text for PDF issues that have no page rows yet, e.g.
+    issues ingested before pages were stored. Files are downloaded from the
+    bucket and extracted across a process pool, a few per worker ahead, so
+    disk use stays bounded; each issue is committed on its own as soon as its
+    extraction finishes.
+
+    Args:
+        workers (int): Extraction processes; defaults to the CPU count.
+        log (callable): Receives progress lines.
+
+    Returns:
+        int: The number of issues backfilled.
+    """
+    from .search import get_search_backend
+
+    issue_ids = [issue_id for (issue_id,) in db.session.query(NewspaperIssue.id).filter(
+        NewspaperIssue.file_blob.like('%.pdf'),
+        ~NewspaperIssue.pages.any()
+    )]
+    storage = get_storage()
+    workers = workers or os.cpu_count() or 1
+    remaining = iter(issue_ids)
+
+    done = 0
+    pending = {}  # extraction future -> (issue_id, local path)
+    with ProcessPoolExecutor(max_workers=workers) as process_pool:
+        while True:
+            # Keep every worker busy, with one more file waiting each
+            while len(pending) < workers * 2:
+                issue_id = next(remaining, None)
+                if issue_id is None:
+                    break
+                file_blob = db.session.get(NewspaperIssue, issue_id).file_blob
+                path = spool_path(file_blob)
+                try:
+                    storage.download(file_blob, path)
+                except Exception as e:
+                    log(f'Issue {issue_id} failed: {e}')
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                pending[process_pool.submit(extract_pdf_pages, path)] = (issue_id, path)
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                issue_id, path = pending.pop(future)
+                try:
+                    issue = db.session.get(NewspaperIssue, issue_id)
+                    set_issue_pages(issue, future.result())
+                    db.session.commit()
+                    get_search_backend().index_issue(issue)
+                    done += 1
+                except Exception as e:
+                    db.session.rollback()
+                    log(f'Issue {issue_id} failed: {e}')
+                finally:
+                    if os.path.exists(path):
+                        os.remove(path)
+                log(f'{done}/{len(issue_ids)} issues backfilled')
+    return done
@@ -0,0 +1,410 @@
+import os
+import re
+import json
+import math
+import mmap
+import fcntl
+import heapq
+import bisect
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+TOKEN_RE = re.compile(r'\w+')
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+ParsedQuery = namedtuple('ParsedQuery', ['terms', 'prefixes', 'phrases', 'excluded'])
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into lower-cased word tokens.
+
+    Args:
+        text (str): Any text.
+
+    Returns:
+        list[str]: The tokens, in text order.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query: str) -> ParsedQuery:
+    """
+    Parses a search query. Supported syntax: plain terms, `prefix*`,
+    `"quoted phrases"` and `-excluded` terms.
+
+    Args:
+        query (str): The query.
+
+    Returns:
+        ParsedQuery: The terms, prefixes, phrases (as strings) and excluded terms.
+    """
+    terms, prefixes, phrases, excluded = [], [], [], []
+    for phrase, word in QUERY_RE.findall(query.lower()):
+        if phrase:
+            if tokenize(phrase):
+                phrases.append(' '.join(phrase.split()))
+        elif word.startswith('-'):
+            excluded.extend(tokenize(word))
+        elif word.endswith('*') and tokenize(word):
+            prefixes.append(tokenize(word)[0])
+        else:
+            terms.extend(tokenize(word))
+    return ParsedQuery(terms, prefixes, phrases, excluded)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf, pos: int) -> tuple:
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_postings(postings: list) -> bytes:
+    """
+    Encodes a posting list as varints of (doc id gap, term frequency) pairs.
+
+    Args:
+        postings (list[tuple]): (doc_id, tf) pairs sorted by doc_id.
+
+    Returns:
+        bytes: The encoded list.
+    """
+    out = bytearray()
+    previous = 0
+    for doc_id, tf in postings:
+        _write_varint(out, doc_id - previous)
+        _write_varint(out, tf)
+        previous = doc_id
+    return bytes(out)
+
+
+def decode_postings(buf, offset: int, length: int):
+    """
+    Decodes a posting list written by `encode_postings`.
+
+    Yields:
+        tuple: (doc_id, tf) pairs in doc_id order.
+    """
+    pos, end, doc_id = offset, offset + length, 0
+    while pos < end:
+        gap, pos = _read_varint(buf, pos)
+        tf, pos = _read_varint(buf, pos)
+        doc_id += gap
+        yield doc_id, tf
+
+
+class InvertedIndex:
+    """
+    A compact on-disk inverted index with BM25 scoring.
+
+    The index lives in segment directories under `directory`; the file
+    `CURRENT` names the active one. A segment holds a memory-mapped postings
+    file (delta-encoded doc ids), a lexicon mapping each term to its postings,
+    the document lengths, and an append-only log of documents added or removed
+    since the segment was written. Once the log grows past `compact_after`
+    entries, everything is merged into a fresh segment.
+
+    Several processes may share one directory: writes are serialized with a
+    file lock and readers pick up new log entries and segments on their own.
+    """
+    CURRENT = 'CURRENT'
+    LOCK = 'index.lock'
+    LEXICON = 'lexicon.json'
+    DOCS = 'docs.json'
+    POSTINGS = 'postings.bin'
+    LOG = 'log.jsonl'
+
+    def __init__(self, directory: str, compact_after: int = 500, k1: float = 1.2, b: float = 0.75):
+        self.directory = directory
+        self.compact_after = compact_after
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._segment = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Reading
+
+    def _current_segment(self) -> str:
+        try:
+            with open(os.path.join(self.directory, self.CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load_segment(self, segment: str) -> None:
+        self._segment = segment
+        self._lexicon = {}
+        self._base_docs = {}
+        self._postings = b''
+        self._log_offset = 0
+        self._log_entries = 0
+        self._log_docs = {}
+        self._log_terms = defaultdict(dict)
+        self._removed = set()
+
+        if segment is not None:
+            path = os.path.join(self.directory, segment)
+            with open(os.path.join(path, self.LEXICON)) as f:
+                self._lexicon = json.load(f)
+            with open(os.path.join(path, self.DOCS)) as f:
+                self._base_docs = {int(doc_id): length for doc_id, length in json.load(f).items()}
+            with open(os.path.join(path, self.POSTINGS), 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._postings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._sorted_terms = sorted(self._lexicon)
+        self._refresh_stats()
+
+    def _replay_log(self) -> None:
+        if self._segment is None:
+            return
+        path = os.path.join(self.directory, self._segment, self.LOG)
+        applied = 0
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Entry still being written
+                    self._log_offset += len(line)
+                    self._apply(json.loads(line))
+                    applied += 1
+        except FileNotFoundError:
+            return
+        if applied:
+            self._refresh_stats()
+
+    def _apply(self, entry: dict) -> None:
+        doc_id = entry['id']
+        self._log_entries += 1
+        previous = self._log_docs.pop(doc_id, None)
+        if previous is not None:
+            for term in previous[1]:
+                self._log_terms[term].pop(doc_id, None)
+        self._removed.add(doc_id)
+        if entry['op'] == 'add':
+            self._log_docs[doc_id] = (entry['len'], entry['tf'])
+            for term, tf in entry['tf'].items():
+                self._log_terms[term][doc_id] = tf
+
+    def _refresh_stats(self) -> None:
+        lengths = [length for doc_id, length in self._base_docs.items() if doc_id not in self._removed]
+        lengths.extend(length for length, _ in self._log_docs.values())
+        self._doc_count = len(lengths)
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def refresh(self) -> None:
+        """
+        Picks up segments and log entries written by any process since the last call.
+        """
+        with self._lock:
+            segment = self._current_segment()
+            if segment != self._segment or not hasattr(self, '_lexicon'):
+                self._load_segment(segment)
+            self._replay_log()
+
+    def _term_postings(self, term: str):
+        entry = self._lexicon.get(term)
+        if entry is not None:
+            offset, length, _ = entry
+            for doc_id, tf in decode_postings(self._postings, offset, length):
+                if doc_id not in self._removed:
+                    yield doc_id, tf
+        yield from self._log_terms.get(term, {}).items()
+
+    def _doc_length(self, doc_id: int) -> int:
+        if doc_id in self._log_docs:
+            return self._log_docs[doc_id][0]
+        return self._base_docs.get(doc_id, 0)
+
+    def expand_prefix(self, prefix: str, limit: int = 64) -> list:
+        """
+        Lists indexed terms starting with `prefix`, at most `limit` of them.
+        """
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        expanded = []
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix) or len(expanded) >= limit:
+                break
+            expanded.append(term)
+        expanded.extend(term for term, docs in self._log_terms.items()
+                        if docs and term.startswith(prefix) and term not in self._lexicon)
+        return expanded[:limit]
+
+    def search(self, query: str, limit: int = 1000) -> list:
+        """
+        Ranks documents against a query with BM25.
+
+        Plain terms and prefix expansions are optional and add to the score;
+        every word of a quoted phrase is required (checking the words are
+        adjacent is left to the caller); excluded terms drop a document.
+
+        Args:
+            query (str): The query (see `parse_query`).
+            limit (int): The maximum number of hits returned; None returns all.
+
+        Returns:
+            list[tuple]: (doc_id, score) pairs, best first.
+        """
+        self.refresh()
+        with self._lock:
+            parsed = parse_query(query)
+            required = {term for phrase in parsed.phrases for term in tokenize(phrase)}
+            optional = set(parsed.terms)
+            for prefix in parsed.prefixes:
+                optional.update(self.expand_prefix(prefix))
+
+            scores = defaultdict(float)
+            required_hits = Counter()
+            for term in optional | required:
+                # Counted from the live postings: the segment's stored frequency
+                # still includes documents removed or re-indexed since
+                postings = list(self._term_postings(term))
+                df = len(postings)
+                if not df:
+                    if term in required:
+                        return []
+                    continue
+                idf = math.log(1 + (self._doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings:
+                    norm = 1 - self.b + self.b * self._doc_length(doc_id) / (self._avg_length or 1)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                    if term in required:
+                        required_hits[doc_id] += 1
+
+            if required:
+                scores = {doc_id: score for doc_id, score in scores.items() if required_hits[doc_id] == len(required)}
+            for term in parsed.excluded:
+                for doc_id, _ in self._term_postings(term):
+                    scores.pop(doc_id, None)
+
+            if limit is None:
+                return sorted(scores.items(), key=lambda hit: (hit[1], hit[0]), reverse=True)
+            return heapq.nlargest(limit, scores.items(), key=lambda hit: (hit[1], hit[0]))
+
+    # Writing
+
+    def _locked(self):
+        lock_file = open(os.path.join(self.directory, self.LOCK), 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _append(self, entry: dict) -> None:
+        lock_file = self._locked()
+        try:
+            segment = self._current_segment()
+            if segment is None:
+                segment = self._write_segment({}, {})
+            with open(os.path.join(self.directory, segment, self.LOG), 'ab') as f:
+                f.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+            self.refresh()
+            with self._lock:
+                if self._log_entries >= self.compact_after:
+                    self._compact()
+        finally:
+            lock_file.close()
+
+    def add_document(self, doc_id: int, text: str) -> None:
+        """
+        Adds a document, replacing any earlier version with the same id.
+        """
+        tokens = tokenize(text)
+        self._append({'op': 'add', 'id': doc_id, 'len': len(tokens), 'tf': Counter(tokens)})
+
+    def remove_document(self, doc_id: int) -> None:
+        """
+        Removes a document from the index.
+        """
+        self._append({'op': 'remove', 'id': doc_id})
+
+    def _write_segment(self, postings: dict, docs: dict) -> str:
+        """
+        Writes a new segment and makes it current. Must hold the file lock.
+        """
+        previous = self._current_segment()
+        number = int(previous.split('-')[1]) + 1 if previous else 1
+        segment = f'segment-{number:06d}'
+        path = os.path.join(self.directory, segment)
+        os.makedirs(path, exist_ok=True)
+
+        lexicon = {}
+        with open(os.path.join(path, self.POSTINGS), 'wb') as f:
+            offset = 0
+            for term in sorted(postings):
+                encoded = encode_postings(sorted(postings[term]))
+                f.write(encoded)
+                lexicon[term] = (offset, len(encoded), len(postings[term]))
+                offset += len(encoded)
+        with open(os.path.join(path, self.LEXICON), 'w') as f:
+            json.dump(lexicon, f, separators=(',', ':'))
+        with open(os.path.join(path, self.DOCS), 'w') as f:
+            json.dump(docs, f, separators=(',', ':'))
+        open(os.path.join(path, self.LOG), 'wb').close()
+
+        current_tmp = os.path.join(self.directory, self.CURRENT + '.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(segment)
+        os.replace(current_tmp, os.path.join(self.directory, self.CURRENT))
+
+        # Segments older than the previous one are no longer read by anyone
+        for name in os.listdir(self.directory):
+            if name.startswith('segment-') and name not in (segment, previous):
+                for filename in os.listdir(os.path.join(self.directory, name)):
+                    os.remove(os.path.join(self.directory, name, filename))
+                os.rmdir(os.path.join(self.directory, name))
+        return segment
+
+    def _compact(self) -> None:
+        """
+        Merges the current segment and its log into a new segment. Must hold the file lock.
+        """
+        postings = defaultdict(list)
+        for term, (offset, length, _) in self._lexicon.items():
+            for doc_id, tf in decode_postings(self._postings, offset, length):
+                if doc_id not in self._removed:
+                    postings[term].append((doc_id, tf))
+        for term, docs in self._log_terms.items():
+            postings[term].extend(docs.items())
+        docs = {doc_id: length for doc_id, length in self._base_docs.items() if doc_id not in self._removed}
+        docs.update({doc_id: length for doc_id, (length, _) in self._log_docs.items()})
+        self._write_segment({term: docs_tf for term, docs_tf in postings.items() if docs_tf}, docs)
+        self.refresh()
+
+    def rebuild(self, documents) -> int:
+        """
+        Replaces the whole index with the given documents.
+
+        Args:
+            documents (iterable): (doc_id, text) pairs.
+
+        Returns:
+            int: The number of documents indexed.
+        """
+        postings = defaultdict(list)
+        docs = {}
+        for doc_id, text in documents:
+            tokens = tokenize(text or '')
+            docs[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+
+        lock_file = self._locked()
+        try:
+            with self._lock:
+                self._write_segment(postings, docs)
+                self.refresh()
+        finally:
+            lock_file.close()
+        return len(docs)
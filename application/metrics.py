@@ -0,0 +1,295 @@
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_counters = Counter()
+_histograms = {}
+_lock = Lock()
+_engine_hooked = False
+
+HELP = {
+    'http_requests_total': 'Requests handled, by endpoint, method and status.',
+    'http_request_duration_seconds': 'Time to build a response, by endpoint and method.',
+    'db_queries_total': 'SQL statements sent to the database.',
+    'db_query_duration_seconds': 'Time spent in SQL statements.',
+    'cache_requests_total': 'Cache lookups, by key prefix and result.',
+    'cache_duration_seconds': 'Time spent in cache calls, by key prefix.',
+    'upstream_duration_seconds': 'Time spent in calls to external services (URL signing, proxy worker).',
+}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels: dict = None, value: float = 1) -> None:
+    """
+    Adds to a counter of this process.
+
+    Args:
+        name (str): The metric name, e.g. `db_queries_total`.
+        labels (dict): Label names and values.
+        value (float): The amount to add.
+    """
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, seconds: float, labels: dict = None) -> None:
+    """
+    Records a duration in a histogram of this process.
+
+    Args:
+        name (str): The metric name, e.g. `http_request_duration_seconds`.
+        seconds (float): The duration.
+        labels (dict): Label names and values.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+def _add_timing(name: str, seconds: float) -> None:
+    # Per-request totals for the Server-Timing header
+    if has_request_context():
+        timings = g.setdefault('server_timings', defaultdict(lambda: [0, 0.0]))
+        timings[name][0] += 1
+        timings[name][1] += seconds
+
+
+@contextmanager
+def timed(service: str):
+    """
+    Times a call to an external service, e.g. `with timed('worker'): ...`. The
+    duration goes to `upstream_duration_seconds` and to the Server-Timing
+    header of the current request.
+
+    Args:
+        service (str): The service name, used as label and Server-Timing metric.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('upstream_duration_seconds', elapsed, {'service': service})
+        _add_timing(service, elapsed)
+
+
+def key_prefix(key: str) -> str:
+    """
+    Returns the label of a cache key: the cached function for `tag_cached`
+    entries (`tagged:<module>.<function>:...`), otherwise the part before the
+    first colon (`tag`, `file_link`, `search`, ...).
+    """
+    head, _, rest = key.partition(':')
+    if head == 'tagged':
+        return rest.split(':', 1)[0].rsplit('.', 1)[-1]
+    return head
+
+
+class MeteredCache:
+    """
+    Wraps a flask_caching backend and counts its lookups per key prefix, hits
+    and misses, plus the time spent in every call. Everything else is passed
+    to the wrapped backend unchanged.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _time(self, prefix: str, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        observe('cache_duration_seconds', elapsed, {'prefix': prefix})
+        _add_timing('cache', elapsed)
+
+    def get(self, key: str):
+        start = time.perf_counter()
+        value = self.backend.get(key)
+        prefix = key_prefix(key)
+        self._time(prefix, start)
+        inc('cache_requests_total', {'prefix': prefix, 'result': 'miss' if value is None else 'hit'})
+        return value
+
+    def get_many(self, *keys) -> list:
+        start = time.perf_counter()
+        values = self.backend.get_many(*keys)
+        prefix = key_prefix(keys[0]) if keys else 'none'
+        self._time(prefix, start)
+        for key, value in zip(keys, values):
+            inc('cache_requests_total', {'prefix': key_prefix(key), 'result': 'miss' if value is None else 'hit'})
+        return values
+
+    def set(self, key: str, value, timeout: int = None):
+        start = time.perf_counter()
+        result = self.backend.set(key, value, timeout=timeout)
+        self._time(key_prefix(key), start)
+        return result
+
+    def set_many(self, mapping: dict, timeout: int = None):
+        start = time.perf_counter()
+        result = self.backend.set_many(mapping, timeout=timeout)
+        self._time(key_prefix(next(iter(mapping), 'none')), start)
+        return result
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, which is dropped with it, so a
+    # statement that raises leaves nothing behind to skew the next timing
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    inc('db_queries_total')
+    observe('db_query_duration_seconds', elapsed)
+    _add_timing('db', elapsed)
+
+
+def _endpoint() -> str:
+    return request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+
+
+def _finish_request(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = _endpoint()
+    observe('http_request_duration_seconds', elapsed, {'endpoint': endpoint, 'method': request.method})
+    inc('http_requests_total', {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+
+    if current_app.config.get('SERVER_TIMING_HEADER', True):
+        response.headers['Server-Timing'] = server_timing(elapsed)
+    return response
+
+
+def server_timing(total: float) -> str:
+    """
+    Returns the Server-Timing header of the current request: the time spent in
+    the database, the cache and each external service, and the total.
+
+    Args:
+        total (float): The duration of the request in seconds.
+
+    Returns:
+        str: The header value, e.g. `db;dur=4.1;desc="3 queries", total;dur=9.8`.
+    """
+    parts = []
+    for name, (count, seconds) in g.get('server_timings', {}).items():
+        noun = ('query' if count == 1 else 'queries') if name == 'db' else ('call' if count == 1 else 'calls')
+        parts.append(f'{name};dur={seconds * 1000:.2f};desc="{count} {noun}"')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def init_app(app) -> None:
+    """
+    Starts collecting metrics for an app: request latency per endpoint, SQL
+    statements, and cache lookups (the app's cache backend is wrapped in
+    `MeteredCache`). With `SERVER_TIMING_HEADER` set, every response carries a
+    `Server-Timing` header.
+
+    Args:
+        app (Flask): The app, after `cache.init_app`.
+    """
+    global _engine_hooked
+    with _lock:
+        if not _engine_hooked:
+            # On the Engine class, so statements from every engine and thread are counted
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _engine_hooked = True
+
+    backends = app.extensions.get('cache', {})
+    for cache_instance, backend in list(backends.items()):
+        if not isinstance(backend, MeteredCache):
+            backends[cache_instance] = MeteredCache(backend)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _sanitize(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def render_prometheus(gauges: dict = None) -> str:
+    """
+    Returns the metrics of this process in the Prometheus text format. With
+    several worker processes, each has its own metrics; scrape them per
+    process or aggregate at the scraper.
+
+    Args:
+        gauges (dict): Extra values to export, as `{metric name: number}`.
+
+    Returns:
+        str: The exposition text.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in _histograms.items()}
+
+    lines = []
+    for metric in sorted({name for name, _ in counters}):
+        lines.append(f'# HELP {metric} {HELP.get(metric, metric)}')
+        lines.append(f'# TYPE {metric} counter')
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'{name}{_format_labels(labels)} {value:g}')
+
+    for metric in sorted({name for name, _ in histograms}):
+        lines.append(f'# HELP {metric} {HELP.get(metric, metric)}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_format_labels(labels, (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    for name, value in sorted((gauges or {}).items()):
+        name = _sanitize(name)
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value:g}')
+    return '\n'.join(lines) + '\n'
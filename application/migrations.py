@@ -0,0 +1,111 @@
+import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, NewspaperIssue, SchemaMigration
+
+# (version, description, function applying it to a connection), in order
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    """
+    Registers a schema migration. Migrations run once per database, in version
+    order, and must be idempotent: `db.create_all` already builds new databases
+    with the current schema, and two processes may start a migration at once.
+
+    Args:
+        version (int): The version the migration brings the schema to.
+        description (str): What it changes, recorded in `schema_migration`.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(apply):
+        MIGRATIONS.append((version, description, apply))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return apply
+    return decorator
+
+
+def _index_names(connection, table: str) -> set:
+    return {index['name'] for index in inspect(connection).get_indexes(table)}
+
+
+@migration(1, 'Full-text indexes on issue content and page text (MySQL)')
+def _fulltext_indexes(connection) -> None:
+    # Startup used to issue these ALTERs as raw strings under a bare `except`.
+    # SQLAlchemy 2 rejects raw strings, so databases created before this
+    # migration never got either index, and MySQL page hits failed; this adds them.
+    if connection.dialect.name != 'mysql':
+        return
+    if 'idx_fulltext_content' not in _index_names(connection, 'newspaper_issue'):
+        connection.execute(text('ALTER TABLE newspaper_issue ADD FULLTEXT INDEX idx_fulltext_content (content)'))
+    if 'idx_fulltext_page_text' not in _index_names(connection, 'issue_page'):
+        connection.execute(text('ALTER TABLE issue_page ADD FULLTEXT INDEX idx_fulltext_page_text (text)'))
+
+
+@migration(2, 'Composite indexes on newspaper_issue for date listings')
+def _issue_date_indexes(connection) -> None:
+    existing = _index_names(connection, 'newspaper_issue')
+    for index in NewspaperIssue.__table__.indexes:
+        if index.name in ('ix_issue_issued_time_id', 'ix_issue_view_power_issued_time', 'ix_issue_category_issued_time') \
+                and index.name not in existing:
+            index.create(connection)
+
+
+@migration(3, 'Precomputed text columns on issue_page for the text endpoints')
+def _page_text_columns(connection) -> None:
+    existing = {column['name'] for column in inspect(connection).get_columns('issue_page')}
+    blob = 'MEDIUMBLOB' if connection.dialect.name == 'mysql' else 'BLOB'
+    for name, column_type in (('text_offset', 'BIGINT'), ('text_bytes', 'INTEGER'), ('text_etag', 'VARCHAR(40)'),
+                              ('text_gzip', blob), ('text_brotli', blob)):
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE issue_page ADD COLUMN {name} {column_type}'))
+
+
+def applied_versions() -> set:
+    """
+    Returns the versions of the migrations applied to the database.
+    """
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def pending_migrations() -> list:
+    """
+    Returns the registered migrations not yet applied, in order.
+
+    Returns:
+        list[tuple]: (version, description, function) of each.
+    """
+    applied = applied_versions()
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+
+def upgrade(log=None) -> int:
+    """
+    Applies the pending migrations in version order, each in its own transaction
+    together with its `schema_migration` row. The tables must exist (`db.create_all`).
+
+    Args:
+        log (callable): Receives a line per applied migration.
+
+    Returns:
+        int: The number of migrations applied by this call.
+    """
+    done = 0
+    for version, description, apply in pending_migrations():
+        try:
+            with db.engine.begin() as connection:
+                apply(connection)
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    version=version, description=description, applied_at=datetime.datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another process recorded this version first
+            continue
+        done += 1
+        if log is not None:
+            log(f'Applied migration {version}: {description}')
+    return done
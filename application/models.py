@@ -1,9 +1,17 @@
 from . import login_manager, db
-from sqlalchemy.dialects.mysql import LONGTEXT
+from flask import current_app
+from sqlalchemy.dialects.mysql import LONGTEXT, MEDIUMBLOB
+from sqlalchemy.orm import deferred
+from .caching import tag_cached, shared_cache_enabled
+import datetime
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Roles and view powers must be revoked in every worker at once, so the
+    # session user is only cached when invalidations are shared (TieredCache)
+    if current_app.config.get('SESSION_USER_CACHE_SEC') and shared_cache_enabled():
+        return get_session_user(int(user_id))
+    return db.session.get(User, int(user_id))
 
 from flask_login import UserMixin
 
@@ -18,11 +26,33 @@ class User(db.Model, UserMixin):
     def is_admin(self):
         return self.role == 'admin'
 
+@tag_cached(tags=lambda user_id: [f'user:{user_id}'],
+            timeout=lambda: current_app.config.get('SESSION_USER_CACHE_SEC', 10))
+def get_session_user(user_id: int):
+    """
+    Loads the user of a session from the cache, for deployments using the
+    shared `TieredCache` (see `load_user`). Changes to a user invalidate the
+    `user:<id>` tag in every process; entries also expire after
+    `SESSION_USER_CACHE_SEC` seconds. The cached copy is detached and carries
+    no password hash; it only serves as `current_user`.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        User: A detached copy of the user, or None if it does not exist.
+    """
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return User(id=user.id, username=user.username, role=user.role, view_power=user.view_power)
+
 class NewspaperIssue(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(255))
     author = db.Column(db.String(255))
-    content = db.Column(LONGTEXT) #ALTER TABLE newspaper_issue ADD FULLTEXT INDEX idx_fulltext_content (content);
+    # Deferred: listings never need the full text, so it is only loaded when accessed
+    content = deferred(db.Column(db.Text().with_variant(LONGTEXT, 'mysql'))) #ALTER TABLE newspaper_issue ADD FULLTEXT INDEX idx_fulltext_content (content);
     issued_time = db.Column(db.Date)
     file_blob = db.Column(db.String(255))
     view_power = db.Column(db.Integer, nullable=False, default=1) # viewed by equal or greater power
@@ -31,6 +61,26 @@ class NewspaperIssue(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False,)
     category = db.relationship('Category', back_populates='issues')
 
+    # Extracted text of each page, filled at ingest
+    pages = db.relationship('IssuePage', back_populates='issue', cascade='all, delete-orphan',
+                            order_by='IssuePage.page_no', lazy='dynamic')
+
+    # Background text extraction jobs for this issue's file
+    ingestion_jobs = db.relationship('IngestionJob', back_populates='issue', cascade='all, delete-orphan')
+
+    # Thumbnail and page preview images, rendered at ingest
+    previews = db.relationship('IssuePreview', back_populates='issue', cascade='all, delete-orphan', lazy='dynamic')
+
+    # Size saved by the PDF optimization stage, if the current file went through it
+    optimized_file = db.relationship('OptimizedFile', back_populates='issue', cascade='all, delete-orphan', uselist=False)
+
+    # Created on existing databases by application/migrations.py
+    __table_args__ = (
+        db.Index('ix_issue_issued_time_id', 'issued_time', 'id'), # date listings, keyset pagination
+        db.Index('ix_issue_view_power_issued_time', 'view_power', 'issued_time'),
+        db.Index('ix_issue_category_issued_time', 'category_id', 'issued_time'),
+    )
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(255), nullable=False, unique=True)
@@ -49,6 +99,77 @@ class Category(db.Model):
             db.session.commit()
         return default_category
 
+class IssueCount(db.Model):
+    # Number of issues per issued day and view_power, maintained by application/rollup.py
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    view_power = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class IssuePage(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('newspaper_issue.id'), nullable=False, index=True)
+    page_no = db.Column(db.Integer, nullable=False) # 1-based, as shown by PDF viewers
+    text = db.Column(db.Text().with_variant(LONGTEXT, 'mysql')) #ALTER TABLE issue_page ADD FULLTEXT INDEX idx_fulltext_page_text (text);
+
+    # Precomputed at ingest for the text endpoints (application/text_pages.py)
+    text_offset = db.Column(db.BigInteger) # bytes before this page in the whole document
+    text_bytes = db.Column(db.Integer) # UTF-8 size of `text`
+    text_etag = db.Column(db.String(40)) # SHA-1 of `text`
+    text_gzip = deferred(db.Column(db.LargeBinary().with_variant(MEDIUMBLOB, 'mysql')))
+    text_brotli = deferred(db.Column(db.LargeBinary().with_variant(MEDIUMBLOB, 'mysql'))) # only with TEXT_BROTLI
+
+    issue = db.relationship('NewspaperIssue', back_populates='pages')
+
+    __table_args__ = (db.UniqueConstraint('issue_id', 'page_no', name='uq_issue_page'),)
+
+class IssuePreview(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('newspaper_issue.id'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False) # 'thumb' (first page, small) or 'page'
+    page_no = db.Column(db.Integer, nullable=False) # 1-based
+    blob = db.Column(db.String(255), nullable=False) # content-addressed JPEG in the storage backend
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+
+    issue = db.relationship('NewspaperIssue', back_populates='previews')
+
+    __table_args__ = (db.UniqueConstraint('issue_id', 'kind', 'page_no', name='uq_issue_preview'),)
+
+class OptimizedFile(db.Model):
+    issue_id = db.Column(db.Integer, db.ForeignKey('newspaper_issue.id'), primary_key=True, autoincrement=False)
+    file_blob = db.Column(db.String(255), nullable=False) # the served blob, replaced by the optimized file
+    original_blob = db.Column(db.String(255), nullable=False) # archival copy of the uploaded file
+    original_bytes = db.Column(db.BigInteger, nullable=False)
+    optimized_bytes = db.Column(db.BigInteger, nullable=False)
+    images_recompressed = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    issue = db.relationship('NewspaperIssue', back_populates='optimized_file')
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - self.optimized_bytes
+
+class IngestionJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('newspaper_issue.id'), nullable=False)
+    file_blob = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'running', 'done' or 'failed'
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    issue = db.relationship('NewspaperIssue', back_populates='ingestion_jobs')
+
+class SchemaMigration(db.Model):
+    # Migrations of application/migrations.py applied to this database
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
 class Config(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     stopwords = db.Column(db.Text, nullable=False, default='')
@@ -0,0 +1,136 @@
+import io
+
+from flask import current_app
+
+from .models import db, OptimizedFile
+from .storage import get_storage
+
+
+def _recompress_image(raw, quality: int, max_side: int) -> bool:
+    """
+    Re-encodes one 8-bit RGB or grayscale image XObject as JPEG, downscaled to
+    `max_side` pixels. Images with masks, decode arrays, other color spaces or
+    filters PIL cannot read are left alone, as are images that would not shrink.
+
+    Returns:
+        bool: True if the image was replaced.
+    """
+    from pikepdf import Name, PdfImage
+
+    if any(key in raw for key in ('/SMask', '/Mask', '/Decode', '/ImageMask')):
+        return False
+    if raw.get('/BitsPerComponent') != 8 or raw.get('/ColorSpace') not in (Name.DeviceRGB, Name.DeviceGray):
+        return False
+    try:
+        image = PdfImage(raw).as_pil_image()
+    except Exception:
+        return False
+
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.convert('L' if raw.ColorSpace == Name.DeviceGray else 'RGB').save(buffer, 'JPEG', quality=quality, optimize=True)
+    data = buffer.getvalue()
+    if not resized and len(data) >= len(raw.read_raw_bytes()):
+        return False
+
+    raw.write(data, filter=Name.DCTDecode)
+    raw.Width, raw.Height = image.size
+    if '/DecodeParms' in raw:
+        del raw['/DecodeParms']
+    return True
+
+
+def optimize_pdf(source: str, target: str, image_quality: int = 75, max_image_side: int = 2400) -> dict:
+    """
+    Writes a web-optimized copy of a PDF: images are recompressed, unreferenced
+    resources dropped, streams recompressed into object streams, and the file
+    is linearized so viewers can show the first page before the rest arrives.
+
+    This runs inside a worker process of the ingestion pool, so it must not
+    touch the database or the Flask application.
+
+    Args:
+        source (str): The local path of the PDF.
+        target (str): Where to write the optimized PDF.
+        image_quality (int): JPEG quality of recompressed images.
+        max_image_side (int): Longest side of images, in pixels.
+
+    Returns:
+        dict: `original_bytes`, `optimized_bytes`, `images_recompressed` and
+        `was_linearized` (whether the source already was).
+    """
+    import os
+    import pikepdf
+
+    recompressed = 0
+    with pikepdf.open(source) as pdf:
+        was_linearized = pdf.is_linearized
+        for page in pdf.pages:
+            for raw in page.images.values():
+                recompressed += _recompress_image(raw, image_quality, max_image_side)
+        pdf.remove_unreferenced_resources()
+        pdf.save(target, linearize=True, compress_streams=True, recompress_flate=True,
+                 object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+    return {
+        'original_bytes': os.path.getsize(source),
+        'optimized_bytes': os.path.getsize(target),
+        'images_recompressed': recompressed,
+        'was_linearized': was_linearized,
+    }
+
+
+def pdf_optimizer_options() -> dict:
+    """
+    Returns the keyword arguments of `optimize_pdf` from the configuration.
+    """
+    return {
+        'image_quality': current_app.config.get('PDF_OPTIMIZE_IMAGE_QUALITY', 75),
+        'max_image_side': current_app.config.get('PDF_OPTIMIZE_MAX_IMAGE_SIDE', 2400),
+    }
+
+
+def is_optimized(issue_id: int, file_blob: str) -> bool:
+    """
+    Returns whether the current file of an issue was already optimized, so a
+    retried job does not overwrite the archival copy with the optimized file.
+    """
+    return db.session.query(OptimizedFile.issue_id).filter_by(issue_id=issue_id, file_blob=file_blob).first() is not None
+
+
+def store_optimized_pdf(issue, original_path: str, optimized_path: str, result: dict) -> bool:
+    """
+    Keeps the uploaded file as an archival copy (`original-<file_blob>`) and
+    serves the optimized one under the issue's `file_blob`. The optimized file
+    is not used if it is larger and the original was already linearized.
+    The caller commits.
+
+    Args:
+        issue (NewspaperIssue): The issue whose current file was optimized.
+        original_path (str): The local copy of the uploaded file.
+        optimized_path (str): The output of `optimize_pdf`.
+        result (dict): The statistics returned by `optimize_pdf`.
+
+    Returns:
+        bool: True if the optimized file replaced the served one.
+    """
+    if result['optimized_bytes'] >= result['original_bytes'] and result['was_linearized']:
+        return False
+
+    storage = get_storage()
+    original_blob = f'original-{issue.file_blob}'
+    storage.put(original_blob, original_path, 'application/pdf')
+    storage.put(issue.file_blob, optimized_path, 'application/pdf')
+
+    record = db.session.get(OptimizedFile, issue.id)
+    if record is None:
+        record = OptimizedFile(issue_id=issue.id)
+        db.session.add(record)
+    record.file_blob = issue.file_blob
+    record.original_blob = original_blob
+    record.original_bytes = result['original_bytes']
+    record.optimized_bytes = result['optimized_bytes']
+    record.images_recompressed = result['images_recompressed']
+    return True
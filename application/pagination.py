@@ -0,0 +1,171 @@
+import json
+import math
+import base64
+import datetime
+
+from sqlalchemy import and_, or_
+
+from .models import NewspaperIssue
+
+
+def encode_cursor(issued_time: datetime.date, issue_id: int) -> str:
+    """
+    Encodes the sort key of an issue in a listing ordered newest first as an
+    opaque cursor for URLs.
+
+    Args:
+        issued_time (datetime.date): The issue's date.
+        issue_id (int): The issue's id, breaking ties between issues of one day.
+
+    Returns:
+        str: The cursor.
+    """
+    payload = json.dumps([issued_time.isoformat(), issue_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decodes a cursor made by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor, or None.
+
+    Returns:
+        tuple: (issued_time, issue_id), or None if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        issued_time, issue_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.date.fromisoformat(issued_time), int(issue_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class ResultPage:
+    """
+    A page of a listing with First/Previous/Next/Last navigation. The `*_args`
+    attributes are the query arguments of the links, or None when the link is
+    disabled. Instances only hold plain values, so they can be cached.
+    """
+
+    def __init__(self, items: list, page: int, per_page: int, total: int,
+                 prev_args: dict = None, next_args: dict = None, last_args: dict = None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.prev_args = prev_args
+        self.next_args = next_args
+        self.last_args = last_args
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_args is not None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_args is not None
+
+    def with_items(self, items: list) -> 'ResultPage':
+        """
+        Returns a copy of this page holding other items, e.g. the full rows of
+        the ids it was computed with.
+        """
+        return ResultPage(items, self.page, self.per_page, self.total, self.prev_args, self.next_args, self.last_args)
+
+
+def seek_page(query, per_page: int, total: int, page: int = 1, after: str = None, before: str = None,
+              last: bool = False) -> ResultPage:
+    """
+    Reads one page of issues ordered newest first with keyset pagination: the
+    page starts right after (or ends right before) the `(issued_time, id)` of a
+    cursor, so the database seeks in the index instead of reading and discarding
+    the rows of every earlier page.
+
+    Arbitrary page numbers cannot be reached this way, only the first, previous,
+    next and last pages. `page` is carried along for display only. Pages keep
+    the boundaries of forward navigation from the first page: every page but
+    the last holds `per_page` items, so Previous from the last page lands on
+    the pages Next produced.
+
+    Args:
+        query (Query): A query selecting `NewspaperIssue.id` and `issued_time`,
+            with its filters applied. Rows without an `issued_time` are skipped.
+        per_page (int): Items per page.
+        total (int): The number of matching rows, for the page count.
+        page (int): The number of the page, as claimed by the link followed.
+        after (str): Cursor of the last item of the previous page.
+        before (str): Cursor of the first item of the next page.
+        last (bool): Whether to read the last page.
+
+    Returns:
+        ResultPage: The page; its items are the selected rows.
+    """
+    issued_time, issue_id = NewspaperIssue.issued_time, NewspaperIssue.id
+    query = query.filter(issued_time.isnot(None)).order_by(None)
+    after, before = decode_cursor(after), decode_cursor(before)
+    pages = max(1, math.ceil(total / per_page))
+
+    if before or last:
+        # Walk backwards from the cursor (or the oldest issue) and flip the rows.
+        # The last page holds what remains after the full pages before it.
+        size = per_page if before or total <= 0 else total - (pages - 1) * per_page
+        if before:
+            query = query.filter(or_(issued_time > before[0], and_(issued_time == before[0], issue_id > before[1])))
+        rows = query.order_by(issued_time.asc(), issue_id.asc()).limit(size + 1).all()
+        has_prev, has_next = len(rows) > size, before is not None
+        rows = rows[:size][::-1]
+    else:
+        if after:
+            query = query.filter(or_(issued_time < after[0], and_(issued_time == after[0], issue_id < after[1])))
+        rows = query.order_by(issued_time.desc(), issue_id.desc()).limit(per_page + 1).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+
+    if not has_prev:
+        page = 1
+    elif not has_next:
+        page = pages
+    else:
+        page = min(max(page, 2), pages - 1)
+
+    result = ResultPage(rows, page, per_page, total)
+    if has_prev and rows:
+        result.prev_args = {'before': encode_cursor(rows[0].issued_time, rows[0].id), 'page': page - 1}
+    if has_next and rows:
+        result.next_args = {'after': encode_cursor(rows[-1].issued_time, rows[-1].id), 'page': page + 1}
+        result.last_args = {'last': 1, 'page': pages}
+    return result
+
+
+def offset_page(query, per_page: int, total: int, page: int = 1) -> ResultPage:
+    """
+    Reads one page of an ordered query by page number. Used for listings that
+    are not ordered by date, such as relevance-ranked search results, whose
+    candidates are already bounded (see `SEARCH_MAX_HITS`).
+
+    Args:
+        query (Query): The ordered query.
+        per_page (int): Items per page.
+        total (int): The number of matching rows.
+        page (int): The page number, 1-based.
+
+    Returns:
+        ResultPage: The page; its items are the selected rows.
+    """
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(page, 1), pages)
+    rows = query.limit(per_page).offset((page - 1) * per_page).all()
+    result = ResultPage(rows, page, per_page, total)
+    if page > 1:
+        result.prev_args = {'page': page - 1}
+    if page < pages:
+        result.next_args = {'page': page + 1}
+        result.last_args = {'page': pages}
+    return result
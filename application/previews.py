@@ -0,0 +1,319 @@
+import io
+import os
+import time
+import hashlib
+import datetime
+from threading import Lock, get_ident
+
+from flask import current_app, url_for
+
+from .models import db, IssuePreview, NewspaperIssue
+from .caching import tag_cached
+from .proxy_tokens import mint_token
+from .storage import get_storage
+
+_caches = {}
+_caches_lock = Lock()
+
+
+def render_pdf_previews(path: str, thumb_width: int = 160, page_width: int = 800, quality: int = 70) -> list:
+    """
+    Renders a first-page thumbnail and a preview image of every page of a PDF.
+
+    This runs inside a worker process of the ingestion pool, so it must not
+    touch the database or the Flask application.
+
+    Args:
+        path (str): The local path of the PDF file.
+        thumb_width (int): Width of the thumbnail in pixels.
+        page_width (int): Width of the page previews in pixels.
+        quality (int): JPEG quality of the images.
+
+    Returns:
+        list[tuple]: (kind, page_no, JPEG bytes, width, height) per image, where
+        kind is 'thumb' or 'page'.
+    """
+    import pdfplumber
+
+    def encode(image):
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    previews = []
+    with pdfplumber.open(path) as pdf:
+        for page_no, page in enumerate(pdf.pages, start=1):
+            image = page.to_image(width=page_width).original.convert('RGB')
+            previews.append(('page', page_no, encode(image), *image.size))
+            if page_no == 1:
+                image.thumbnail((thumb_width, thumb_width * 10))
+                previews.append(('thumb', 1, encode(image), *image.size))
+            page.flush_cache()  # Keep memory flat on long documents
+    return previews
+
+
+def preview_blob_name(data: bytes) -> str:
+    """
+    Returns the content-addressed blob name of a preview image, so identical
+    images are stored once and never change under a name.
+
+    Args:
+        data (bytes): The JPEG image.
+
+    Returns:
+        str: `preview-<sha256 prefix>.jpg`
+    """
+    return f'preview-{hashlib.sha256(data).hexdigest()[:32]}.jpg'
+
+
+def set_issue_previews(issue, previews: list, executor=None) -> None:
+    """
+    Uploads rendered previews to the storage backend and replaces the preview
+    rows of an issue. The caller commits.
+
+    Args:
+        issue (NewspaperIssue): The issue, persisted or pending.
+        previews (list[tuple]): The output of `render_pdf_previews`.
+        executor (Executor): Uploads the images concurrently when given.
+    """
+    storage = get_storage()
+    uploads = []
+    for kind, page_no, data, width, height in previews:
+        blob_name = preview_blob_name(data)
+        if executor is None:
+            storage.put_bytes(blob_name, data, 'image/jpeg')
+        else:
+            uploads.append(executor.submit(storage.put_bytes, blob_name, data, 'image/jpeg'))
+    for upload in uploads:
+        upload.result()
+
+    if issue.id is not None:
+        IssuePreview.query.filter_by(issue_id=issue.id).delete()
+    for kind, page_no, data, width, height in previews:
+        db.session.add(IssuePreview(issue=issue, kind=kind, page_no=page_no,
+                                    blob=preview_blob_name(data), width=width, height=height))
+
+
+def preview_renderer_options() -> dict:
+    """
+    Returns the keyword arguments of `render_pdf_previews` from the configuration.
+    """
+    config = current_app.config
+    return {
+        'thumb_width': config.get('PREVIEW_THUMB_WIDTH', 160),
+        'page_width': config.get('PREVIEW_PAGE_WIDTH', 800),
+        'quality': config.get('PREVIEW_JPEG_QUALITY', 70),
+    }
+
+
+def preview_url(blob_name: str) -> str:
+    """
+    Returns the URL of a preview image. Callers only build URLs for issues the
+    viewer may see; the signed token is the access check of `main.preview`.
+
+    The token expires at the end of the next day, so a preview keeps one URL for
+    a whole day and browsers can cache it.
+
+    Args:
+        blob_name (str): The preview blob.
+
+    Returns:
+        str: The URL.
+    """
+    expires_at = (int(time.time()) // 86400 + 2) * 86400
+    return url_for('main.preview', token=mint_token(blob_name, expires_at))
+
+
+def get_thumbnails(issue_ids: list) -> dict:
+    """
+    Returns the thumbnail URLs of issues in one query.
+
+    Args:
+        issue_ids (list[int]): The issues.
+
+    Returns:
+        dict: Issue id -> thumbnail URL, for issues that have a thumbnail.
+    """
+    if not issue_ids:
+        return {}
+    rows = db.session.query(IssuePreview.issue_id, IssuePreview.blob).filter(
+        IssuePreview.issue_id.in_(issue_ids),
+        IssuePreview.kind == 'thumb'
+    )
+    return {issue_id: preview_url(blob) for issue_id, blob in rows}
+
+
+@tag_cached(tags=lambda year, month, view_power: [f'month:{year:04d}-{month:02d}'])
+def get_month_cover_blobs(year: int, month: int, view_power: int) -> dict:
+    """
+    Returns the thumbnail of the first issue of each day of a month, among the
+    issues visible at a view power.
+
+    Args:
+        year (int): The year.
+        month (int): The month (1-12).
+        view_power (int): The viewer's view power.
+
+    Returns:
+        dict: Day of the month -> thumbnail blob.
+    """
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + month // 12, month % 12 + 1, 1)
+    rows = db.session.query(NewspaperIssue.issued_time, IssuePreview.blob).join(
+        IssuePreview, IssuePreview.issue_id == NewspaperIssue.id
+    ).filter(
+        IssuePreview.kind == 'thumb',
+        NewspaperIssue.issued_time >= start,
+        NewspaperIssue.issued_time < end,
+        NewspaperIssue.view_power <= view_power
+    ).order_by(NewspaperIssue.issued_time, NewspaperIssue.id)
+
+    covers = {}
+    for issued_time, blob in rows:
+        covers.setdefault(issued_time.day, blob)
+    return covers
+
+
+def get_page_previews(issue_id: int) -> list:
+    """
+    Returns the page preview images of an issue, in page order.
+
+    Args:
+        issue_id (int): The issue.
+
+    Returns:
+        list[dict]: `url`, `width` and `height` of each page preview.
+    """
+    rows = db.session.query(IssuePreview.blob, IssuePreview.width, IssuePreview.height).filter(
+        IssuePreview.issue_id == issue_id,
+        IssuePreview.kind == 'page'
+    ).order_by(IssuePreview.page_no)
+    return [{'url': preview_url(blob), 'width': width, 'height': height} for blob, width, height in rows]
+
+
+def backfill_previews(workers: int = None, log=print) -> int:
+    """
+    Renders previews for PDF issues that have none yet, e.g. issues ingested
+    before previews existed. Files are downloaded from the storage backend and
+    rendered across a process pool; each issue is committed on its own.
+
+    Args:
+        workers (int): Rendering processes; defaults to the CPU count.
+        log (callable): Receives progress lines.
+
+    Returns:
+        int: The number of issues backfilled.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from .ingest import spool_path
+
+    issue_ids = [issue_id for (issue_id,) in db.session.query(NewspaperIssue.id).filter(
+        NewspaperIssue.file_blob.like('%.pdf'),
+        ~NewspaperIssue.previews.any()
+    )]
+    storage = get_storage()
+    options = preview_renderer_options()
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as process_pool:
+        for issue_id in issue_ids:
+            issue = db.session.get(NewspaperIssue, issue_id)
+            path = spool_path(issue.file_blob)
+            try:
+                storage.download(issue.file_blob, path)
+                set_issue_previews(issue, process_pool.submit(render_pdf_previews, path, **options).result())
+                db.session.commit()
+                done += 1
+            except Exception as e:
+                db.session.rollback()
+                log(f'Issue {issue_id} failed: {e}')
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+            log(f'{done}/{len(issue_ids)} issues backfilled')
+    return done
+
+
+class PreviewCache:
+    """
+    A size-bounded on-disk cache of preview blobs, in front of the storage
+    backend. Files are evicted least recently used first. Reads refresh a
+    file's access time and leave its modification time, which the `ETag` and
+    `Last-Modified` of served files derive from, unchanged.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.size = None  # bytes on disk, counted on first insert
+        self.lock = Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, blob_name: str) -> str:
+        """
+        Returns the local path of a preview blob, downloading it on a miss.
+
+        Args:
+            blob_name (str): The preview blob.
+
+        Returns:
+            str: The path of the cached file.
+        """
+        path = os.path.join(self.directory, os.path.basename(blob_name))
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            return path
+        except FileNotFoundError:
+            pass
+
+        data = get_storage().get_range(blob_name)
+        part = f'{path}.{os.getpid()}.{get_ident()}.part'
+        with open(part, 'wb') as f:
+            f.write(data)
+        os.replace(part, path)
+        self._added(len(data))
+        return path
+
+    def _added(self, size: int) -> None:
+        with self.lock:
+            if self.size is None:
+                self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes share the directory, so recount from disk
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+def get_preview_cache() -> PreviewCache:
+    """
+    Returns the process-wide preview cache in `PREVIEW_CACHE_DIR`.
+
+    Returns:
+        PreviewCache: The cache.
+    """
+    directory = current_app.config['PREVIEW_CACHE_DIR']
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = PreviewCache(directory, current_app.config.get('PREVIEW_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+        return _caches[directory]
@@ -0,0 +1,139 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+from flask import current_app, url_for
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(payload: str, secret) -> str:
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return _b64encode(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def _secret():
+    # Without a worker secret, tokens are only read by this app's /file/<token>
+    return current_app.config.get('FILE_PROXY_SECRET') or current_app.config['SECRET_KEY']
+
+
+def mint_token(file_blob: str, expires_at: int, secret: str = None) -> str:
+    """
+    Creates a token granting read access to a blob until a point in time.
+
+    The token is `<payload>.<signature>`: the base64url JSON `{"b": blob, "e": expiry}`
+    and its base64url HMAC-SHA256 under the shared secret. Anyone holding the
+    secret (the proxy worker, `/file/<token>`) can check it without a lookup.
+
+    Args:
+        file_blob (str): The blob name.
+        expires_at (int): Expiry as a Unix timestamp.
+        secret (str): The shared secret; defaults to `FILE_PROXY_SECRET`, or
+            `SECRET_KEY` when no worker secret is configured.
+
+    Returns:
+        str: The token, safe to use in a URL path.
+    """
+    secret = secret or _secret()
+    payload = _b64encode(json.dumps({'b': file_blob, 'e': int(expires_at)}, separators=(',', ':')).encode())
+    return f'{payload}.{_signature(payload, secret)}'
+
+
+def read_token(token: str, secret: str = None, now: float = None) -> tuple:
+    """
+    Checks a token created by `mint_token` and returns its claims.
+
+    Args:
+        token (str): The token.
+        secret (str): The shared secret; defaults as in `mint_token`.
+        now (float): The current Unix time, for testing.
+
+    Returns:
+        tuple: The blob name and the expiry, or None if the token is malformed,
+        forged or expired.
+    """
+    secret = secret or _secret()
+    # Tokens come from URL paths; minted ones are plain ASCII
+    if not token.isascii():
+        return None
+    payload, _, signature = token.partition('.')
+    if not payload or not hmac.compare_digest(signature, _signature(payload, secret)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+        file_blob, expires_at = claims['b'], claims['e']
+    except (ValueError, KeyError, TypeError):
+        return None
+    # The same checks as the worker's verifyToken
+    if not isinstance(file_blob, str) or isinstance(expires_at, bool) or not isinstance(expires_at, (int, float)):
+        return None
+    if expires_at < (time.time() if now is None else now):
+        return None
+    return file_blob, expires_at
+
+
+def verify_token(token: str, secret: str = None, now: float = None) -> str:
+    """
+    Checks a token created by `mint_token`. This is the reference for the
+    verifier in `worker/file_proxy_worker.js`; `python -m benchmarks.proxy_tokens`
+    checks that both agree.
+
+    Args:
+        token (str): The token.
+        secret (str): The shared secret; defaults as in `mint_token`.
+        now (float): The current Unix time, for testing.
+
+    Returns:
+        str: The blob name, or None if the token is malformed, forged or expired.
+    """
+    claims = read_token(token, secret, now)
+    return claims[0] if claims else None
+
+
+def _link_expiry(expire_in_seconds: int) -> int:
+    # Rounded up to a multiple of the link cache margin, so repeated views within
+    # that window get the same URL and hit the browser's cache
+    window = max(1, current_app.config.get('FILE_LINK_CACHE_MARGIN_SEC', 60))
+    return -(-(int(time.time()) + expire_in_seconds) // window) * window
+
+
+def token_link(file_blob: str, expire_in_seconds: int) -> str:
+    """
+    Returns a worker link for a blob, computed locally with no network I/O.
+
+    Links stay valid for at least `expire_in_seconds`; repeated calls within
+    `FILE_LINK_CACHE_MARGIN_SEC` return the same link.
+
+    Args:
+        file_blob (str): The blob name.
+        expire_in_seconds (int): Minimum validity of the link.
+
+    Returns:
+        str: `<FILE_PROXY_URL>/t/<token>.pdf`
+    """
+    token = mint_token(file_blob, _link_expiry(expire_in_seconds))
+    return f"{current_app.config['FILE_PROXY_URL'].rstrip('/')}/t/{token}.pdf"
+
+
+def builtin_link(file_blob: str, expire_in_seconds: int) -> str:
+    """
+    Returns a link to a blob served by the app itself (`main.stream_file`), for
+    deployments without the proxy worker. Like `token_link`, it needs no network I/O.
+
+    Args:
+        file_blob (str): The blob name.
+        expire_in_seconds (int): Minimum validity of the link.
+
+    Returns:
+        str: The absolute URL of `/file/<token>`.
+    """
+    return url_for('main.stream_file', token=mint_token(file_blob, _link_expiry(expire_in_seconds)), _external=True)
@@ -0,0 +1,104 @@
+import re
+from collections import Counter, deque
+from threading import Lock
+
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import inc
+
+_findings = deque(maxlen=100)
+_findings_lock = Lock()
+_engine_hooked = False
+
+
+class RepeatedQueryError(Exception):
+    """
+    Raised at the end of a request that sent the same query shape too many
+    times, when `QUERY_AUDIT_RAISE` is set (in tests).
+    """
+
+
+def query_shape(statement: str) -> str:
+    """
+    Reduces a SQL statement to its shape: literals and placeholders become `?`,
+    `IN (...)` lists collapse, and whitespace is normalized. Statements of an
+    N+1 loop differ only in their parameters, so they share a shape.
+
+    Args:
+        statement (str): The SQL sent to the database.
+
+    Returns:
+        str: The shape.
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'%\(\w+\)s|%s|:\w+|\b\d+\b', '?', shape)
+    shape = re.sub(r'\bIN\s*\([^)]*\)', 'IN (...)', shape, flags=re.IGNORECASE)
+    return ' '.join(shape.split())
+
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_shapes' in g:
+        g.query_shapes[query_shape(statement)] += 1
+
+
+def _start_request():
+    if current_app.config.get('QUERY_AUDIT', False):
+        g.query_shapes = Counter()
+
+
+def _check_request(response):
+    shapes = g.pop('query_shapes', None)
+    if not shapes:
+        return response
+    threshold = current_app.config.get('QUERY_AUDIT_THRESHOLD', 5)
+    repeated = {shape: count for shape, count in shapes.items() if count >= threshold}
+    if not repeated:
+        return response
+
+    endpoint = request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+    for shape, count in repeated.items():
+        current_app.logger.warning(f'Query repeated {count} times in {request.method} {request.path}: {shape}')
+        inc('repeated_queries_total', {'endpoint': endpoint})
+        with _findings_lock:
+            _findings.append({'endpoint': endpoint, 'method': request.method, 'path': request.path,
+                              'count': count, 'query': shape})
+    if current_app.config.get('QUERY_AUDIT_RAISE', False):
+        raise RepeatedQueryError(f'{len(repeated)} queries repeated at least {threshold} times in '
+                                 f'{request.method} {request.path}: {next(iter(repeated))}')
+    return response
+
+
+def audit_findings() -> list:
+    """
+    Returns the most recent repeated-query findings of this process, oldest first.
+
+    Returns:
+        list[dict]: `endpoint`, `method`, `path`, `count` and `query` of each finding.
+    """
+    with _findings_lock:
+        return list(_findings)
+
+
+def init_app(app) -> None:
+    """
+    Detects N+1 query patterns: with `QUERY_AUDIT` set, every request counts
+    the SQL statements it sends by shape (see `query_shape`), and any shape
+    sent `QUERY_AUDIT_THRESHOLD` times or more is logged as a warning, counted
+    in `repeated_queries_total` and kept for `audit_findings`. With
+    `QUERY_AUDIT_RAISE` also set, the request fails with `RepeatedQueryError`,
+    so a test exercising the route fails.
+
+    Meant for development and tests; it costs a regex pass per statement.
+
+    Args:
+        app (Flask): The app.
+    """
+    global _engine_hooked
+    with _findings_lock:
+        if not _engine_hooked:
+            event.listen(Engine, 'before_cursor_execute', _record)
+            _engine_hooked = True
+    app.before_request(_start_request)
+    app.after_request(_check_request)
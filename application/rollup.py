@@ -0,0 +1,82 @@
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, NewspaperIssue, IssueCount
+
+
+def issue_count_key(issue: NewspaperIssue) -> tuple:
+    """
+    Returns the `IssueCount` row an issue is counted in.
+
+    Args:
+        issue (NewspaperIssue): The issue; pending issues must be flushed so defaults are set.
+
+    Returns:
+        tuple: (year, month, day, view_power), or None if the issue has no date.
+    """
+    if issue.issued_time is None:
+        return None
+    return (issue.issued_time.year, issue.issued_time.month, issue.issued_time.day, issue.view_power)
+
+
+def adjust_issue_counts(removed: tuple = None, added: tuple = None) -> None:
+    """
+    Moves one issue between `IssueCount` rows in the current transaction.
+    Call it before committing the change to the issue itself.
+
+    Args:
+        removed (tuple): The key the issue was counted under, if any.
+        added (tuple): The key the issue is counted under now, if any.
+    """
+    if removed == added:
+        return
+    if removed is not None:
+        _add_to_count(removed, -1)
+    if added is not None:
+        _add_to_count(added, 1)
+
+
+def _count_filter(key: tuple):
+    year, month, day, view_power = key
+    return IssueCount.query.filter_by(year=year, month=month, day=day, view_power=view_power)
+
+
+def _add_to_count(key: tuple, delta: int) -> None:
+    updated = _count_filter(key).update({IssueCount.count: IssueCount.count + delta}, synchronize_session=False)
+    if updated:
+        if delta < 0:
+            _count_filter(key).filter(IssueCount.count <= 0).delete(synchronize_session=False)
+        return
+    if delta < 0:
+        return
+
+    year, month, day, view_power = key
+    try:
+        with db.session.begin_nested():
+            db.session.add(IssueCount(year=year, month=month, day=day, view_power=view_power, count=delta))
+    except IntegrityError:
+        # Another request created the row first
+        _count_filter(key).update({IssueCount.count: IssueCount.count + delta}, synchronize_session=False)
+
+
+def rebuild_issue_counts() -> int:
+    """
+    Recomputes every `IssueCount` row from the issues table and commits.
+
+    Returns:
+        int: The number of rows written.
+    """
+    year = db.extract('year', NewspaperIssue.issued_time)
+    month = db.extract('month', NewspaperIssue.issued_time)
+    day = db.extract('day', NewspaperIssue.issued_time)
+    rows = db.session.query(year, month, day, NewspaperIssue.view_power, func.count(NewspaperIssue.id)).filter(
+        NewspaperIssue.issued_time.isnot(None)
+    ).group_by(year, month, day, NewspaperIssue.view_power).all()
+
+    IssueCount.query.delete()
+    db.session.add_all(
+        IssueCount(year=int(y), month=int(m), day=int(d), view_power=view_power, count=count)
+        for y, m, d, view_power, count in rows
+    )
+    db.session.commit()
+    return len(rows)
@@ -1,22 +1,37 @@
-from flask import render_template, request, redirect, url_for, flash, Response, Blueprint, current_app, abort
+from flask import render_template, request, redirect, url_for, flash, Response, Blueprint, current_app, abort, jsonify, send_file, stream_with_context
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from google.cloud import storage
 import os
-import pdfplumber
+import time
 import datetime
 from collections import defaultdict
-import requests
 
 from . import cache
 from .utils import *
+from .ingest import spool_path, enqueue_ingestion, retry_job, is_retryable
+from .search import get_search_backend
+from .search_cache import cached_search, search_cache_stats
+from .pagination import seek_page, offset_page
+from .storage import get_storage
+from .proxy_tokens import read_token
+from .previews import get_thumbnails, get_page_previews, get_month_cover_blobs, get_preview_cache, preview_url
+from .rollup import issue_count_key, adjust_issue_counts
+from .caching import current_tier, invalidate_tags, issue_tags
+from .file_links import get_file_link, file_link_stats, FileLinkError
+from .http_client import get_worker_client
+from .metrics import render_prometheus
+from .text_pages import DocumentText
+from .http_cache import conditional_page
 from .forms import *
 from .models import *
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@conditional_page()
 def index():
     # Get the min and max issued_time from the database
     min_date,max_date = get_issue_date_interval()
@@ -54,6 +69,7 @@ def edit_about():
         config.about_content = form.about_content.data
         db.session.commit()  # Save the changes to the database
         cache.delete('get_about_markdown')
+        invalidate_tags('about')  # pages showing it get a new ETag
         flash('About page content updated successfully!', 'success')
         return redirect('/')  # Redirect to the landing page
 
@@ -74,20 +90,32 @@ def manage_categories():
     if request.method == 'POST':
         manage_form = ManageCategoriesForm(request.form)
         if manage_form.validate_on_submit():
-            # Process existing categories
-            for category_form in manage_form.categories.entries:
-                if category_form.confirm.data:  # Only process if confirm is checked
-                    category = Category.query.get(int(category_form.category_id.data))
-                    if category_form.delete.data:
-                        # Avoid deleting the default 'Uncategorized' category
-                        if category.issues.count() > 0:
-                            flash(f"Cannot delete category '{category.name}' because it has associated issues.", 'danger')
-                        else:
-                            db.session.delete(category)
+            # Process existing categories; only rows with confirm checked are processed
+            confirmed = [category_form for category_form in manage_form.categories.entries if category_form.confirm.data]
+            ids = [int(category_form.category_id.data) for category_form in confirmed]
+            # One query for the categories and one for their issue counts, whatever the number of rows
+            categories_by_id = {category.id: category for category in Category.query.filter(Category.id.in_(ids))}
+            issue_counts = dict(db.session.query(NewspaperIssue.category_id, func.count(NewspaperIssue.id)).filter(
+                NewspaperIssue.category_id.in_(ids)
+            ).group_by(NewspaperIssue.category_id).all())
+            deleted_ids = []
+            for category_form in confirmed:
+                category = categories_by_id.get(int(category_form.category_id.data))
+                if category is None:
+                    continue
+                if category_form.delete.data:
+                    # Avoid deleting the default 'Uncategorized' category
+                    if issue_counts.get(category.id, 0) > 0:
+                        flash(f"Cannot delete category '{category.name}' because it has associated issues.", 'danger')
                     else:
-                        # Update category details
-                        category.name = category_form.category_name.data
-                        category.description = category_form.category_description.data
+                        deleted_ids.append(category.id)
+                else:
+                    # Update category details
+                    category.name = category_form.category_name.data
+                    category.description = category_form.category_description.data
+            if deleted_ids:
+                # One statement; they have no issues, so nothing needs loading first
+                Category.query.filter(Category.id.in_(deleted_ids)).delete(synchronize_session=False)
             
             # Process new category
             if manage_form.new_name.data and manage_form.new_confirm.data:
@@ -98,6 +126,7 @@ def manage_categories():
                 db.session.add(new_category)
 
             db.session.commit()
+            invalidate_tags('categories', *[f'category:{c.category_id.data}' for c in manage_form.categories.entries if c.confirm.data])
             flash('Categories updated successfully!', 'success')
         else:
             flash(f"Form validation failed: {manage_form.errors}", 'danger')
@@ -151,19 +180,26 @@ def manage_users():
     if request.method == 'POST':
         manage_form = ManageUsersForm(request.form)
         if manage_form.validate_on_submit():
-            # Process existing users
-            for user_form in manage_form.users.entries:
-                if user_form.confirm.data:
-                    user = User.query.get(int(user_form.user_id.data))
-                    if user_form.delete.data:
-                        db.session.delete(user)
-                    else:
-                        # Update user details
-                        user.username = user_form.username.data
-                        if user_form.password.data:
-                            user.password_hash = generate_password_hash(user_form.password.data)
-                        user.view_power = user_form.view_power.data
+            # Process existing users, loaded in one query
+            confirmed = [user_form for user_form in manage_form.users.entries if user_form.confirm.data]
+            users_by_id = {user.id: user for user in User.query.filter(
+                User.id.in_([int(user_form.user_id.data) for user_form in confirmed])
+            )}
+            for user_form in confirmed:
+                user = users_by_id.get(int(user_form.user_id.data))
+                if user is None:
+                    continue
+                if user_form.delete.data:
+                    db.session.delete(user)
+                else:
+                    # Update user details
+                    user.username = user_form.username.data
+                    if user_form.password.data:
+                        user.password_hash = generate_password_hash(user_form.password.data)
+                    user.view_power = user_form.view_power.data
             db.session.commit()
+            # Sessions of these users pick up the change (see `models.get_session_user`)
+            invalidate_tags(*[f'user:{user_id}' for user_id in users_by_id])
             flash('Users updated successfully!', 'success')
         else:
             flash(f'oh no! {manage_form.errors}')
@@ -204,6 +240,8 @@ def add_user():
             )
             db.session.add(new_user)
             db.session.commit()
+            # A reused ID may have a cached session user
+            invalidate_tags(f'user:{new_user.id}')
             flash('User created successfully!', 'success')
         return redirect(url_for('main.manage_users'))
     return render_template('add_user.html', create_form=create_form)
@@ -228,36 +266,36 @@ def upload():
         # Generate a unique file name
         random_filename = secure_filename(generate_random_filename() + os.path.splitext(file.filename)[1])  # Preserve the original file extension
 
-        # Upload to Google Cloud Storage
-        client = storage.Client()
-        bucket = client.bucket(current_app.config['CLOUD_STORAGE_BUCKET'])
-        blob = bucket.blob(random_filename)  # Use the unique random file name
-        blob.upload_from_file(file)
+        # Spool the file locally; text extraction happens in the background
+        local_path = spool_path(random_filename)
+        file.save(local_path)
 
-        # Extract text from PDF
-        text_content = ""
-        if file.filename.endswith('.pdf'):
-            file.seek(0)  # Reset the file pointer before reading it again
-            with pdfplumber.open(file) as pdf:
-                for page in pdf.pages:
-                    text_content += page.extract_text().lower() + "\n"
+        # Upload to the storage backend under the unique random file name
+        get_storage().put(random_filename, local_path, content_type=file.mimetype)
 
         # Assign the selected category or default to "Uncategorized"
         category = Category.query.get(category_id) or Category.get_or_create_default()
 
-        # Store in MySQL
+        # Store in MySQL; content is filled in by the ingestion job
         new_issue = NewspaperIssue(
             title=title,
             author=author,
             issued_time=issued_time,
-            content=text_content,  # Save the extracted text
+            content='',
             file_blob=random_filename,
             category=category  # Assign the selected category
         )
         db.session.add(new_issue)
+        db.session.flush()  # Apply column defaults before counting the issue
+        adjust_issue_counts(added=issue_count_key(new_issue))
         db.session.commit()
 
-        flash('Newspaper issue uploaded successfully!')
+        if file.filename.endswith('.pdf'):
+            job = enqueue_ingestion(new_issue)
+            flash(f'Newspaper issue uploaded successfully! Text extraction queued as job #{job.id}.')
+        else:
+            os.remove(local_path)
+            flash('Newspaper issue uploaded successfully!')
 
         # Update cache (if applicable)
         update_cache(new_issue)
@@ -296,6 +334,10 @@ def edit_issue(issue_id):
     # Fetch the issue from the database
     issue = NewspaperIssue.query.get_or_404(issue_id)
 
+    # Remember where the issue is counted and cached before it changes
+    old_count_key = issue_count_key(issue)
+    stale_tags = issue_tags(issue)
+
     # Create the form and populate it with the existing issue data
     form = UpdateForm(obj=issue)
 
@@ -323,28 +365,30 @@ def edit_issue(issue_id):
                     generate_random_filename() + os.path.splitext(file.filename)[1]
                 )  # Preserve the original file extension
 
-                # Upload to Google Cloud Storage
-                client = storage.Client()
-                bucket = client.bucket(current_app.config['CLOUD_STORAGE_BUCKET'])
-                blob = bucket.blob(random_filename)
-                blob.upload_from_file(file)
+                # Spool the file locally; text extraction happens in the background
+                local_path = spool_path(random_filename)
+                file.save(local_path)
 
-                # Extract text from PDF
-                if file.filename.endswith('.pdf'):
-                    text_content = ""
-                    with pdfplumber.open(file) as pdf:
-                        for page in pdf.pages:
-                            text_content += page.extract_text() + "\n"
-                    issue.content = text_content  # Update the content field
+                # Upload to the storage backend under the unique random file name
+                get_storage().put(random_filename, local_path, content_type=file.mimetype)
 
                 # Update the file_blob field in the database with the new filename
                 issue.file_blob = random_filename
 
             # Commit changes to the database
+            adjust_issue_counts(old_count_key, issue_count_key(issue))
             db.session.commit()
 
+            # Queue text extraction for the new file
+            if form.file.data:
+                if form.file.data.filename.endswith('.pdf'):
+                    job = enqueue_ingestion(issue)
+                    flash(f'Text extraction queued as job #{job.id}.')
+                else:
+                    os.remove(local_path)
+
             # Update cache or any relevant external data
-            update_cache(issue)
+            update_cache(issue, stale_tags)
 
             flash('The issue was successfully updated.', 'success')
             return redirect(url_for('main.view_document', issue_id=issue.id))  # Replace with the correct route
@@ -360,93 +404,72 @@ def edit_issue(issue_id):
 @admin_required
 def delete_issue(issue_id):
     issue = get_issue(issue_id)
-    update_cache(issue)
+    stale_tags = issue_tags(issue)
     # blob = db.session.query(SignedBlob).filter_by(blob_name=issue.blob_name).first()
     # db.session.delete(blob)
+    adjust_issue_counts(removed=issue_count_key(issue))
     db.session.delete(issue)
     db.session.commit()
+    update_cache(stale_tags=stale_tags)
+    get_search_backend().remove_issue(issue_id)
     flash('Newspaper issue deleted successfully!')
     return redirect(url_for('main.search'))
 
 @main_bp.route('/archive')
 @login_required
+@conditional_page()
 def archive():
     """
     Displays a year-month view of all issues. Each month links to a month view
     where issues are displayed, labeled by their dates.
     """
-    # Query all newspaper issues, ordered by issued_time descending
-    issues = get_archive()
-
-    # Organize issues by year and month
-    issues_by_month = defaultdict(list)
-    issues_by_year = defaultdict(list)
-    for issue in issues:
-        year = issue.issued_time.strftime('%Y')
-        month = issue.issued_time.strftime('%m')
-        year_month = f"{year}-{month}"
-        issues_by_month[year_month].append(issue)
-        if month not in issues_by_year[year]:
-            issues_by_year[year].append(month)
-
-    # Sort the years and months
-    sorted_years = sorted(issues_by_year.keys(), reverse=True)
-    issues_by_year = {
-        year: sorted(issues_by_year[year])
-        for year in sorted_years
-    }
+    # Issue counts per year and month, read from the rollup
+    calendar = get_archive_calendar(current_tier())
 
     # Generate month view URLs for each month
     month_urls = {
-        f"{year}-{month}": url_for('main.month_view', year=year, month=month)
-        for year in issues_by_year
-        for month in issues_by_year[year]
+        (year, month): url_for('main.month_view', year=year, month=month)
+        for year, months in calendar.items()
+        for month in months
     }
 
     return render_template('archive.html',
-                           issues_by_year=issues_by_year,
-                           issues_by_month=issues_by_month,
+                           calendar=calendar,
                            months_list=MONTHS_LIST,
                            month_urls=month_urls)
 
 @main_bp.route('/archive/<int:year>/<int:month>')
 @login_required
+@conditional_page()
 def month_view(year, month):
     """
-    Displays all issues for a specific month in a calendar-like view.
+    Displays the number of issues on each day of a month in a calendar-like view.
     """
-    # Query issues for the specified year and month
-    issues = get_year_month_issues(year,month)
-
-    # Serialize issues to a list of dictionaries
-    serialized_issues = [
-        {
-            "id": issue.id,
-            "title": issue.title,
-            "issued_time": issue.issued_time.strftime('%Y-%m-%d'),  # Format as string
-            "url": url_for('main.view_document', issue_id=issue.id),
-            "author": issue.author,
-        }
-        for issue in issues
-    ]
+    # Issue counts per day, read from the rollup
+    day_counts = get_month_day_counts(year, month, current_tier())
+    # Thumbnail of each day's first issue
+    day_covers = {day: preview_url(blob) for day, blob in get_month_cover_blobs(year, month, current_tier()).items()}
 
-    # Render template with serialized issues
+    # Render template with the counts
     return render_template(
         'month_view.html',
         year=year,
         month=month,
-        issues=serialized_issues,
+        day_counts=day_counts,
+        day_covers=day_covers,
         months_list=MONTHS_LIST,
     )
 
 @main_bp.route('/archive/<int:year>/<int:month>/<int:day>')
 @login_required
+@conditional_page()
 def day_view(year, month, day):
     """
     Displays all issues for a specific day in a detailed list view.
     """
     # Query issues for the specified year, month, and day
-    issues = get_day_issues(year, month, day)
+    issues = get_day_issues(year, month, day, current_tier())
+    thumbnails = get_thumbnails([issue.id for issue in issues])
 
     # Serialize issues to a list of dictionaries
     serialized_issues = [
@@ -456,6 +479,7 @@ def day_view(year, month, day):
             "issued_time": issue.issued_time.strftime('%Y-%m-%d'),  # Include time for more detail
             "url": url_for('main.view_document', issue_id=issue.id),
             "author": issue.author,
+            "thumbnail": thumbnails.get(issue.id),
         }
         for issue in issues
     ]
@@ -505,7 +529,6 @@ def search():
     if ori_query:
         context['query'] = ori_query
         query = clean_query(ori_query)
-        filters.append(NewspaperIssue.content.match(query))
 
     # Parse issued_time_start
     if issued_time_start:
@@ -528,16 +551,73 @@ def search():
         context['category_query'] = int(category_query)  # Store selected category ID in the context
         filters.append(NewspaperIssue.category_id == int(category_query))
 
-    # Modify the query to use pagination
     per_page = 15  # Number of results per page
-    pagination = NewspaperIssue.query.filter(*filters).order_by(NewspaperIssue.issued_time.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    results = pagination.items
+    backend = get_search_backend() if ori_query else None
+    issue_query = db.session.query(NewspaperIssue.id, NewspaperIssue.issued_time).filter(*filters)
+    restricted = {}
+
+    def search_query():
+        # The search backend filters by content and orders its matches. Done on
+        # first use only, so cached counts and pages skip the backend entirely.
+        if not restricted:
+            if ori_query:
+                restricted['query'], restricted['truncated'] = backend.restrict(issue_query, query)
+            else:
+                restricted['query'], restricted['truncated'] = issue_query, False
+        return restricted['query'], restricted['truncated']
+
+    def count():
+        matches, truncated = search_query()
+        return matches.order_by(None).count(), truncated
+
+    # Same normalized search and tier: same results until the corpus changes
+    criteria = {
+        'query': query if ori_query else None,
+        'title': title_query or None,
+        'author': author_query or None,
+        'start': issued_time_start,
+        'end': issued_time_end,
+        'category': int(category_query) if category_query else None,
+        'tier': current_user.view_power,
+    }
+    total, truncated = cached_search({**criteria, 'count_truncated': True}, count)
+    if truncated:
+        # Only the best matches are listed; say so rather than imply there are no others
+        context['truncated_at'] = backend.result_limit
+
+    def read_page():
+        matches = search_query()[0]
+        if ori_query and backend.ranks_results:
+            # Relevance order has no seekable key; the backend bounds the candidates
+            result = offset_page(matches, per_page, total, page)
+        else:
+            result = seek_page(matches, per_page, total, page, after=request.args.get('after'),
+                               before=request.args.get('before'), last=bool(request.args.get('last')))
+        return result.with_items([row.id for row in result.items])
+
+    pagination = cached_search({
+        **criteria,
+        'page': page,
+        'per_page': per_page,
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'last': request.args.get('last'),
+    }, read_page)
+    rows = {issue.id: issue for issue in issue_summaries().filter(NewspaperIssue.id.in_(pagination.items))} if pagination.items else {}
+    results = [rows[issue_id] for issue_id in pagination.items if issue_id in rows]
+    pagination = pagination.with_items(results)
+
+    # Find the matching pages of the issues shown on this page
+    if ori_query:
+        context['page_hits'] = get_page_hits([result.id for result in results], query)
 
     # Add pagination and results to the context
     context['results'] = results
+    context['thumbnails'] = get_thumbnails([result.id for result in results])
     context['pagination'] = pagination
+    context['search_args'] = {name: request.args[name] for name in
+                              ('q', 'title', 'author', 'issued_time_start', 'issued_time_end', 'category')
+                              if request.args.get(name)}
 
     # Add categories to the context for dropdown rendering
     context['categories'] = get_all_category()
@@ -547,73 +627,278 @@ def search():
         **context
     )
 
-# @main_bp.route('/file/<path:blob_name>', methods=['GET'])
-# def proxy_to_signed_url(blob_name):
-#     # Generate the signed URL
-#     signed_url = get_db_signed_url(blob_name)
-#     if signed_url:
-#     # Fetch the content from the signed URL
-#         response = requests.get(signed_url, stream=True)
+@main_bp.route('/file/<token>')
+def stream_file(token):
+    """
+    Streams a file for deployments without the proxy worker. The token comes from
+    `proxy_tokens.builtin_link` and grants access like a signed bucket URL.
 
-#         # Proxy the response back to the client
-#         return Response(
-#             response.iter_content(chunk_size=8192),
-#             content_type=response.headers.get('Content-Type'),
-#             status=response.status_code
-#         )
-#     else:
-#         return abort(404)
+    The file is sent in `FILE_STREAM_CHUNK_SIZE` chunks, so memory per request is
+    constant. `Range`/`If-Range` let pdf.js fetch only the bytes it renders, and
+    `ETag`/`If-None-Match` let browsers revalidate with a 304.
+    """
+    claims = read_token(token)
+    if claims is None:
+        abort(404)
+    file_blob, expires_at = claims
+    storage = get_storage()
+    info = storage.stat(file_blob)
+    if info is None:
+        abort(404)
+
+    response = Response(mimetype=info.content_type or 'application/pdf', direct_passthrough=True)
+    response.set_etag(info.etag)
+    response.last_modified = info.updated
+    response.accept_ranges = 'bytes'
+    response.headers['Content-Disposition'] = 'inline; filename="file.pdf"'
+    response.cache_control.private = True
+    response.cache_control.max_age = max(0, int(expires_at - time.time()))
+
+    if request.if_none_match.contains_weak(info.etag):
+        response.status_code = 304
+        return response
+
+    start, end = 0, info.size - 1
+    if request.range is not None and len(request.range.ranges) == 1 and _if_range_matches(info):
+        span = request.range.range_for_length(info.size)
+        if span is None:
+            raise RequestedRangeNotSatisfiable(length=info.size)
+        start, end = span[0], span[1] - 1
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, end + 1, info.size)
+
+    response.content_length = end - start + 1
+    response.response = storage.iter_range(file_blob, start, end, current_app.config.get('FILE_STREAM_CHUNK_SIZE', 262144))
+    return response
+
+def _if_range_matches(info) -> bool:
+    """
+    Whether a `Range` header applies under the request's `If-Range` condition:
+    the validator must still match, otherwise the whole file is sent.
+    """
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == info.etag
+    if if_range.date is not None:
+        return info.updated is not None and if_range.date == info.updated.replace(microsecond=0)
+    return True
 
 
 @main_bp.route('/view_document/<int:issue_id>')
 @login_required
 def view_document(issue_id):
     query = request.args.get('q', '')  # Get the search query
+    page = request.args.get('page', type=int)  # Page to open the document at
     issue = get_issue(issue_id)
     if current_user.view_power<issue.view_power:
         return redirect('/')
-    signed_url = create_signed_url(issue.file_blob)
-    # Generate the temporary URL using the Worker
-    # Get the worker endpoint and expiration settings from the app configuration
-    worker_url = current_app.config.get('CLOUDFLARE_PROXY_WORKER_URL')
-    if not worker_url:
-        current_app.logger.error("Worker URL not configured.")
-        return redirect('/')
-    
-    expire_in_seconds = current_app.config.get('FILE_LINK_EXPIRE_TIME_SEC', 3600) - 1  # Default to 3600 seconds if not set
-
+    if page is None and query:
+        cleaned_query = clean_query(query)
+        if cleaned_query:
+            page = get_first_matching_page(issue.id, cleaned_query)
     try:
-        # Call the Worker to generate the temporary URL
-        response = requests.get(worker_url, params={
-            'signedUrl': signed_url,
-            'expireSeconds': expire_in_seconds  # Use correct parameter name
-        })
-        response.raise_for_status()
-
-        # Parse the Worker response
-        proxied_url = response.json().get('tmpLink')  # Use 'tmpLink' to match Worker response key
-        if not proxied_url:
-            current_app.logger.error('Failed to retrieve temporary link from Worker response.')
-            return redirect('/')
-    except requests.RequestException as e:
-        current_app.logger.error(f'Error calling the Worker: {e}')
+        # Signed URL and temporary link are cached for their validity window
+        proxied_url = get_file_link(issue.file_blob, current_tier())
+    except FileLinkError as e:
+        current_app.logger.error(str(e))
         return redirect('/')
 
-    return render_template('view_pdf.html', issue=issue, query=query, file_url=proxied_url)
+    return render_template('view_pdf.html', issue=issue, query=query, page=page, file_url=proxied_url,
+                           page_previews=get_page_previews(issue.id))
+
+@main_bp.route('/preview/<token>')
+def preview(token):
+    """
+    Serves a thumbnail or page preview image through the local preview cache.
+    The token comes from `previews.preview_url`.
+    """
+    claims = read_token(token)
+    if claims is None or not claims[0].startswith('preview-'):
+        abort(404)
+    blob_name, expires_at = claims
+    try:
+        path = get_preview_cache().path(blob_name)
+    except Exception as e:
+        current_app.logger.error(f'Preview {blob_name} unavailable: {e}')
+        abort(404)
+    response = send_file(path, mimetype='image/jpeg', conditional=True, max_age=max(0, int(expires_at - time.time())))
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @main_bp.route('/view_text/<int:issue_id>')
 @login_required
-@cache.cached(timeout=86400)
 def view_text(issue_id):
+    """
+    Serves the extracted text of an issue as plain text. It is streamed from the
+    page rows a few pages at a time, with `ETag` revalidation and single `Range`
+    requests, so no request holds the whole document. `view_text_page` serves
+    single pages, compressed.
+    """
     issue = get_issue(issue_id)
-    return issue.content
+    if current_user.view_power < issue.view_power:
+        return abort(403)
+
+    document = DocumentText.load(issue_id)
+    if document is None:
+        # Pages stored before the text columns existed, until `flask --app app prepare-text` runs
+        content = db.session.query(NewspaperIssue.content).filter(NewspaperIssue.id == issue_id).scalar()
+        return Response(content or '', mimetype='text/plain')
+
+    response = Response(mimetype='text/plain', direct_passthrough=True)
+    response.set_etag(document.etag)
+    response.accept_ranges = 'bytes'
+    response.headers['X-Page-Count'] = str(len(document.pages))
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('TEXT_MAX_AGE_SEC', 3600)
+
+    if request.if_none_match.contains(document.etag):
+        response.status_code = 304
+        return response
+
+    start, end = 0, document.length - 1
+    if_range = request.if_range
+    range_applies = if_range.etag == document.etag if (if_range.etag or if_range.date) else True
+    if request.range is not None and len(request.range.ranges) == 1 and range_applies:
+        span = request.range.range_for_length(document.length)
+        if span is None:
+            raise RequestedRangeNotSatisfiable(length=document.length)
+        start, end = span[0], span[1] - 1
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, end + 1, document.length)
+
+    response.content_length = end - start + 1
+    response.response = stream_with_context(document.iter_range(start, end))
+    return response
+
+@main_bp.route('/view_text/<int:issue_id>/page/<int:page_no>')
+@login_required
+def view_text_page(issue_id, page_no):
+    """
+    Serves the text of one page in the best encoding the client accepts
+    (Brotli, gzip, or none), using the compressed forms stored at ingest.
+    Each encoding has its own `ETag`.
+    """
+    issue = get_issue(issue_id)
+    if current_user.view_power < issue.view_power:
+        return abort(403)
+
+    page_filter = (IssuePage.issue_id == issue_id, IssuePage.page_no == page_no)
+    body, encoding, etag = None, None, None
+    for name, column in (('br', IssuePage.text_brotli), ('gzip', IssuePage.text_gzip)):
+        if request.accept_encodings[name]:
+            row = db.session.query(IssuePage.text_etag, column).filter(*page_filter).first()
+            if row is None:
+                abort(404)
+            if row[1] is not None:
+                etag, body, encoding = f'{row[0]}-{name}', row[1], name
+                break
+    if body is None:
+        row = db.session.query(IssuePage.text_etag, IssuePage.text).filter(*page_filter).first()
+        if row is None:
+            abort(404)
+        etag, body = row[0], row[1] or ''
+
+    response = Response(body, mimetype='text/plain')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('TEXT_MAX_AGE_SEC', 3600)
+    return response.make_conditional(request)
 
 @main_bp.route('/admin')
 @login_required
 @admin_required
 def admin_dashboard():
-    issues = NewspaperIssue.query.all()
-    return render_template('admin.html', issues=issues)
+    return render_template('admin.html')
+
+@main_bp.route('/admin/file_link_stats')
+@login_required
+@admin_required
+def file_link_stats_view():
+    """
+    Returns the hit and miss counters of the signed URL and temporary link caches
+    of this worker process, and the latency and error rate of its calls to the
+    proxy worker.
+    """
+    return jsonify({**file_link_stats(), 'worker': get_worker_client().stats()})
+
+@main_bp.route('/admin/search_cache_stats')
+@login_required
+@admin_required
+def search_cache_stats_view():
+    """
+    Returns the hit and miss counters of the search result cache of this worker
+    process, and the current corpus generation.
+    """
+    return jsonify(search_cache_stats())
+
+@main_bp.route('/metrics')
+@login_required
+@admin_required
+def metrics_view():
+    """
+    Exports the metrics of this worker process in the Prometheus text format:
+    request latency per endpoint, SQL statements, cache lookups per key prefix
+    and upstream call times, plus the link, search cache and worker counters.
+    """
+    sources = {
+        'file_links': file_link_stats(),
+        'search_cache': search_cache_stats(),
+        'worker': get_worker_client().stats(),
+    }
+    cache_stats = getattr(cache.cache, 'stats', None)
+    if cache_stats is not None:
+        sources['shared_cache'] = cache_stats()
+    gauges = {
+        f'{source}_{name}': value
+        for source, stats in sources.items()
+        for name, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    return Response(render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@main_bp.route('/admin/ingest_jobs')
+@login_required
+@admin_required
+def ingest_jobs():
+    """
+    Lists background ingestion jobs, unfinished ones first.
+    """
+    status_order = db.case({'running': 0, 'queued': 1, 'failed': 2}, value=IngestionJob.status, else_=3)
+    jobs = IngestionJob.query.options(joinedload(IngestionJob.issue)).order_by(
+        status_order, IngestionJob.id.desc()
+    ).limit(200).all()
+    return render_template('ingest_jobs.html', jobs=jobs, is_retryable=is_retryable)
+
+@main_bp.route('/admin/ingest_jobs/<int:job_id>')
+@login_required
+@admin_required
+def ingest_job_status(job_id):
+    job = IngestionJob.query.get_or_404(job_id)
+    return jsonify({
+        'id': job.id,
+        'issue_id': job.issue_id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+    })
+
+@main_bp.route('/admin/ingest_jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+@admin_required
+def retry_ingest_job(job_id):
+    job = IngestionJob.query.get_or_404(job_id)
+    if retry_job(job):
+        flash(f'Job #{job.id} requeued.')
+    else:
+        flash(f'Job #{job.id} cannot be retried while it is {job.status}.')
+    return redirect(url_for('main.ingest_jobs'))
 
 @main_bp.route('/logout')
 # @login_required
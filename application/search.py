@@ -0,0 +1,172 @@
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import case, false, or_
+
+from .models import db, NewspaperIssue, IssuePage
+from .inverted_index import InvertedIndex, parse_query
+
+_backends = {}
+_backends_lock = Lock()
+
+
+class SearchBackend:
+    """
+    Interface of the full-text search engines behind `routes.search`.
+
+    A backend narrows an issue query down to the issues matching a text query
+    and orders them. All other filters (view_power, dates, category, title,
+    author) stay on the issue query, so every backend respects them.
+    """
+
+    # Whether results are ordered by relevance rather than newest first
+    ranks_results = False
+
+    # The most matches a search returns, or None if it returns them all
+    result_limit = None
+
+    def restrict(self, issue_query, query: str):
+        """
+        Restricts an issue query to the issues matching a text query.
+
+        Args:
+            issue_query (Query): A `NewspaperIssue` query with the other filters applied.
+            query (str): The text query after `clean_query`.
+
+        Returns:
+            tuple: The filtered query, ordered best match first, and whether
+            matches beyond `result_limit` were left out.
+        """
+        raise NotImplementedError
+
+    def page_filter(self, query: str):
+        """
+        Builds the condition selecting the `IssuePage` rows that match a text query.
+
+        Args:
+            query (str): The text query after `clean_query`.
+
+        Returns:
+            ColumnElement: A filter condition on `IssuePage`.
+        """
+        raise NotImplementedError
+
+    def index_issue(self, issue: NewspaperIssue) -> None:
+        """
+        Called after an issue's content was committed.
+        """
+
+    def remove_issue(self, issue_id: int) -> None:
+        """
+        Called after an issue was deleted.
+        """
+
+    def rebuild(self) -> int:
+        """
+        Rebuilds the backend's index from the database.
+
+        Returns:
+            int: The number of issues indexed.
+        """
+        return 0
+
+
+class MySQLFulltextBackend(SearchBackend):
+    """
+    Searches with MySQL `MATCH()` over the `idx_fulltext_content` index.
+    Results are ordered by issued date, newest first.
+    """
+
+    def restrict(self, issue_query, query: str):
+        return issue_query.filter(NewspaperIssue.content.match(query)).order_by(
+            NewspaperIssue.issued_time.desc(), NewspaperIssue.id.desc()
+        ), False
+
+    def page_filter(self, query: str):
+        return IssuePage.text.match(query)
+
+
+class InvertedIndexBackend(SearchBackend):
+    """
+    Searches with the built-in `InvertedIndex` and ranks results with BM25.
+    Quoted phrases are confirmed against the stored content of the candidates.
+
+    Results are the `max_hits` best matches that pass the other filters of the
+    issue query; hits are checked against them in batches of that size, best
+    first, so a restricted tier or a narrow date range still fills its pages.
+    """
+
+    ranks_results = True
+
+    def __init__(self, directory: str, max_hits: int = 1000):
+        self.index = InvertedIndex(directory)
+        self.max_hits = max_hits
+        self.result_limit = max_hits
+
+    def restrict(self, issue_query, query: str):
+        phrases = parse_query(query).phrases
+        hits = self.index.search(query, limit=None)
+        ids = []
+        for start in range(0, len(hits), self.max_hits):
+            batch = [issue_id for issue_id, _ in hits[start:start + self.max_hits]]
+            matching = issue_query.with_entities(NewspaperIssue.id).filter(NewspaperIssue.id.in_(batch))
+            for phrase in phrases:
+                matching = matching.filter(_contains(NewspaperIssue.content, phrase))
+            found = {issue_id for (issue_id,) in matching}
+            ids.extend(issue_id for issue_id in batch if issue_id in found)
+            # One past the limit tells a cut-off result from one of exactly max_hits
+            if len(ids) > self.max_hits:
+                break
+        if not ids:
+            return issue_query.filter(false()), False
+
+        # The matches already passed every filter; keep them in rank order
+        truncated = len(ids) > self.max_hits
+        ids = ids[:self.max_hits]
+        rank = case({issue_id: position for position, issue_id in enumerate(ids)}, value=NewspaperIssue.id)
+        return issue_query.filter(NewspaperIssue.id.in_(ids)).order_by(rank), truncated
+
+    def page_filter(self, query: str):
+        parsed = parse_query(query)
+        words = parsed.terms + parsed.prefixes + parsed.phrases
+        if not words:
+            return false()
+        return or_(*[_contains(IssuePage.text, word) for word in words])
+
+    def index_issue(self, issue: NewspaperIssue) -> None:
+        self.index.add_document(issue.id, issue.content or '')
+
+    def remove_issue(self, issue_id: int) -> None:
+        self.index.remove_document(issue_id)
+
+    def rebuild(self) -> int:
+        documents = db.session.query(NewspaperIssue.id, NewspaperIssue.content).execution_options(yield_per=200)
+        return self.index.rebuild(documents)
+
+
+def _contains(column, text: str):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(f'%{escaped}%', escape='\\')
+
+
+def get_search_backend() -> SearchBackend:
+    """
+    Returns the process-wide search backend selected by `SEARCH_BACKEND`:
+    'mysql' (default) or 'index'.
+
+    Returns:
+        SearchBackend: The configured backend.
+    """
+    name = current_app.config.get('SEARCH_BACKEND', 'mysql')
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'index':
+                _backends[name] = InvertedIndexBackend(
+                    current_app.config['SEARCH_INDEX_DIR'],
+                    max_hits=current_app.config.get('SEARCH_MAX_HITS', 1000),
+                )
+            elif name == 'mysql':
+                _backends[name] = MySQLFulltextBackend()
+            else:
+                raise ValueError(f'Unknown SEARCH_BACKEND: {name}')
+        return _backends[name]
@@ -0,0 +1,74 @@
+import json
+import hashlib
+from collections import Counter
+from threading import Lock
+
+from flask import current_app
+
+from . import cache
+from .caching import corpus_generation
+
+_stats = Counter()
+_stats_lock = Lock()
+
+
+def _count(event: str) -> None:
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def search_cache_key(criteria: dict) -> str:
+    """
+    Builds the cache key of a search. The key includes the corpus generation,
+    so every upload, edit or delete moves all searches to new keys at once;
+    the old entries are never read again and expire.
+
+    Args:
+        criteria (dict): The normalized query, the filters, the page and the
+            view power tier. Values must be JSON-serializable.
+
+    Returns:
+        str: The key.
+    """
+    digest = hashlib.sha1(json.dumps(criteria, sort_keys=True, default=str).encode()).hexdigest()
+    return f'search:{corpus_generation()}:{digest}'
+
+
+def cached_search(criteria: dict, compute):
+    """
+    Returns a search result, computing it only on a cache miss.
+
+    Args:
+        criteria (dict): See `search_cache_key`.
+        compute (callable): Runs the search and returns a picklable result,
+            such as the ids of a page of results or the total count.
+
+    Returns:
+        The cached or computed result.
+    """
+    key = search_cache_key(criteria)
+    result = cache.get(key)
+    if result is not None:
+        _count('hits')
+        return result
+
+    _count('misses')
+    result = compute()
+    cache.set(key, result, timeout=current_app.config.get('SEARCH_CACHE_TIMEOUT', 3600))
+    return result
+
+
+def search_cache_stats() -> dict:
+    """
+    Returns the hit and miss counters of the search result cache in this
+    process, and its hit rate.
+
+    Returns:
+        dict: The counters and `hit_rate`.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    stats['hit_rate'] = stats.get('hits', 0) / lookups if lookups else 0.0
+    stats['generation'] = corpus_generation()
+    return stats
@@ -0,0 +1,162 @@
+import time
+import uuid
+from collections import Counter
+from threading import Lock
+
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.simplecache import SimpleCache
+from werkzeug.utils import import_string
+
+# Key of the generation token in the shared cache
+GENERATION_KEY = 'cache:generation'
+
+
+class TieredCache(BaseCache):
+    """
+    A cache shared by every worker and instance, with a small per-process cache
+    in front of it.
+
+    Reads are served from the process-local cache (L1) when possible, otherwise
+    from the shared cache (Redis, or a directory shared by the workers of one
+    host), and the result is kept in L1 for `l1_timeout` seconds. Writes go to both.
+
+    Invalidations (`delete`, `clear`, `broadcast_invalidation`) also replace a
+    generation token in the shared cache. Every process compares it with the
+    token it last saw at most every `check_interval` seconds and drops its L1
+    when it changed, so no process serves data invalidated elsewhere for longer
+    than `check_interval`.
+
+    Select it with `CACHE_TYPE = 'application.shared_cache.TieredCache'` and the
+    shared backend with `CACHE_SHARED_TYPE` ('RedisCache' or 'FileSystemCache',
+    configured by the usual `CACHE_REDIS_URL` / `CACHE_DIR` settings).
+    """
+
+    def __init__(self, shared: BaseCache, default_timeout: int = 300, l1_timeout: float = 30,
+                 l1_threshold: int = 2000, check_interval: float = 1.0):
+        super().__init__(default_timeout)
+        self.shared = shared
+        self.l1 = SimpleCache(threshold=l1_threshold, default_timeout=l1_timeout)
+        self.l1_timeout = l1_timeout
+        self.check_interval = check_interval
+        self.generation = None
+        self.checked_at = 0.0
+        self.counters = Counter()
+        self.lock = Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs) -> 'TieredCache':
+        shared_type = config.get('CACHE_SHARED_TYPE', 'FileSystemCache')
+        if '.' not in shared_type:
+            shared_type = 'flask_caching.backends.' + shared_type
+        shared = import_string(shared_type).factory(app, config, [], dict(kwargs))
+        return cls(
+            shared,
+            default_timeout=kwargs.get('default_timeout', 300),
+            l1_timeout=config.get('CACHE_L1_TIMEOUT', 30),
+            l1_threshold=config.get('CACHE_L1_THRESHOLD', 2000),
+            check_interval=config.get('CACHE_L1_CHECK_SEC', 1.0),
+        )
+
+    def _count(self, event: str) -> None:
+        with self.lock:
+            self.counters[event] += 1
+
+    def _sync(self) -> None:
+        """
+        Drops L1 if another process invalidated something since the last check.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        generation = self.shared.get(GENERATION_KEY)
+        if generation != self.generation:
+            if self.generation is not None:
+                self._count('l1_flushes')
+            self.l1.clear()
+            self.generation = generation
+
+    def broadcast_invalidation(self) -> None:
+        """
+        Makes every other process drop its L1 within `check_interval`. Called
+        after writes that invalidate entries without deleting them (see
+        `caching.invalidate_tags`). This process's L1 already holds the writes.
+        """
+        self.generation = uuid.uuid4().hex
+        self.shared.set(GENERATION_KEY, self.generation, timeout=0)
+
+    def _l1_timeout(self, timeout) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return self.l1_timeout if timeout == 0 else min(timeout, self.l1_timeout)
+
+    def get(self, key: str):
+        self._sync()
+        value = self.l1.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('shared_hits')
+        self.l1.set(key, value, timeout=self.l1_timeout)
+        return value
+
+    def get_many(self, *keys) -> list:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value, timeout: int = None) -> bool:
+        self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        return self.shared.set(key, value, timeout=self._normalize_timeout(timeout))
+
+    def set_many(self, mapping: dict, timeout: int = None) -> list:
+        self.l1.set_many(mapping, timeout=self._l1_timeout(timeout))
+        return self.shared.set_many(mapping, timeout=self._normalize_timeout(timeout))
+
+    def add(self, key: str, value, timeout: int = None) -> bool:
+        added = self.shared.add(key, value, timeout=self._normalize_timeout(timeout))
+        if added:
+            self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        return added
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def delete(self, key: str) -> bool:
+        self.l1.delete(key)
+        deleted = self.shared.delete(key)
+        self.broadcast_invalidation()
+        return deleted
+
+    def delete_many(self, *keys) -> list:
+        self.l1.delete_many(*keys)
+        deleted = self.shared.delete_many(*keys)
+        self.broadcast_invalidation()
+        return deleted
+
+    def clear(self) -> bool:
+        self.l1.clear()
+        cleared = self.shared.clear()
+        self.broadcast_invalidation()
+        return cleared
+
+    def inc(self, key: str, delta: int = 1):
+        self.l1.delete(key)
+        return self.shared.inc(key, delta)
+
+    def dec(self, key: str, delta: int = 1):
+        self.l1.delete(key)
+        return self.shared.dec(key, delta)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit counters of this process: `l1_hits`, `shared_hits`,
+        `misses`, `l1_flushes` (invalidations seen from other processes) and
+        the overall `hit_rate`.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats.get('l1_hits', 0) + stats.get('shared_hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = (lookups - stats.get('misses', 0)) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,274 @@
+import os
+import shutil
+import datetime
+import mimetypes
+from collections import namedtuple
+from threading import Lock
+
+from flask import current_app
+
+from .proxy_tokens import builtin_link
+
+# Metadata of a stored blob; `etag` is unquoted and changes whenever the content does
+BlobInfo = namedtuple('BlobInfo', ['size', 'etag', 'updated', 'content_type'])
+
+_backends = {}
+_backends_lock = Lock()
+
+
+class StorageBackend:
+    """
+    Interface of the blob stores holding the uploaded files. Blobs are addressed
+    by the names stored in `NewspaperIssue.file_blob`.
+    """
+
+    # Whether viewer links go through the Cloudflare proxy worker
+    proxy_links = True
+
+    def put(self, name: str, path: str, content_type: str = None) -> None:
+        """
+        Stores a local file as a blob, replacing any blob with the same name.
+
+        Args:
+            name (str): The blob name.
+            path (str): The local file to upload.
+            content_type (str): The MIME type, if known.
+        """
+        raise NotImplementedError
+
+    def put_bytes(self, name: str, data: bytes, content_type: str = None) -> None:
+        """
+        Stores bytes as a blob, replacing any blob with the same name.
+
+        Args:
+            name (str): The blob name.
+            data (bytes): The content.
+            content_type (str): The MIME type, if known.
+        """
+        raise NotImplementedError
+
+    def get_range(self, name: str, start: int = 0, end: int = None) -> bytes:
+        """
+        Reads bytes of a blob.
+
+        Args:
+            name (str): The blob name.
+            start (int): The first byte to read.
+            end (int): The last byte to read (inclusive), or None for the end of the blob.
+
+        Returns:
+            bytes: The requested bytes.
+        """
+        raise NotImplementedError
+
+    def iter_range(self, name: str, start: int, end: int, chunk_size: int):
+        """
+        Reads bytes of a blob in chunks, so a response streaming it holds at
+        most one chunk in memory.
+
+        Args:
+            name (str): The blob name.
+            start (int): The first byte to read.
+            end (int): The last byte to read (inclusive).
+            chunk_size (int): The maximum size of each chunk.
+
+        Yields:
+            bytes: The chunks, in order.
+        """
+        position = start
+        while position <= end:
+            chunk_end = min(end, position + chunk_size - 1)
+            yield self.get_range(name, position, chunk_end)
+            position = chunk_end + 1
+
+    def stat(self, name: str) -> BlobInfo:
+        """
+        Reads the metadata of a blob.
+
+        Args:
+            name (str): The blob name.
+
+        Returns:
+            BlobInfo: The metadata, or None if the blob does not exist.
+        """
+        raise NotImplementedError
+
+    def download(self, name: str, path: str) -> None:
+        """
+        Copies a blob to a local file.
+
+        Args:
+            name (str): The blob name.
+            path (str): The destination path.
+        """
+        raise NotImplementedError
+
+    def signed_url(self, name: str, expires_in: int) -> str:
+        """
+        Creates a URL granting read access to a blob for a limited time.
+
+        Args:
+            name (str): The blob name.
+            expires_in (int): Validity of the URL in seconds.
+
+        Returns:
+            str: The URL.
+        """
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        """
+        Deletes a blob. Missing blobs are ignored.
+        """
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        """
+        Returns whether a blob exists.
+        """
+        raise NotImplementedError
+
+
+class GCSStorage(StorageBackend):
+    """
+    Stores blobs in a Google Cloud Storage bucket. One client, and so one pool of
+    HTTP connections, is shared by every request and thread of the process.
+    """
+
+    def __init__(self, bucket_name: str, bucket=None):
+        if bucket is None:
+            from google.cloud import storage
+            bucket = storage.Client().bucket(bucket_name)
+        self.bucket = bucket
+
+    def put(self, name: str, path: str, content_type: str = None) -> None:
+        self.bucket.blob(name).upload_from_filename(path, content_type=content_type)
+
+    def put_bytes(self, name: str, data: bytes, content_type: str = None) -> None:
+        self.bucket.blob(name).upload_from_string(data, content_type=content_type)
+
+    def get_range(self, name: str, start: int = 0, end: int = None) -> bytes:
+        return self.bucket.blob(name).download_as_bytes(start=start, end=end)
+
+    def stat(self, name: str) -> BlobInfo:
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        return BlobInfo(blob.size, blob.etag, blob.updated, blob.content_type)
+
+    def download(self, name: str, path: str) -> None:
+        self.bucket.blob(name).download_to_filename(path)
+
+    def signed_url(self, name: str, expires_in: int) -> str:
+        return self.bucket.blob(name).generate_signed_url(version='v4', expiration=expires_in, method='GET')
+
+    def delete(self, name: str) -> None:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.bucket.blob(name).delete()
+        except NotFound:
+            pass
+
+    def exists(self, name: str) -> bool:
+        return self.bucket.blob(name).exists()
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stores blobs as files in a local directory, for development, tests and
+    benchmarks without a bucket. Signed URLs point at the app's own
+    `main.stream_file` route, so viewer links skip the proxy worker.
+    """
+
+    proxy_links = False
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        """
+        Returns the local path of a blob.
+
+        Raises:
+            ValueError: If the name points outside the storage directory.
+        """
+        path = os.path.abspath(os.path.join(self.root, name))
+        if os.path.dirname(path) != self.root:
+            raise ValueError(f'Invalid blob name: {name}')
+        return path
+
+    def put(self, name: str, path: str, content_type: str = None) -> None:
+        target = self.path(name)
+        # Copy under a temporary name so readers never see a partial blob
+        shutil.copyfile(path, target + '.part')
+        os.replace(target + '.part', target)
+
+    def put_bytes(self, name: str, data: bytes, content_type: str = None) -> None:
+        target = self.path(name)
+        with open(target + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.part', target)
+
+    def get_range(self, name: str, start: int = 0, end: int = None) -> bytes:
+        with open(self.path(name), 'rb') as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+    def iter_range(self, name: str, start: int, end: int, chunk_size: int):
+        with open(self.path(name), 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def stat(self, name: str) -> BlobInfo:
+        try:
+            st = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        updated = datetime.datetime.fromtimestamp(int(st.st_mtime), datetime.timezone.utc)
+        return BlobInfo(st.st_size, f'{st.st_mtime_ns:x}-{st.st_size:x}', updated, mimetypes.guess_type(name)[0])
+
+    def download(self, name: str, path: str) -> None:
+        shutil.copyfile(self.path(name), path)
+
+    def signed_url(self, name: str, expires_in: int) -> str:
+        return builtin_link(name, expires_in)
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+
+def get_storage() -> StorageBackend:
+    """
+    Returns the process-wide storage backend selected by `STORAGE_BACKEND`:
+    'gcs' (default) or 'local'.
+
+    Returns:
+        StorageBackend: The configured backend.
+    """
+    name = current_app.config.get('STORAGE_BACKEND', 'gcs')
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'gcs':
+                from config import Config
+                # Created here rather than at startup, so processes that never touch the bucket skip it
+                if getattr(Config, 'bucket', None) is None:
+                    Config.init_google_cloud_storage()
+                _backends[name] = GCSStorage(current_app.config['CLOUD_STORAGE_BUCKET'], Config.bucket)
+            elif name == 'local':
+                _backends[name] = LocalStorage(current_app.config['LOCAL_STORAGE_DIR'])
+            else:
+                raise ValueError(f'Unknown STORAGE_BACKEND: {name}')
+        return _backends[name]
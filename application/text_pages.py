@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+
+from flask import current_app
+from sqlalchemy.orm import load_only
+
+from .models import db, IssuePage
+
+# Pages read per query when streaming a document, so memory stays bounded on long issues
+PAGES_PER_QUERY = 8
+
+# Pages are joined with this separator in `NewspaperIssue.content` and in the served document
+SEPARATOR = b'\n'
+
+
+def encode_page_text(text: str, offset: int, brotli: bool = False) -> dict:
+    """
+    Precomputes what the text endpoints serve for one page: its size, ETag,
+    position in the whole document, and compressed forms.
+
+    Args:
+        text (str): The page text.
+        offset (int): Byte offset of the page in the whole document.
+        brotli (bool): Also compress with Brotli (needs the `brotli` package).
+
+    Returns:
+        dict: Values of the `text_*` columns of `IssuePage`.
+    """
+    raw = (text or '').encode('utf-8')
+    columns = {
+        'text_bytes': len(raw),
+        'text_offset': offset,
+        'text_etag': hashlib.sha1(raw).hexdigest(),
+        # mtime=0: the same text always gives the same bytes
+        'text_gzip': gzip.compress(raw, compresslevel=9, mtime=0),
+        'text_brotli': None,
+    }
+    if brotli:
+        import brotli as brotli_codec
+        columns['text_brotli'] = brotli_codec.compress(raw, mode=brotli_codec.MODE_TEXT, quality=11)
+    return columns
+
+
+def encoded_pages(pages: list) -> list:
+    """
+    Returns `encode_page_text` for each page of a document, with offsets as in
+    the pages joined by `SEPARATOR`. Brotli is used when `TEXT_BROTLI` is set.
+
+    Args:
+        pages (list[str]): The text of each page, in page order.
+
+    Returns:
+        list[dict]: The columns of each page.
+    """
+    brotli = current_app.config.get('TEXT_BROTLI', False)
+    offset = 0
+    encoded = []
+    for text in pages:
+        columns = encode_page_text(text, offset, brotli)
+        encoded.append(columns)
+        offset += columns['text_bytes'] + len(SEPARATOR)
+    return encoded
+
+
+class DocumentText:
+    """
+    The layout of an issue's text, read from the small `text_*` columns of its
+    pages: enough to answer ETag and Range requests without loading any text.
+    """
+
+    def __init__(self, issue_id: int, pages: list):
+        self.issue_id = issue_id
+        self.pages = pages  # (page_no, text_offset, text_bytes, text_etag), in page order
+        last = pages[-1]
+        self.length = last[1] + last[2]
+        self.etag = hashlib.sha1(''.join(page[3] for page in pages).encode()).hexdigest()
+
+    @classmethod
+    def load(cls, issue_id: int):
+        """
+        Returns the layout of an issue's text, or None if it has no pages or
+        some were stored before the text columns existed (see `prepare_page_text`).
+        """
+        pages = db.session.query(IssuePage.page_no, IssuePage.text_offset, IssuePage.text_bytes,
+                                 IssuePage.text_etag).filter(IssuePage.issue_id == issue_id).order_by(
+            IssuePage.page_no
+        ).all()
+        if not pages or any(page[3] is None for page in pages):
+            return None
+        return cls(issue_id, pages)
+
+    def iter_range(self, start: int, end: int):
+        """
+        Yields the bytes `start` to `end` (inclusive) of the document, reading
+        `PAGES_PER_QUERY` pages at a time.
+        """
+        wanted = [page for page in self.pages if page[1] <= end and page[1] + page[2] + len(SEPARATOR) > start]
+        last_page_no = self.pages[-1][0]
+        for i in range(0, len(wanted), PAGES_PER_QUERY):
+            batch = [page[0] for page in wanted[i:i + PAGES_PER_QUERY]]
+            texts = dict(db.session.query(IssuePage.page_no, IssuePage.text).filter(
+                IssuePage.issue_id == self.issue_id, IssuePage.page_no.in_(batch)
+            ))
+            for page_no, offset, _, _ in wanted[i:i + PAGES_PER_QUERY]:
+                chunk = (texts[page_no] or '').encode('utf-8')
+                if page_no != last_page_no:
+                    chunk += SEPARATOR
+                yield chunk[max(0, start - offset):end - offset + 1]
+
+
+def prepare_page_text(batch_size: int = 200, log=print) -> int:
+    """
+    Fills the `text_*` columns of pages stored before they existed, issue by
+    issue, so their text can be served by page and range.
+
+    Args:
+        batch_size (int): Issues committed together.
+        log (callable): Receives progress lines.
+
+    Returns:
+        int: The number of issues prepared.
+    """
+    issue_ids = [issue_id for (issue_id,) in db.session.query(IssuePage.issue_id).filter(
+        IssuePage.text_etag.is_(None)
+    ).distinct()]
+
+    done = 0
+    for issue_id in issue_ids:
+        pages = IssuePage.query.options(load_only(IssuePage.id, IssuePage.page_no, IssuePage.text)).filter_by(
+            issue_id=issue_id
+        ).order_by(IssuePage.page_no).all()
+        for page, columns in zip(pages, encoded_pages([page.text for page in pages])):
+            for name, value in columns.items():
+                setattr(page, name, value)
+        done += 1
+        if done % batch_size == 0:
+            db.session.commit()
+            db.session.expunge_all()
+            log(f'{done}/{len(issue_ids)} issues prepared')
+    db.session.commit()
+    return done
@@ -2,16 +2,20 @@ from flask import redirect, url_for, flash, current_app, abort
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 import uuid
-from google.cloud import storage
 from sqlalchemy import func
 import datetime
 from functools import wraps
-import markdown
 from datetime import timedelta
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, load_only
+import re
+from collections import defaultdict
+from markupsafe import Markup, escape
 
 from . import cache
-from .models import db, User, NewspaperIssue, Config, Category
+from .caching import tag_cached, invalidate_tags, issue_tags, ALL_ISSUES_TAG, CORPUS_TAG
+from .search import get_search_backend
+from .storage import get_storage
+from .models import db, User, NewspaperIssue, Config, Category, IssuePage, IssueCount
 from .forms import *
 
     # List of month names
@@ -43,7 +47,7 @@ def get_stopwords() -> set:
     return set()
 
 
-@cache.cached(key_prefix='get_issue_date_interval', timeout=86400)
+@tag_cached(tags=lambda: ['archive'])
 def get_issue_date_interval() -> tuple:
     """
     Retrieves the earliest and latest issued dates of newspaper issues.
@@ -83,26 +87,77 @@ def get_about_markdown() -> str:
     # Convert the 'About' content to HTML if it exists
     about_html = ""
     if config and config.about_content:
+        import markdown  # Only needed on a cache miss of the About page
         about_html = markdown.markdown(config.about_content)
     
     return about_html
 
 
-@cache.cached(key_prefix="get_archive", timeout=86400)
-def get_archive() -> list:
+def issue_summaries():
     """
-    Retrieves a list of newspaper issues that the current user has permission to view,
-    ordered by issued time in descending order.
+    Builds the query used by every listing of issues. It loads only the columns
+    listings display and joins the category in the same statement, so the
+    multi-megabyte `content` column is never read.
 
     Returns:
-        list: A list of `NewspaperIssue` objects that the current user can view.
+        Query: A `NewspaperIssue` query to add filters and ordering to.
     """
-    # Query for issues the current user can view
-    issues = NewspaperIssue.query.filter(
-        NewspaperIssue.view_power <= current_user.view_power
-    ).order_by(NewspaperIssue.issued_time.desc()).all()
-    
-    return issues
+    return NewspaperIssue.query.options(
+        load_only(
+            NewspaperIssue.id,
+            NewspaperIssue.title,
+            NewspaperIssue.author,
+            NewspaperIssue.issued_time,
+            NewspaperIssue.view_power,
+            NewspaperIssue.file_blob,
+            NewspaperIssue.category_id,
+        ),
+        joinedload(NewspaperIssue.category),
+    )
+
+@tag_cached(tags=lambda view_power: ['archive'])
+def get_archive_calendar(view_power: int) -> dict:
+    """
+    Counts the issues a user with the given view power can see, per year and month.
+    Reads the `IssueCount` rollup, never the issues themselves.
+
+    Args:
+        view_power (int): The view power of the user.
+
+    Returns:
+        dict: Maps year to a dict mapping month to the number of issues, both
+        as ints, years newest first and months in calendar order.
+    """
+    rows = db.session.query(IssueCount.year, IssueCount.month, func.sum(IssueCount.count)).filter(
+        IssueCount.view_power <= view_power
+    ).group_by(IssueCount.year, IssueCount.month).all()
+
+    calendar = defaultdict(dict)
+    for year, month, count in sorted(rows, key=lambda row: (-row[0], row[1])):
+        if count:
+            calendar[year][month] = int(count)
+    return dict(calendar)
+
+@tag_cached(tags=lambda year, month, view_power: [f'month:{year:04d}-{month:02d}'])
+def get_month_day_counts(year: int, month: int, view_power: int) -> dict:
+    """
+    Counts the issues a user with the given view power can see on each day of a month.
+    Reads the `IssueCount` rollup, never the issues themselves.
+
+    Args:
+        year (int): The year.
+        month (int): The month.
+        view_power (int): The view power of the user.
+
+    Returns:
+        dict: Maps day of the month to the number of issues, for days with issues.
+    """
+    rows = db.session.query(IssueCount.day, func.sum(IssueCount.count)).filter(
+        IssueCount.year == year,
+        IssueCount.month == month,
+        IssueCount.view_power <= view_power
+    ).group_by(IssueCount.day).all()
+    return {day: int(count) for day, count in rows if count}
 
 
 def remove_stopwords(query: str) -> str:
@@ -124,66 +179,130 @@ def clean_query(query: str) -> str:
     query=remove_stopwords(query).lower()
     return query
 
-def create_signed_url(file_blob: str, tmp_blob_name: str = "") -> str:
+def query_terms(query: str) -> list:
     """
-    Generates a signed URL for a file in Google Cloud Storage and caches it.
+    Splits a cleaned query into plain search terms, dropping the boolean-mode
+    operators MySQL accepts in MATCH() queries.
 
     Args:
-        file_blob (str): The path to the file blob in the storage bucket.
-        tmp_blob_name (str): A temporary name used as a key in the cache.
+        query (str): The query after `clean_query`.
 
     Returns:
-        str: The generated signed URL for the file.
+        list[str]: The terms, in query order.
     """
-    client = storage.Client()
-    bucket = client.bucket(current_app.config['CLOUD_STORAGE_BUCKET'])
-    blob = bucket.blob(file_blob)
+    return [term for term in re.split(r'[\s+\-*"()~<>@]+', query) if term]
 
-    # Generate signed URL
-    signed_url = blob.generate_signed_url(
-        version="v4",
-        expiration=timedelta(minutes=current_app.config['FILE_LINK_EXPIRE_TIME_SEC']),  # Set link expiration time
-        method='GET'
-    )
-    return signed_url
+def make_snippet(page_text: str, terms: list, width: int = 160) -> Markup:
+    """
+    Cuts a short excerpt of a page around the first occurrence of any term and
+    highlights the terms in it.
+
+    Args:
+        page_text (str): The text of the page.
+        terms (list[str]): Lower-cased search terms.
+        width (int): Approximate length of the excerpt in characters.
 
-@cache.memoize(timeout=86400)
-def get_year_month_issues(year: int,month: int) -> NewspaperIssue:
+    Returns:
+        Markup: The HTML-escaped excerpt with terms wrapped in `<mark>`.
+    """
+    text_lower = page_text.lower()
+    positions = [pos for pos in (text_lower.find(term) for term in terms) if pos >= 0]
+    first = min(positions) if positions else 0
+
+    start = max(0, first - width // 3)
+    end = min(len(page_text), start + width)
+    excerpt = ' '.join(page_text[start:end].split())
+
+    if terms:
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        parts, last = [], 0
+        for found in pattern.finditer(excerpt):
+            parts.append(escape(excerpt[last:found.start()]))
+            parts.append(Markup('<mark>%s</mark>') % found.group(0))
+            last = found.end()
+        parts.append(escape(excerpt[last:]))
+        highlighted = Markup('').join(parts)
+    else:
+        highlighted = escape(excerpt)
+
+    prefix = Markup('&hellip;') if start > 0 else Markup('')
+    suffix = Markup('&hellip;') if end < len(page_text) else Markup('')
+    return prefix + highlighted + suffix
+
+def get_page_hits(issue_ids: list, query: str, pages_per_issue: int = 3) -> dict:
     """
-    Retrieves all newspaper issues for a specific year and month that the current user is authorized to view.
+    Finds the pages of the given issues that match a full-text query.
 
-    This function filters issues based on the provided year and month, ensuring that the user's view power 
-    is sufficient to access the issues. The results are cached for 24 hours (86400 seconds) to improve performance.
+    Only matching pages are read, so callers never need an issue's whole text.
 
     Args:
-        year (int): The year for which issues are to be retrieved.
-        month (int): The month for which issues are to be retrieved.
+        issue_ids (list[int]): The issues to look in, e.g. one page of search results.
+        query (str): The query after `clean_query`.
+        pages_per_issue (int): The maximum number of hits returned per issue.
 
     Returns:
-        list[NewspaperIssue]: A list of newspaper issues ordered by their issued time in ascending order.
+        dict: Maps issue id to a list of `{'page_no': int, 'snippet': Markup}`,
+        ordered by page number.
+    """
+    hits = defaultdict(list)
+    if not issue_ids or not query:
+        return hits
+
+    terms = query_terms(query)
+    rows = db.session.query(IssuePage.issue_id, IssuePage.page_no, IssuePage.text).filter(
+        IssuePage.issue_id.in_(issue_ids),
+        get_search_backend().page_filter(query)
+    ).order_by(IssuePage.issue_id, IssuePage.page_no)
+
+    for issue_id, page_no, page_text in rows:
+        if len(hits[issue_id]) < pages_per_issue:
+            hits[issue_id].append({'page_no': page_no, 'snippet': make_snippet(page_text or '', terms)})
+    return hits
+
+def get_first_matching_page(issue_id: int, query: str) -> int:
+    """
+    Returns the number of the first page of an issue that matches a full-text query.
 
-    Caching:
-        The result of this function is cached for 24 hours to minimize redundant database queries.
+    Args:
+        issue_id (int): The ID of the newspaper issue.
+        query (str): The query after `clean_query`.
+
+    Returns:
+        int: The 1-based page number, or None if no page matches.
     """
-    issues = NewspaperIssue.query.filter(
-        db.extract('year', NewspaperIssue.issued_time) == year,
-        db.extract('month', NewspaperIssue.issued_time) == month,
-        NewspaperIssue.view_power <= current_user.view_power
-    ).order_by(NewspaperIssue.issued_time.asc()).all()
-    return issues
+    return db.session.query(func.min(IssuePage.page_no)).filter(
+        IssuePage.issue_id == issue_id,
+        get_search_backend().page_filter(query)
+    ).scalar()
+
+def create_signed_url(file_blob: str, tmp_blob_name: str = "") -> str:
+    """
+    Generates a signed URL for a file in the configured storage backend.
 
-@cache.memoize(timeout=86400)
-def get_day_issues(year: int, month: int, day: int) -> list:
+    Args:
+        file_blob (str): The path to the file blob in the storage bucket.
+        tmp_blob_name (str): A temporary name used as a key in the cache.
+
+    Returns:
+        str: The generated signed URL for the file.
     """
-    Retrieves all newspaper issues for a specific year, month, and day that the current user is authorized to view.
+    # Generate signed URL
+    expiration = timedelta(minutes=current_app.config['FILE_LINK_EXPIRE_TIME_SEC'])  # Set link expiration time
+    return get_storage().signed_url(file_blob, int(expiration.total_seconds()))
+
+@tag_cached(tags=lambda year, month, day, view_power: [f'day:{year:04d}-{month:02d}-{day:02d}'])
+def get_day_issues(year: int, month: int, day: int, view_power: int) -> list:
+    """
+    Retrieves all newspaper issues for a specific year, month, and day that a user with the given view power can view.
 
     This function filters issues based on the provided year, month, and day, ensuring that the user's view power
-    is sufficient to access the issues. The results are cached for 24 hours (86400 seconds) to improve performance.
+    is sufficient to access the issues. The results are cached for 24 hours (86400 seconds) per view power.
 
     Args:
         year (int): The year for which issues are to be retrieved.
         month (int): The month for which issues are to be retrieved.
         day (int): The day for which issues are to be retrieved.
+        view_power (int): The view power of the user.
 
     Returns:
         list[NewspaperIssue]: A list of newspaper issues ordered by their issued time in ascending order.
@@ -191,20 +310,22 @@ def get_day_issues(year: int, month: int, day: int) -> list:
     Caching:
         The result of this function is cached for 24 hours to minimize redundant database queries.
     """
-    issues = NewspaperIssue.query.filter(
-        db.extract('year', NewspaperIssue.issued_time) == year,
-        db.extract('month', NewspaperIssue.issued_time) == month,
-        db.extract('day', NewspaperIssue.issued_time) == day,
-        NewspaperIssue.view_power <= current_user.view_power
-    ).order_by(NewspaperIssue.issued_time.asc()).all()
+    # A half-open range on the bare column, so the database can seek in its index
+    start = datetime.date(year, month, day)
+    issues = issue_summaries().filter(
+        NewspaperIssue.issued_time >= start,
+        NewspaperIssue.issued_time < start + timedelta(days=1),
+        NewspaperIssue.view_power <= view_power
+    ).order_by(NewspaperIssue.issued_time.asc(), NewspaperIssue.id.asc()).all()
     return issues
 
 
-@cache.memoize(timeout=86400)
+@tag_cached(tags=lambda issue_id: [f'issue:{issue_id}'], result_tags=lambda issue: [f'category:{issue.category_id}'])
 def get_issue(issue_id: int) -> NewspaperIssue:
     """
     Retrieves a NewspaperIssue object from the database using its ID.
-    The result is cached for 24 hours (86400 seconds).
+    The result is cached for 24 hours (86400 seconds). Like listings, it does
+    not load `content`; the text is served by page from `IssuePage` (see `text_pages`).
 
     Args:
         issue_id (int): The ID of the newspaper issue to retrieve.
@@ -215,10 +336,10 @@ def get_issue(issue_id: int) -> NewspaperIssue:
     Raises:
         werkzeug.exceptions.NotFound: If no issue is found with the given ID.
     """
-    issue = NewspaperIssue.query.options(joinedload(NewspaperIssue.category)).get_or_404(issue_id)
+    issue = issue_summaries().filter(NewspaperIssue.id == issue_id).first_or_404()
     return issue
 
-@cache.cached(key_prefix="get_all_category", timeout=86400)
+@tag_cached(tags=lambda: ['categories'])
 def get_all_category():
     return Category.query.all()
 
@@ -232,7 +353,7 @@ def get_db_signed_url(blob_name: str) -> str:
     Returns:
         str: The signed URL if it exists in the cache, otherwise None.
     """
-    return cache.get("signed_url"+blob_name)
+    return cache.get("signed_url:" + blob_name)
 
 def admin_required(f):
     """
@@ -262,42 +383,37 @@ def ini_users() -> None:
         db.session.add(admin_user)
         db.session.commit()
 
-def update_cache(modified_issue: NewspaperIssue) -> None:
+def update_cache(modified_issue: NewspaperIssue = None, stale_tags: list = ()) -> None:
     """
     Updates the application cache to ensure consistency after a newspaper issue is modified.
 
-    This function invalidates cache entries that might be affected by changes to the 
-    given issue, ensuring stale data is removed. Specifically, it clears cached results for:
-    - Issue retrieval by ID, date ranges, and specific time intervals (year, month, day).
-    - Functions retrieving the archive or related metadata like issue date intervals.
-    - Category-related functions to reflect potential changes in categorization.
+    Cache entries are tagged (see `caching.tag_cached`), so invalidating the
+    issue's tags drops every entry it can appear in, for every view power:
+    - `issue:<id>`: `get_issue`.
+    - `day:<date>` / `month:<year-month>`: `get_day_issues`, `get_month_day_counts`.
+    - `category:<id>`: entries showing the issue's category.
+    - `archive`: `get_archive_calendar`, `get_issue_date_interval`.
+    - `corpus`: moves search results to a new generation (`search_cache`).
 
     Args:
         modified_issue (NewspaperIssue): The newspaper issue object that was modified.
-
-    Cache Entries Invalidated:
-        - `get_issue_date_interval`: Clears the date range cache.
-        - `get_archive`: Clears the entire archive cache.
-        - `get_issue`: Clears the cache for the specific issue by ID.
-        - `get_year_month_issues`: Clears cached issues for the issue's year and month.
-        - `get_day_issues`: Clears cached issues for the issue's specific day.
-        - `get_all_category`: Clears category-related caches in case of category updates.
+            If None with no `stale_tags` (e.g. after a bulk import), the entries of
+            every issue are cleared.
+        stale_tags (list[str]): Tags the issue had before the change (see `caching.issue_tags`),
+            so entries for its old date or category are dropped as well. For a
+            deleted issue, pass its tags and no `modified_issue`.
 
     Returns:
         None
     """
-    cache.delete('get_issue_date_interval')
-    cache.delete('get_archive')
-    cache.delete_memoized(get_issue, modified_issue.id)
-    cache.delete_memoized(
-        get_year_month_issues,
-        modified_issue.issued_time.year,
-        modified_issue.issued_time.month
-    )
-    cache.delete_memoized(
-        get_day_issues,
-        modified_issue.issued_time.year,
-        modified_issue.issued_time.month,
-        modified_issue.issued_time.day
-    )
-    cache.delete('get_all_category')
+    if modified_issue is None and not stale_tags:
+        invalidate_tags(ALL_ISSUES_TAG, CORPUS_TAG, 'categories')
+    elif modified_issue is None:
+        invalidate_tags(*stale_tags)
+    else:
+        invalidate_tags(*issue_tags(modified_issue), *stale_tags)
+
+    # Recompute the purged pages before visitors ask for them
+    if current_app.config.get('WARMUP_AFTER_WRITES', True):
+        from .warmup import schedule_warmup
+        schedule_warmup()
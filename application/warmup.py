@@ -0,0 +1,132 @@
+import time
+from threading import Lock, Timer
+
+from flask import current_app
+
+from .models import db, User, IssueCount
+from .utils import (get_issue_date_interval, get_about_markdown, get_all_category, get_stopwords,
+                    get_archive_calendar, get_month_day_counts, get_day_issues)
+from .previews import get_month_cover_blobs
+
+_scheduled = False
+_scheduled_lock = Lock()
+
+
+def viewer_tiers() -> list:
+    """
+    Returns every tier cached pages are computed for: the view powers of the
+    users, plus 0 for anonymous visitors (see `caching.current_tier`).
+
+    Returns:
+        list[int]: The tiers, lowest first.
+    """
+    return sorted({0, *(view_power for (view_power,) in db.session.query(User.view_power).distinct())})
+
+
+def _recent_months(count: int) -> list:
+    return db.session.query(IssueCount.year, IssueCount.month).filter(IssueCount.count > 0).distinct().order_by(
+        IssueCount.year.desc(), IssueCount.month.desc()
+    ).limit(count).all()
+
+
+def _warmup_tasks(months: int):
+    """
+    Yields the cached calls to make, most visited pages first: the landing
+    page, then the archive calendar of every tier, then the recent months'
+    calendars and covers, then the day listings of the latest month.
+    """
+    yield get_issue_date_interval
+    yield get_about_markdown
+    yield get_all_category
+    yield get_stopwords
+
+    tiers = viewer_tiers()
+    for tier in tiers:
+        yield lambda tier=tier: get_archive_calendar(tier)
+
+    recent = _recent_months(months)
+    for year, month in recent:
+        for tier in tiers:
+            yield lambda year=year, month=month, tier=tier: get_month_day_counts(year, month, tier)
+            yield lambda year=year, month=month, tier=tier: get_month_cover_blobs(year, month, tier)
+
+    if recent:
+        year, month = recent[0]
+        days = [day for (day,) in db.session.query(IssueCount.day).filter_by(year=year, month=month).distinct()]
+        for day in sorted(days, reverse=True):
+            for tier in tiers:
+                yield lambda day=day, tier=tier: get_day_issues(year, month, day, tier)
+
+
+def warm_cache(months: int = None, budget_sec: float = None, log=None) -> dict:
+    """
+    Fills the cache with the data of the most visited pages, for every tier, so
+    the first visitors after a deploy or a content change do not pay for it.
+    Entries that are still valid are cache hits and cost almost nothing.
+
+    Args:
+        months (int): Recent months to warm; defaults to `WARMUP_MONTHS`.
+        budget_sec (float): Stops starting new work after this many seconds;
+            defaults to `WARMUP_BUDGET_SEC`.
+        log (callable): Receives a summary line.
+
+    Returns:
+        dict: `calls` made, whether the budget `exhausted` them, and `seconds` taken.
+    """
+    config = current_app.config
+    months = config.get('WARMUP_MONTHS', 3) if months is None else months
+    budget_sec = config.get('WARMUP_BUDGET_SEC', 10) if budget_sec is None else budget_sec
+
+    started = time.monotonic()
+    calls = 0
+    exhausted = False
+    for task in _warmup_tasks(months):
+        if time.monotonic() - started > budget_sec:
+            exhausted = True
+            break
+        task()
+        calls += 1
+
+    result = {'calls': calls, 'exhausted': exhausted, 'seconds': round(time.monotonic() - started, 3)}
+    if log is not None:
+        log(f"Cache warm-up: {calls} calls in {result['seconds']}s" + (' (budget exhausted)' if exhausted else ''))
+    return result
+
+
+def _run_scheduled(app) -> None:
+    global _scheduled
+    with _scheduled_lock:
+        # Cleared before running, so a write during this run schedules another
+        _scheduled = False
+    with app.app_context():
+        try:
+            warm_cache(log=app.logger.info)
+        except Exception as e:
+            app.logger.warning(f'Cache warm-up failed: {e}')
+        finally:
+            db.session.remove()
+
+
+def schedule_warmup(delay: float = None) -> bool:
+    """
+    Runs `warm_cache` on a background thread after `WARMUP_DELAY_SEC`, unless a
+    run is already waiting; writes in quick succession (a bulk edit, an import)
+    are covered by one run.
+
+    Args:
+        delay (float): Seconds to wait; defaults to `WARMUP_DELAY_SEC`.
+
+    Returns:
+        bool: True if a new run was scheduled.
+    """
+    global _scheduled
+    app = current_app._get_current_object()
+    with _scheduled_lock:
+        if _scheduled:
+            return False
+        _scheduled = True
+
+    timer = Timer(app.config.get('WARMUP_DELAY_SEC', 2) if delay is None else delay, _run_scheduled, args=(app,))
+    timer.daemon = True
+    timer.start()
+    return True
@@ -0,0 +1,117 @@
+"""
+Checks the ETag handling of the archive pages (see `application/http_cache.py`).
+
+For the landing page (anonymous and logged in), the archive, a month and a
+day, the page is fetched once, then again with `If-None-Match`. The second
+request must be a 304 that sends no database query beyond loading the session
+user (none at all for anonymous pages, or with `--cache` set to the shared
+`TieredCache`, which caches the session user). After an issue is
+published, the same validator must get a full 200 again. The month and day
+pages must also answer another month's or day's ETag with a full 200. Reported per page:
+the status and query count of both requests, their latency, and the
+`Cache-Control` sent. The exit status is 1 if any check fails.
+
+    python -m benchmarks.conditional_pages --issues 2000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+from application import db
+from application.caching import shared_cache_enabled
+from application.models import NewspaperIssue, Category
+from application.rollup import adjust_issue_counts, issue_count_key
+from application.utils import update_cache
+from benchmarks.corpus import CorpusGenerator, USER_PASSWORD, generate
+from benchmarks.routes import make_route_app, login, QueryCounter
+
+
+def fetch(client, url: str, counter: QueryCounter, etag: str = None) -> dict:
+    before = counter.count
+    started = time.perf_counter()
+    response = client.get(url, headers={'If-None-Match': etag} if etag else {})
+    return {
+        'status': response.status_code,
+        'queries': counter.count - before,
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+        'etag': response.headers.get('ETag'),
+        'cache_control': response.headers.get('Cache-Control'),
+    }
+
+
+def publish_issue() -> None:
+    issue = NewspaperIssue(title='Published', issued_time=datetime.date(2024, 6, 3), file_blob='new.pdf',
+                           view_power=1, category=Category.query.first())
+    db.session.add(issue)
+    db.session.flush()
+    adjust_issue_counts(added=issue_count_key(issue))
+    db.session.commit()
+    update_cache(issue)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=2000)
+    parser.add_argument('--cache', default='SimpleCache', help='CACHE_TYPE, e.g. application.shared_cache.TieredCache')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='miniarchive_etag_')
+    app = make_route_app(workdir, 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'), 'index',
+                         CACHE_TYPE=args.cache, CACHE_SHARED_TYPE='FileSystemCache',
+                         CACHE_DIR=os.path.join(workdir, 'cache'))
+
+    with app.app_context():
+        generate(CorpusGenerator(issues=args.issues))
+        latest = db.session.query(NewspaperIssue.issued_time).order_by(NewspaperIssue.issued_time.desc()).first()[0]
+        counter = QueryCounter(db.engine)
+        session_user_cached = shared_cache_enabled()
+
+    # Requests run outside any app context: a request reuses an active one, and
+    # with it `g`, including the user of earlier requests
+    clients = {'anonymous': app.test_client(), 'reader': login(app, 'reader1_0', USER_PASSWORD)}
+    pages = [
+        ('landing (anonymous)', 'anonymous', '/'),
+        ('landing', 'reader', '/'),
+        ('archive', 'reader', '/archive'),
+        ('month_view', 'reader', f'/archive/{latest.year}/{latest.month}'),
+        ('day_view', 'reader', f'/archive/{latest.year}/{latest.month}/{latest.day}'),
+    ]
+
+    report = {}
+    for name, client, url in pages:
+        first = fetch(clients[client], url, counter)
+        report[name] = {'url': url, 'first': first, 'revalidated': fetch(clients[client], url, counter, first['etag'])}
+
+    # Pages of one endpoint must not accept each other's validators
+    for name, client, url in pages:
+        if name in ('month_view', 'day_view'):
+            other = url.rsplit('/', 1)[0] + '/' + str(int(url.rsplit('/', 1)[1]) % 12 + 1)
+            report[name]['other_url'] = fetch(clients[client], other, counter, report[name]['first']['etag'])
+
+    with app.app_context():
+        publish_issue()
+    for name, client, url in pages:
+        report[name]['after_publish'] = fetch(clients[client], url, counter, report[name]['first']['etag'])
+
+    failures = []
+    for (name, client, _), result in zip(pages, report.values()):
+        allowed = 0 if client == 'anonymous' or session_user_cached else 1
+        if result['revalidated']['status'] != 304:
+            failures.append(f'{name}: revalidation returned {result["revalidated"]["status"]}')
+        if result['revalidated']['queries'] > allowed:
+            failures.append(f'{name}: the 304 sent {result["revalidated"]["queries"]} queries')
+        if result.get('other_url', {}).get('status') == 304:
+            failures.append(f'{name}: another URL accepted its ETag')
+        if result['after_publish']['status'] != 200:
+            failures.append(f'{name}: still {result["after_publish"]["status"]} after a publish')
+
+    print(json.dumps({'ok': not failures, 'cache': args.cache, 'failures': failures, 'pages': report}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Fills an empty database with a synthetic archive, reproducibly from a seed.
+
+The corpus looks like a school newspaper archive that grew over the years:
+- issues come out on weekdays, more of them in recent years;
+- a few hundred recurring authors, some much more prolific than others;
+- most issues are public (view power 1) and a few are restricted to higher tiers;
+- the text uses a Zipf-distributed vocabulary, and its size follows a lognormal
+  distribution around `--content-kb`.
+
+Users are created for every tier, next to the admin account. The rollup
+(`IssueCount`) is rebuilt at the end, as `flask init` would.
+
+    python -m benchmarks.corpus --issues 100000 --database-uri sqlite:////tmp/corpus.sqlite
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import time
+
+from werkzeug.security import generate_password_hash
+
+from application import db
+from application.models import NewspaperIssue, Category, User
+from application.rollup import rebuild_issue_counts
+from benchmarks.common import make_bench_app
+
+CATEGORIES = ['News', 'Features', 'Opinion', 'Sports', 'Arts', 'Science', 'Campus Life', 'Interviews',
+              'Letters', 'Special Edition', 'Alumni', 'Supplement']
+FIRST_NAMES = ['Alex', 'Bella', 'Chen', 'Daniel', 'Elena', 'Farah', 'George', 'Hana', 'Ivan', 'Julia', 'Kenji',
+               'Lena', 'Marco', 'Nadia', 'Oscar', 'Priya', 'Quinn', 'Rosa', 'Samir', 'Tara', 'Umar', 'Vera',
+               'Wei', 'Xenia', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Anderson', 'Brown', 'Costa', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Huang', 'Ivanova', 'Jensen',
+              'Kim', 'Li', 'Martin', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Schmidt', 'Tanaka', 'Wang']
+# Share of issues per view power; users are created with the same tiers
+TIER_WEIGHTS = {1: 70, 2: 15, 3: 8, 4: 4, 5: 3}
+USERS_PER_TIER = 2
+USER_PASSWORD = 'benchmark'
+BATCH_SIZE = 2000
+
+
+def _vocabulary(rng: random.Random, size: int) -> list:
+    letters = 'etaoinshrdlucmfwypvbgkjqxz'
+    weights = [len(letters) - i for i in range(len(letters))]
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(letters, weights, k=rng.randint(2, 11))))
+    return sorted(words, key=lambda word: (len(word), word))  # short words are the frequent ones, as in real text
+
+
+class CorpusGenerator:
+    """
+    Produces the rows of the synthetic archive. Every value is drawn from one
+    `random.Random(seed)`, so the same seed and sizes give the same corpus.
+    """
+
+    def __init__(self, seed: int = 42, issues: int = 10000, years: int = 30, content_kb: float = 4.0,
+                 vocabulary: int = 20000):
+        self.rng = random.Random(seed)
+        self.issues = issues
+        self.content_kb = content_kb
+        self.end = datetime.date(2024, 12, 31)
+        self.start = self.end - datetime.timedelta(days=365 * years)
+        self.words = _vocabulary(self.rng, vocabulary)
+        self.word_weights = list(_cumulative(1 / rank for rank in range(1, vocabulary + 1)))
+        self.authors = [f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}'
+                        for _ in range(max(20, min(2000, issues // 200)))]
+        self.author_weights = list(_cumulative(1 / rank ** 0.8 for rank in range(1, len(self.authors) + 1)))
+
+    def issued_time(self) -> datetime.date:
+        # sqrt: the archive grows, so recent years hold more issues
+        span = (self.end - self.start).days
+        day = self.start + datetime.timedelta(days=int(span * math.sqrt(self.rng.random())))
+        if day.weekday() >= 5:
+            day -= datetime.timedelta(days=day.weekday() - 4)  # published on the Friday before
+        return day
+
+    def text(self) -> str:
+        size = min(self.rng.lognormvariate(math.log(self.content_kb * 1024), 0.6), self.content_kb * 1024 * 8)
+        words = self.rng.choices(self.words, cum_weights=self.word_weights, k=max(1, int(size / 6.5)))
+        return ' '.join(words)
+
+    def title(self) -> str:
+        words = self.rng.choices(self.words, cum_weights=self.word_weights, k=self.rng.randint(2, 7))
+        return ' '.join(words).capitalize()
+
+    def issue_rows(self, category_ids: list):
+        tiers, tier_weights = list(TIER_WEIGHTS), list(TIER_WEIGHTS.values())
+        for i in range(self.issues):
+            yield {
+                'title': self.title(),
+                'author': self.rng.choices(self.authors, cum_weights=self.author_weights)[0],
+                'content': self.text(),
+                'issued_time': self.issued_time(),
+                'file_blob': f'bench-{i:08d}.pdf',
+                'view_power': self.rng.choices(tiers, tier_weights)[0],
+                'category_id': self.rng.choice(category_ids),
+            }
+
+    def query_terms(self, count: int) -> list:
+        """
+        Returns search terms as users would type them: mostly mid-frequency
+        words, sometimes two of them or a prefix.
+        """
+        rng = random.Random(self.rng.random())
+        pool = self.words[len(self.words) // 100:len(self.words) // 5]
+        terms = []
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.6:
+                terms.append(rng.choice(pool))
+            elif roll < 0.9:
+                terms.append(f'{rng.choice(pool)} {rng.choice(pool)}')
+            else:
+                terms.append(rng.choice(pool)[:3] + '*')
+        return terms
+
+
+def _cumulative(values):
+    total = 0.0
+    for value in values:
+        total += value
+        yield total
+
+
+def generate(generator: CorpusGenerator, log=None) -> dict:
+    """
+    Writes the corpus of `generator` to the database of the current app.
+
+    Args:
+        generator (CorpusGenerator): The corpus to write.
+        log (callable): Receives progress lines.
+
+    Returns:
+        dict: Row counts and the seconds taken.
+    """
+    started = time.perf_counter()
+    categories = [Category(name=name) for name in CATEGORIES]
+    db.session.add_all(categories)
+    password_hash = generate_password_hash(USER_PASSWORD)
+    db.session.add_all([User(username=f'reader{tier}_{n}', password_hash=password_hash, view_power=tier)
+                        for tier in TIER_WEIGHTS for n in range(USERS_PER_TIER)])
+    db.session.commit()
+
+    table = NewspaperIssue.__table__
+    batch = []
+    written = 0
+    for row in generator.issue_rows([category.id for category in categories]):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            written += len(batch)
+            batch = []
+            if log is not None and written % (BATCH_SIZE * 25) == 0:
+                log(f'{written} issues written')
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        written += len(batch)
+
+    rebuild_issue_counts()
+    return {
+        'issues': written,
+        'categories': len(categories),
+        'users': len(TIER_WEIGHTS) * USERS_PER_TIER,
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--content-kb', type=float, default=4.0, help='median text size of an issue')
+    parser.add_argument('--database-uri', help='an empty database to fill; defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri)
+    with app.app_context():
+        report = generate(CorpusGenerator(args.seed, args.issues, content_kb=args.content_kb))
+        report['database_uri'] = str(db.engine.url)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Checks `application/http_client.py` against a local stub upstream.
+
+A threaded HTTP server on localhost answers fixed paths with 200, 403, 500
+and 503 responses, slow responses and a few failures before a success. The
+client is driven through: a plain success, retries that recover, read
+timeouts, a closed port, a 4xx answer, the breaker opening and failing fast
+without reaching the server, a half-open trial that succeeds, and a trial
+that fails with an error raised outside `requests` (a broken transport
+adapter), which must not leave the breaker stuck open. Reported per
+scenario: what was expected and what happened. The exit status is 1 if any
+scenario fails.
+
+    python -m benchmarks.http_client
+"""
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import BaseAdapter
+
+from application.http_client import HTTPClient, CircuitBreaker, CircuitOpenError
+
+SLOW_SEC = 0.5
+READ_TIMEOUT_SEC = 0.2
+RESET_SEC = 0.3
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    hits = Counter()
+    flaky_failures = 2  # 503s sent before /flaky succeeds
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        StubHandler.hits[path] += 1
+        if path == '/slow':
+            time.sleep(SLOW_SEC)
+        status = {'/forbidden': 403, '/down': 500, '/busy': 503}.get(path, 200)
+        if path == '/flaky' and StubHandler.hits[path] <= StubHandler.flaky_failures:
+            status = 503
+        body = b'{}'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out first
+
+    def log_message(self, *args):
+        pass
+
+
+class BrokenAdapter(BaseAdapter):
+    """A transport failing with an error `requests` does not wrap."""
+
+    def send(self, request, **kwargs):
+        raise RuntimeError('adapter failure')
+
+    def close(self):
+        pass
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_client(retries: int = 2, failure_threshold: int = 5) -> HTTPClient:
+    client = HTTPClient(connect_timeout=0.5, read_timeout=READ_TIMEOUT_SEC, retries=retries, backoff=0.01,
+                        breaker=CircuitBreaker(failure_threshold, RESET_SEC))
+    client.session.mount('http://broken.invalid/', BrokenAdapter())
+    return client
+
+
+def outcome(client: HTTPClient, url: str):
+    """Returns the status of a call, or the name of the exception it raised."""
+    try:
+        return client.get(url).status_code
+    except Exception as e:
+        return type(e).__name__
+
+
+def scenarios(base: str) -> list:
+    results = []
+
+    def check(name, expected, actual):
+        results.append({'scenario': name, 'expected': expected, 'actual': actual, 'ok': expected == actual})
+
+    client = make_client()
+    check('success', [200, 'closed', 1], [outcome(client, base + '/ok'), client.breaker.state, client.stats()['ok']])
+
+    client = make_client()
+    check('retries recover', [200, 2], [outcome(client, base + '/flaky'), client.stats().get('retries')])
+
+    client = make_client(retries=1)
+    check('read timeout', ['ReadTimeout', 2],
+          [outcome(client, base + '/slow'), client.stats().get('timeouts')])
+
+    client = make_client(retries=0)
+    check('connection refused', ['ConnectionError', 1],
+          [outcome(client, f'http://127.0.0.1:{closed_port()}/ok'), client.stats().get('connection_errors')])
+
+    client = make_client()
+    before = StubHandler.hits['/forbidden']
+    status = outcome(client, base + '/forbidden')
+    stats = client.stats()
+    check('4xx counted apart, not retried', [403, 1, 0, 1, 'closed'],
+          [status, StubHandler.hits['/forbidden'] - before, stats.get('ok', 0),
+           stats.get('client_error_statuses'), client.breaker.state])
+
+    client = make_client(retries=0, failure_threshold=2)
+    outcome(client, base + '/down')
+    outcome(client, base + '/down')
+    before = StubHandler.hits['/down']
+    check('breaker opens and fails fast', ['open', 'CircuitOpenError', 0],
+          [client.breaker.state, outcome(client, base + '/down'), StubHandler.hits['/down'] - before])
+
+    time.sleep(RESET_SEC)
+    check('half-open trial success closes', ['half-open', 200, 'closed'],
+          [client.breaker.state, outcome(client, base + '/ok'), client.breaker.state])
+
+    client = make_client(retries=0, failure_threshold=1)
+    outcome(client, base + '/busy')
+    time.sleep(RESET_SEC)
+    trial = outcome(client, 'http://broken.invalid/ok')
+    state = client.breaker.state
+    time.sleep(RESET_SEC)
+    check('trial failing outside requests reopens', ['RuntimeError', 'open', 200, 'closed', 1],
+          [trial, state, outcome(client, base + '/ok'), client.breaker.state, client.stats().get('unexpected_errors')])
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = scenarios(f'http://127.0.0.1:{server.server_address[1]}')
+    finally:
+        server.shutdown()
+
+    failures = [result['scenario'] for result in results if not result['ok']]
+    print(json.dumps({'ok': not failures, 'failures': failures, 'scenarios': results}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
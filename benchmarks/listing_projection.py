@@ -0,0 +1,80 @@
+"""
+Compares loading full `NewspaperIssue` rows with the `issue_summaries()`
+projection used by the listing routes.
+
+    python -m benchmarks.listing_projection --issues 2000 --content-kb 256
+"""
+import argparse
+import datetime
+import json
+import random
+import time
+import tracemalloc
+
+from application import db
+from sqlalchemy.orm import undefer
+from application.models import NewspaperIssue, Category
+from application.utils import issue_summaries
+from benchmarks.common import make_bench_app
+
+
+def seed(issues: int, content_kb: int) -> None:
+    rng = random.Random(42)
+    categories = [Category(name=f'Category {i}') for i in range(5)]
+    db.session.add_all(categories)
+    text = ('lorem ipsum dolor sit amet ' * (content_kb * 1024 // 27 + 1))[:content_kb * 1024]
+    for i in range(issues):
+        db.session.add(NewspaperIssue(
+            title=f'Issue {i}',
+            author=f'Author {rng.randrange(50)}',
+            content=text,
+            issued_time=datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(9000)),
+            file_blob=f'{i:016d}.pdf',
+            view_power=rng.randint(0, 5),
+            category=rng.choice(categories),
+        ))
+    db.session.commit()
+
+
+def measure(build_query) -> dict:
+    db.session.expunge_all()
+    query = build_query().order_by(NewspaperIssue.issued_time.desc())
+
+    # Bytes the database hands over for this statement
+    fetched = sum(len(str(value)) for row in db.session.connection().execute(query.statement) for value in row if value is not None)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = query.all()
+    categories = {row.category.name for row in rows}  # What listing templates touch
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'rows': len(rows),
+        'categories': len(categories),
+        'seconds': round(elapsed, 4),
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'fetched_mb': round(fetched / 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=2000)
+    parser.add_argument('--content-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    app = make_bench_app()
+    with app.app_context():
+        seed(args.issues, args.content_kb)
+        # Full rows, as the listing routes loaded them before
+        full = measure(lambda: NewspaperIssue.query.options(undefer(NewspaperIssue.content)))
+        summary = measure(issue_summaries)
+
+    print(json.dumps({'issues': args.issues, 'content_kb': args.content_kb, 'full': full, 'summary': summary}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Checks the routes for N+1 query patterns.
+
+The app runs with `QUERY_AUDIT` on (see `application/query_audit.py`) against
+a small synthetic archive (see `benchmarks.corpus`). Every page is requested
+as an admin, and the category and user management forms are submitted with
+every row confirmed and the empty categories marked for deletion, so loops
+over listed or submitted rows show up as repeated queries. Any query shape sent `--threshold` times or more within
+one request is reported, and the exit status is 1, so the check can run in
+CI after route or template changes.
+
+    python -m benchmarks.n_plus_one --issues 2000 --threshold 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from werkzeug.security import generate_password_hash
+
+from application import db
+from application.models import NewspaperIssue, Category, User
+from application.query_audit import audit_findings
+from application.search import get_search_backend
+from benchmarks.corpus import CorpusGenerator, generate
+from benchmarks.routes import make_route_app, login
+
+EXTRA_USERS = 20
+EMPTY_CATEGORIES = 8  # submitted for deletion, which checks each for issues
+
+
+def pages(generator: CorpusGenerator) -> list:
+    issue = db.session.query(NewspaperIssue).order_by(NewspaperIssue.issued_time.desc()).first()
+    day = issue.issued_time
+    term = generator.query_terms(1)[0]
+    return [
+        '/',
+        '/archive',
+        f'/archive/{day.year}/{day.month}',
+        f'/archive/{day.year}/{day.month}/{day.day}',
+        f'/search?q={term}',
+        f'/search?q={term}&page=2',
+        f'/search?author={issue.author}',
+        f'/view_document/{issue.id}',
+        f'/view_text/{issue.id}',
+        f'/edit_issue/{issue.id}',
+        '/admin',
+        '/admin/upload',
+        '/admin/manage_categories',
+        '/admin/manage_users',
+        '/admin/ingest_jobs',
+        '/admin/stopwords',
+        '/admin/edit_about',
+    ]
+
+
+def category_form() -> dict:
+    data = {}
+    for i, category in enumerate(Category.query.filter(Category.name != 'Uncategorized').all()):
+        data.update({
+            f'categories-{i}-category_id': category.id,
+            f'categories-{i}-category_name': category.name,
+            f'categories-{i}-category_description': category.description or '',
+            f'categories-{i}-confirm': 'y',
+        })
+        if category.name.startswith('Empty '):
+            data[f'categories-{i}-delete'] = 'y'
+    return data
+
+
+def user_form() -> dict:
+    data = {}
+    for i, user in enumerate(User.query.filter(User.role != 'admin').all()):
+        data.update({
+            f'users-{i}-user_id': user.id,
+            f'users-{i}-username': user.username,
+            f'users-{i}-view_power': user.view_power,
+            f'users-{i}-confirm': 'y',
+        })
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=2000)
+    parser.add_argument('--threshold', type=int, default=5, help='repetitions of one query shape that fail the check')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='miniarchive_nplusone_')
+    app = make_route_app(workdir, 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'), 'index',
+                         QUERY_AUDIT=True, QUERY_AUDIT_THRESHOLD=args.threshold)
+
+    generator = CorpusGenerator(issues=args.issues)
+    with app.app_context():
+        generate(generator)
+        password_hash = generate_password_hash('benchmark')
+        db.session.add_all([User(username=f'extra{n}', password_hash=password_hash, view_power=n % 6)
+                            for n in range(EXTRA_USERS)])
+        db.session.add_all([Category(name=f'Empty {n}') for n in range(EMPTY_CATEGORIES)])
+        db.session.commit()
+        get_search_backend().rebuild()
+        urls = pages(generator)
+        forms = [('/admin/manage_categories', category_form()), ('/admin/manage_users', user_form())]
+
+    # Requests run outside any app context: a request reuses an active one, and
+    # with it `g`, including the user of earlier requests
+    admin = login(app, app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD'])
+    requests = [('GET', url, admin.get(url).status_code) for url in urls]
+    for url, data in forms:
+        requests.append(('POST', url, admin.post(url, data=data).status_code))
+
+    findings = audit_findings()
+    print(json.dumps({
+        'ok': not findings,
+        'threshold': args.threshold,
+        'requests': [{'method': method, 'url': url, 'status': status} for method, url, status in requests],
+        'findings': findings,
+    }, indent=2))
+    sys.exit(1 if findings else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Measures what the ingest-time PDF optimization (`application.optimize`) saves:
+file size, and the time until a viewer streaming the file can show page 1.
+
+Time to first page is modelled as the bytes a viewer must receive before page
+1 is complete, sent over `--mbps`, plus the local time to render page 1. For a
+linearized file these are the bytes up to the end of the first-page section
+(the /E entry of its linearization dictionary); otherwise the whole file, as
+the cross-reference table sits at its end.
+
+Without `--corpus`, a sample corpus of scanner-like PDFs (one high-resolution
+JPEG per page, as archive scans usually are) is generated first.
+
+    python -m benchmarks.pdf_optimization --documents 5 --pages 8
+    python -m benchmarks.pdf_optimization --corpus /path/to/pdfs
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from application.optimize import optimize_pdf
+
+
+def generate_corpus(directory: str, documents: int, pages: int) -> list:
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(42)
+    paths = []
+    for i in range(documents):
+        images = []
+        for _ in range(pages):
+            # 300 dpi A4-ish page: paper grain, columns of "text" lines
+            image = Image.effect_noise((2480, 3508), 12).convert('RGB').point(lambda v: 200 + v // 8)
+            draw = ImageDraw.Draw(image)
+            for column in range(3):
+                left = 150 + column * 740
+                for top in range(250, 3300, 48):
+                    width = rng.randint(400, 680)
+                    draw.rectangle((left, top, left + width, top + 22), fill=(40, 35, 30))
+            images.append(image.filter(ImageFilter.GaussianBlur(1)))
+        path = os.path.join(directory, f'sample_{i:03d}.pdf')
+        images[0].save(path, save_all=True, append_images=images[1:], resolution=300, quality=92)
+        paths.append(path)
+    return paths
+
+
+def first_page_bytes(path: str) -> int:
+    with open(path, 'rb') as f:
+        head = f.read(2048)
+    match = re.search(rb'/Linearized.*?/E\s+(\d+)', head, re.S)
+    return int(match.group(1)) if match else os.path.getsize(path)
+
+
+def render_first_page(path: str) -> float:
+    import pdfplumber
+
+    started = time.perf_counter()
+    with pdfplumber.open(path) as pdf:
+        pdf.pages[0].to_image(resolution=96)
+    return time.perf_counter() - started
+
+
+def measure(path: str, mbps: float) -> dict:
+    needed = first_page_bytes(path)
+    render = render_first_page(path)
+    return {
+        'bytes': os.path.getsize(path),
+        'first_page_bytes': needed,
+        'time_to_first_page_ms': round((needed * 8 / (mbps * 1e6) + render) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of PDFs; a sample corpus is generated if omitted')
+    parser.add_argument('--documents', type=int, default=5)
+    parser.add_argument('--pages', type=int, default=8)
+    parser.add_argument('--mbps', type=float, default=10.0, help='modelled download bandwidth')
+    parser.add_argument('--image-quality', type=int, default=75)
+    parser.add_argument('--max-image-side', type=int, default=2400)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='miniarchive_bench_')
+    if args.corpus:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if name.lower().endswith('.pdf'))
+    else:
+        paths = generate_corpus(workdir, args.documents, args.pages)
+
+    documents = []
+    for path in paths:
+        target = os.path.join(workdir, 'optimized_' + os.path.basename(path))
+        started = time.perf_counter()
+        result = optimize_pdf(path, target, args.image_quality, args.max_image_side)
+        elapsed = time.perf_counter() - started
+        documents.append({
+            'file': os.path.basename(path),
+            'optimize_seconds': round(elapsed, 3),
+            'images_recompressed': result['images_recompressed'],
+            'original': measure(path, args.mbps),
+            'optimized': measure(target, args.mbps),
+        })
+
+    def total(version, key):
+        return sum(document[version][key] for document in documents)
+
+    def median(version):
+        return statistics.median(document[version]['time_to_first_page_ms'] for document in documents)
+
+    print(json.dumps({
+        'documents': len(documents),
+        'mbps': args.mbps,
+        'original_bytes': total('original', 'bytes'),
+        'optimized_bytes': total('optimized', 'bytes'),
+        'saved_ratio': round(1 - total('optimized', 'bytes') / total('original', 'bytes'), 3) if documents else None,
+        'median_time_to_first_page_ms': {'original': median('original'), 'optimized': median('optimized')} if documents else None,
+        'per_document': documents,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Checks the proxy tokens of `application/proxy_tokens.py` against the worker.
+
+A fixed set of tokens is minted in Python: a round trip, expired and
+just-expiring tokens, tampered signatures and payloads, a wrong secret,
+malformed and short tokens, and correctly signed payloads with bad claims.
+Each is checked with `verify_token` and with `verifyToken` from
+`worker/file_proxy_worker.js`, run in Node. Reported per case: the expected
+blob (or null), and what each verifier returned. The exit status is 1 if
+either verifier gives an unexpected answer, so the check can run in CI after
+changes to either side.
+
+    python -m benchmarks.proxy_tokens
+    python -m benchmarks.proxy_tokens --node /usr/local/bin/node
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from application.proxy_tokens import mint_token, verify_token, _b64encode, _signature
+
+SECRET = 'check-secret'
+NOW = 1_700_000_000
+WORKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'worker', 'file_proxy_worker.js')
+
+# Reads the cases from stdin and prints what the worker's verifier returns for each
+NODE_SCRIPT = """
+import { verifyToken } from %s;
+let input = '';
+for await (const chunk of process.stdin) input += chunk;
+const results = [];
+for (const c of JSON.parse(input)) results.push(await verifyToken(c.token, c.secret, c.now));
+console.log(JSON.stringify(results));
+"""
+
+
+def signed(claims) -> str:
+    """Returns a correctly signed token for any payload, bypassing `mint_token`."""
+    payload = _b64encode(claims if isinstance(claims, bytes) else json.dumps(claims).encode())
+    return f'{payload}.{_signature(payload, SECRET)}'
+
+
+def cases() -> list:
+    token = mint_token('2024/issue 1.pdf', NOW + 60, SECRET)
+    payload, signature = token.split('.')
+    flipped = signature[:-1] + ('A' if signature[-1] != 'A' else 'B')
+    other_payload = mint_token('2024/other.pdf', NOW + 60, SECRET).split('.')[0]
+    return [
+        ('round trip', token, SECRET, NOW, '2024/issue 1.pdf'),
+        ('round trip, non-ASCII blob', mint_token('archives/café é.pdf', NOW + 60, SECRET), SECRET, NOW,
+         'archives/café é.pdf'),
+        ('expires this second', token, SECRET, NOW + 60, '2024/issue 1.pdf'),
+        ('expired', token, SECRET, NOW + 61, None),
+        ('tampered signature', f'{payload}.{flipped}', SECRET, NOW, None),
+        ('truncated signature', f'{payload}.{signature[:-4]}', SECRET, NOW, None),
+        ('payload swapped', f'{other_payload}.{signature}', SECRET, NOW, None),
+        ('wrong secret', token, 'another-secret', NOW, None),
+        ('extra segment', f'{token}.x', SECRET, NOW, None),
+        ('empty', '', SECRET, NOW, None),
+        ('dot only', '.', SECRET, NOW, None),
+        ('no signature', payload, SECRET, NOW, None),
+        ('empty signature', f'{payload}.', SECRET, NOW, None),
+        ('empty payload', f'.{signature}', SECRET, NOW, None),
+        ('short', 'x', SECRET, NOW, None),
+        ('non-ASCII', 'é.é', SECRET, NOW, None),
+        ('signed, not base64', f'!!.{_signature("!!", SECRET)}', SECRET, NOW, None),
+        ('signed, not JSON', signed(b'not json'), SECRET, NOW, None),
+        ('signed, not an object', signed(['a.pdf', NOW + 60]), SECRET, NOW, None),
+        ('signed, no expiry', signed({'b': 'a.pdf'}), SECRET, NOW, None),
+        ('signed, no blob', signed({'e': NOW + 60}), SECRET, NOW, None),
+        ('signed, expiry as string', signed({'b': 'a.pdf', 'e': str(NOW + 60)}), SECRET, NOW, None),
+        ('signed, expiry as boolean', signed({'b': 'a.pdf', 'e': True}), SECRET, 0, None),
+        ('signed, blob as number', signed({'b': 5, 'e': NOW + 60}), SECRET, NOW, None),
+    ]
+
+
+def worker_results(node: str, checked: list) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        # .mjs: the worker is an ES module, and Node would load a .js file as CommonJS
+        module = os.path.join(workdir, 'file_proxy_worker.mjs')
+        shutil.copyfile(WORKER, module)
+        result = subprocess.run(
+            [node, '--input-type=module', '-e', NODE_SCRIPT % json.dumps('file://' + module)],
+            input=json.dumps([{'token': token, 'secret': secret, 'now': now} for _, token, secret, now, _ in checked]),
+            capture_output=True, text=True, check=True,
+        )
+    return json.loads(result.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--node', default=shutil.which('node'), help='Node.js 18+ binary running the worker code')
+    args = parser.parse_args()
+    if not args.node:
+        parser.error('Node.js is needed to run the worker verifier; pass --node')
+
+    checked = cases()
+    worker = worker_results(args.node, checked)
+    report = []
+    failures = []
+    for (name, token, secret, now, expected), from_worker in zip(checked, worker):
+        from_python = verify_token(token, secret, now)
+        report.append({'case': name, 'expected': expected, 'python': from_python, 'worker': from_worker})
+        if from_python != expected:
+            failures.append(f'{name}: verify_token returned {from_python!r}, expected {expected!r}')
+        if from_worker != expected:
+            failures.append(f'{name}: the worker returned {from_worker!r}, expected {expected!r}')
+
+    print(json.dumps({'ok': not failures, 'failures': failures, 'cases': report}, indent=2, ensure_ascii=False))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
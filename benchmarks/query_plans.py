@@ -0,0 +1,130 @@
+"""
+Checks that the date listing queries use the indexes of `newspaper_issue`.
+
+The statements the listing functions actually send are captured and run again
+under EXPLAIN (`EXPLAIN QUERY PLAN` on SQLite). Any plan that reads the whole
+`newspaper_issue` table without an index is reported, and the exit status is 1,
+so the check can run in CI after schema or query changes.
+
+    python -m benchmarks.query_plans --issues 5000
+    python -m benchmarks.query_plans --database-uri mysql+pymysql://user:pw@localhost/newspaper_bench
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+
+from sqlalchemy import event, text
+
+from application import db
+from application.models import NewspaperIssue, Category
+from application.pagination import seek_page
+from application.previews import get_month_cover_blobs
+from application.utils import get_day_issues
+from benchmarks.common import make_bench_app
+
+
+def seed(issues: int) -> None:
+    rng = random.Random(42)
+    categories = [Category(name=f'Category {i}') for i in range(5)]
+    db.session.add_all(categories)
+    for i in range(issues):
+        db.session.add(NewspaperIssue(
+            title=f'Issue {i}',
+            author=f'Author {rng.randrange(50)}',
+            issued_time=datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(9000)),
+            file_blob=f'{i:016d}.pdf',
+            view_power=rng.randint(0, 5),
+            category=rng.choice(categories),
+        ))
+    db.session.commit()
+    if db.engine.dialect.name in ('mysql', 'sqlite'):
+        # Give the planner statistics, as a long-running database has
+        db.session.execute(text('ANALYZE TABLE newspaper_issue' if db.engine.dialect.name == 'mysql' else 'ANALYZE'))
+        db.session.commit()
+
+
+def capture(run) -> list:
+    """
+    Runs a callable and returns the SELECT statements it sent, with their parameters.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(statement: str, parameters) -> tuple:
+    """
+    Returns the plan of a statement as text lines, and whether it scans
+    `newspaper_issue` without an index.
+    """
+    cursor = db.session.connection().connection.cursor()
+    if db.engine.dialect.name == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        lines = [row[-1] for row in cursor.fetchall()]
+        full_scan = any(line.split(' USING')[0].strip() in ('SCAN newspaper_issue', 'SCAN TABLE newspaper_issue')
+                        for line in lines)
+    else:
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        lines = [f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row.get('Extra') or ''}" for row in rows]
+        full_scan = any(row['table'] == 'newspaper_issue' and row['type'] == 'ALL' for row in rows)
+    cursor.close()
+    return lines, full_scan
+
+
+def listing_queries() -> dict:
+    issued = db.session.query(NewspaperIssue.issued_time).filter(NewspaperIssue.issued_time.isnot(None)).first()[0]
+    start, end = datetime.date(2005, 1, 1), datetime.date(2010, 12, 31)
+
+    def search_page(*filters):
+        query = db.session.query(NewspaperIssue.id, NewspaperIssue.issued_time).filter(
+            NewspaperIssue.view_power <= 3, NewspaperIssue.issued_time.between(start, end), *filters
+        )
+        return lambda: seek_page(query, 15, 1000)
+
+    return {
+        'day_issues': lambda: get_day_issues.uncached(issued.year, issued.month, issued.day, 3),
+        'month_covers': lambda: get_month_cover_blobs.uncached(issued.year, issued.month, 3),
+        'search_by_date': search_page(),
+        'search_by_category': search_page(NewspaperIssue.category_id == 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=5000)
+    parser.add_argument('--database-uri', help='an empty database to seed; defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri)
+    report = {}
+    failed = False
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        seed(args.issues)
+        for name, run in listing_queries().items():
+            plans = []
+            for statement, parameters in capture(run):
+                lines, full_scan = explain(statement, parameters)
+                failed = failed or full_scan
+                plans.append({'plan': lines, 'full_scan': full_scan})
+            report[name] = plans
+
+    print(json.dumps({'dialect': dialect, 'ok': not failed, 'queries': report}, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
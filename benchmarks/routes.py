@@ -0,0 +1,268 @@
+"""
+Measures the hot routes of the app against a synthetic archive (see
+`benchmarks.corpus`): search, archive, month_view, day_view, view_document
+and upload.
+
+The whole app is built by `create_app` and driven through the Flask test client,
+logged in as readers of every tier. External services are replaced by local
+stand-ins: files go to the local storage backend in a temporary directory,
+and without a proxy worker URL the app serves its own `/file/<token>` links.
+
+Reported per route: latency percentiles (p50/p95/p99, and the first request,
+before the cache holds anything), database queries per request, errors, and
+the peak RSS of the process once the route has run. The report is JSON, so
+runs at different sizes or commits can be compared with a diff or a script.
+
+    python -m benchmarks.routes --issues 10000 --requests 200
+    python -m benchmarks.routes --issues 100000 --cache NullCache --output routes-100k.json
+
+A 1M-issue corpus takes a while to generate; write it once with
+`benchmarks.corpus --database-uri ...` and pass the same `--database-uri` here.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+from sqlalchemy import event, func
+
+from application import create_app, db
+from application.models import NewspaperIssue, IssueCount
+from application.search import get_search_backend
+from benchmarks.corpus import CorpusGenerator, TIER_WEIGHTS, USER_PASSWORD, generate
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def sample_pdf() -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 800), 'white').save(buffer, 'PDF')
+    return buffer.getvalue()
+
+
+class QueryCounter:
+    """
+    Counts the statements the benchmark thread sends; background threads
+    (ingestion jobs, cache warm-up) are left out.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self.thread = threading.get_ident()
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, *args) -> None:
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+def login(app, username: str, password: str):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'Could not log in as {username}')
+    return client
+
+
+class Workload:
+    """
+    Builds the requests of every route from the corpus in the database: real
+    dates, visible issues and search terms drawn from the corpus vocabulary.
+    """
+
+    def __init__(self, app, generator: CorpusGenerator, seed: int):
+        self.rng = random.Random(seed)
+        self.readers = {tier: login(app, f'reader{tier}_0', USER_PASSWORD) for tier in TIER_WEIGHTS}
+        self.admin = login(app, app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD'])
+        self.terms = generator.query_terms(500)
+        self.days = db.session.query(IssueCount.year, IssueCount.month, IssueCount.day).filter(
+            IssueCount.count > 0
+        ).distinct().all()
+        self.months = sorted({(year, month) for year, month, _ in self.days})
+        first, last = db.session.query(func.min(NewspaperIssue.id), func.max(NewspaperIssue.id)).one()
+        sample = [self.rng.randint(first, last) for _ in range(1000)]
+        self.documents = db.session.query(NewspaperIssue.id, NewspaperIssue.view_power).filter(
+            NewspaperIssue.id.in_(sample)
+        ).all()
+        self.categories = [category_id for (category_id,) in db.session.query(NewspaperIssue.category_id).distinct()]
+        self.pdf = sample_pdf()
+        self.uploads = 0
+
+    def reader(self):
+        return self.readers[self.rng.choice(list(self.readers))]
+
+    def search(self):
+        params = {'q': self.rng.choice(self.terms)}
+        roll = self.rng.random()
+        if roll < 0.2:
+            params['category'] = self.rng.choice(self.categories)
+        elif roll < 0.4:
+            year = self.rng.choice(self.months)[0]
+            params['issued_time_start'] = f'{year}-01-01'
+            params['issued_time_end'] = f'{year}-12-31'
+        if self.rng.random() < 0.2:
+            params['page'] = 2
+        return self.reader().get('/search', query_string=params)
+
+    def archive(self):
+        return self.reader().get('/archive')
+
+    def month_view(self):
+        # Recent months are visited most
+        year, month = self.months[-1 - min(len(self.months) - 1, int(self.rng.expovariate(1 / 6)))]
+        return self.reader().get(f'/archive/{year}/{month}')
+
+    def day_view(self):
+        year, month, day = self.rng.choice(self.days)
+        return self.reader().get(f'/archive/{year}/{month}/{day}')
+
+    def view_document(self):
+        issue_id, view_power = self.rng.choice(self.documents)
+        tier = view_power if view_power in self.readers else max(self.readers)
+        return self.readers[tier].get(f'/view_document/{issue_id}')
+
+    def upload(self):
+        self.uploads += 1
+        return self.admin.post('/admin/upload', data={
+            'title': f'Benchmark upload {self.uploads}',
+            'author': 'Benchmark',
+            'issued_time': (datetime.date(2024, 1, 1) + datetime.timedelta(days=self.uploads % 365)).isoformat(),
+            'view_power': 1,
+            'category': self.categories[0],
+            'file': (io.BytesIO(self.pdf), f'upload{self.uploads}.pdf', 'application/pdf'),
+        }, content_type='multipart/form-data')
+
+
+def make_route_app(workdir: str, database_uri: str, search_backend: str, **config):
+    """
+    Creates the full app with local stand-ins for the external services: files
+    in `workdir`, no proxy worker, and no CSRF so forms can be posted directly.
+    """
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'BOOTSTRAP_ON_STARTUP': True,
+        'SECRET_KEY': 'bench',
+        'WTF_CSRF_ENABLED': False,
+        'SESSION_COOKIE_SECURE': False,
+        'CACHE_NO_NULL_WARNING': True,
+        'WARMUP_AFTER_WRITES': False,
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_DIR': os.path.join(workdir, 'storage'),
+        'CLOUDFLARE_PROXY_WORKER_URL': '',
+        'FILE_PROXY_SECRET': '',
+        'SEARCH_BACKEND': search_backend,
+        'SEARCH_INDEX_DIR': os.path.join(workdir, 'search_index'),
+        'INGEST_WORKERS': 1,
+        'INGEST_SPOOL_DIR': os.path.join(workdir, 'spool'),
+        'PREVIEW_CACHE_DIR': os.path.join(workdir, 'previews'),
+        **config,
+    })
+
+
+ROUTES = ['archive', 'month_view', 'day_view', 'search', 'view_document', 'upload']
+
+
+def measure(workload: Workload, name: str, requests: int, counter: QueryCounter) -> dict:
+    call = getattr(workload, name)
+    latencies = []
+    queries = []
+    errors = 0
+    for _ in range(requests):
+        before = counter.count
+        started = time.perf_counter()
+        response = call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+        errors += response.status_code not in (200, 302)
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'first_ms': round(latencies[0], 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries_per_request': round(sum(queries) / requests, 2),
+        'max_queries': max(queries),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=10000, help='corpus size, when the database is empty')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--content-kb', type=float, default=4.0, help='median text size of an issue')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--cache', default='SimpleCache', help="CACHE_TYPE; 'NullCache' measures every request cold")
+    parser.add_argument('--search-backend', choices=['index', 'mysql'],
+                        help="defaults to 'mysql' on MySQL databases and 'index' otherwise")
+    parser.add_argument('--database-uri', help='a database to use, filled with the corpus if empty; '
+                                               'defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='miniarchive_routes_')
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(workdir, 'bench.sqlite')
+    search_backend = args.search_backend or ('mysql' if database_uri.startswith('mysql') else 'index')
+    app = make_route_app(workdir, database_uri, search_backend, CACHE_TYPE=args.cache)
+
+    generator = CorpusGenerator(args.seed, args.issues, content_kb=args.content_kb)
+    with app.app_context():
+        setup = {}
+        if db.session.query(func.count(NewspaperIssue.id)).scalar() == 0:
+            setup['corpus'] = generate(generator)
+        if search_backend == 'index':
+            started = time.perf_counter()
+            setup['indexed_documents'] = get_search_backend().rebuild()
+            setup['index_seconds'] = round(time.perf_counter() - started, 1)
+        issues = db.session.query(func.count(NewspaperIssue.id)).scalar()
+        workload = Workload(app, generator, args.seed)
+        engine = db.engine
+        db.session.remove()
+
+    # Requests run outside any app context: a request reuses an active one, and
+    # with it `g`, including the user of earlier requests
+    counter = QueryCounter(engine)
+    results = {}
+    for name in args.routes:
+        results[name] = measure(workload, name, args.requests, counter)
+        print(f'{name}: p50 {results[name]["p50_ms"]} ms', file=sys.stderr)
+
+    report = {
+        'issues': issues,
+        'seed': args.seed,
+        'cache': args.cache,
+        'database': database_uri.split(':', 1)[0],
+        'search_backend': search_backend,
+        'python': platform.python_version(),
+        'setup': setup,
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
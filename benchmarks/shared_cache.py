@@ -0,0 +1,147 @@
+"""
+Compares cache backends across worker processes: the per-process SimpleCache,
+a shared FileSystemCache (a local stand-in for Redis), and TieredCache over
+that shared store.
+
+Each worker process reads cached archive data (calendars and month counts for
+several view powers). Then one worker publishes an issue and calls
+`update_cache`, and every worker checks whether it sees the new issue.
+Reported per backend: the hit rate (database queries avoided), the mean
+latency of a cached call, and how many workers still served stale data.
+
+    python -m benchmarks.shared_cache --processes 4 --calls 2000
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import event, func
+
+from application import db
+from application.models import NewspaperIssue, Category
+from application.rollup import rebuild_issue_counts, adjust_issue_counts, issue_count_key
+from application.utils import get_archive_calendar, get_month_day_counts, update_cache
+from benchmarks.common import make_bench_app
+
+TIERS = [0, 1, 2, 5, 100]
+CHECK_SEC = 0.2
+
+
+def seed(issues: int) -> None:
+    rng = random.Random(42)
+    category = Category(name='Category')
+    db.session.add(category)
+    for i in range(issues):
+        db.session.add(NewspaperIssue(
+            title=f'Issue {i}',
+            issued_time=datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(1500)),
+            file_blob=f'{i:016d}.pdf',
+            view_power=rng.randint(0, 5),
+            category=category,
+        ))
+    db.session.commit()
+    rebuild_issue_counts()
+
+
+def visible_total(calendar: dict) -> int:
+    return sum(count for months in calendar.values() for count in months.values())
+
+
+def worker(rank: int, database_uri: str, cache_config: dict, calls: int, expected: int, barrier, results) -> None:
+    app = make_bench_app(database_uri, WARMUP_AFTER_WRITES=False, **cache_config)
+    with app.app_context():
+        queries = [0]
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.__setitem__(0, queries[0] + 1))
+        rng = random.Random(rank)
+
+        barrier.wait()
+        started = time.perf_counter()
+        for _ in range(calls):
+            tier = rng.choice(TIERS)
+            if rng.random() < 0.3:
+                get_archive_calendar(tier)
+            else:
+                get_month_day_counts(rng.choice([2020, 2021, 2022, 2023]), rng.randint(1, 12), tier)
+        elapsed = time.perf_counter() - started
+        read_queries = queries[0]
+
+        barrier.wait()
+        if rank == 0:
+            issue = NewspaperIssue(title='Published', issued_time=datetime.date(2023, 6, 1), file_blob='new.pdf',
+                                   view_power=0, category_id=1)
+            db.session.add(issue)
+            db.session.flush()
+            adjust_issue_counts(added=issue_count_key(issue))
+            db.session.commit()
+            update_cache(issue)
+        barrier.wait()
+        time.sleep(CHECK_SEC * 2)
+
+        results.put({
+            'rank': rank,
+            'queries': read_queries,
+            'hit_rate': 1 - read_queries / calls,
+            'mean_call_us': elapsed / calls * 1e6,
+            'stale': visible_total(get_archive_calendar(0)) != expected,
+        })
+
+
+def run(name: str, cache_config: dict, database_uri: str, processes: int, calls: int, expected: int) -> dict:
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(rank, database_uri, cache_config, calls, expected, barrier, results))
+               for rank in range(processes)]
+    for process in workers:
+        process.start()
+    reports = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+
+    return {
+        'backend': name,
+        'hit_rate': round(sum(report['hit_rate'] for report in reports) / processes, 4),
+        'database_queries': sum(report['queries'] for report in reports),
+        'mean_call_us': round(sum(report['mean_call_us'] for report in reports) / processes, 1),
+        'stale_processes': sum(report['stale'] for report in reports),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=2000, help='cached calls per process')
+    parser.add_argument('--issues', type=int, default=3000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='miniarchive_bench_')
+    database_uri = 'sqlite:///' + os.path.join(workdir, 'bench.sqlite')
+    app = make_bench_app(database_uri)
+    with app.app_context():
+        seed(args.issues)
+        visible = db.session.query(func.count(NewspaperIssue.id)).filter(NewspaperIssue.view_power <= 0).scalar()
+
+    backends = {
+        'SimpleCache': {'CACHE_TYPE': 'SimpleCache'},
+        'FileSystemCache': {'CACHE_TYPE': 'FileSystemCache', 'CACHE_DIR': os.path.join(workdir, 'shared')},
+        'TieredCache': {'CACHE_TYPE': 'application.shared_cache.TieredCache', 'CACHE_SHARED_TYPE': 'FileSystemCache',
+                        'CACHE_DIR': os.path.join(workdir, 'tiered'), 'CACHE_L1_CHECK_SEC': CHECK_SEC},
+    }
+    reports = []
+    for name, cache_config in backends.items():
+        # Each run publishes one issue; start every backend from the same data
+        database_copy = os.path.join(workdir, f'{name}.sqlite')
+        shutil.copyfile(os.path.join(workdir, 'bench.sqlite'), database_copy)
+        reports.append(run(name, cache_config, 'sqlite:///' + database_copy, args.processes, args.calls, visible + 1))
+
+    print(json.dumps({'processes': args.processes, 'calls_per_process': args.calls, 'results': reports}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
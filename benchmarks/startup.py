@@ -0,0 +1,73 @@
+"""
+Measures the cold start of a worker: importing the app package and running
+`create_app()`, in fresh interpreters, as gunicorn and Cloud Run do.
+
+It fails (exit status 1) if the median exceeds `--max-ms`, or if startup
+imports a library that only some requests need. Those must be imported
+lazily on the paths that use them.
+
+    python -m benchmarks.startup --runs 5 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Libraries that only some requests or background jobs need
+LAZY_MODULES = ['google.cloud.storage', 'pdfplumber', 'pikepdf', 'PIL.Image', 'markdown']
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = {database_uri!r}
+config.Config.STORAGE_BACKEND = 'local'
+from application import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (done - imported) * 1000,
+    'modules': [name for name in {lazy_modules!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure(database_uri: str) -> dict:
+    probe = PROBE.format(database_uri=database_uri, lazy_modules=LAZY_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the median startup is slower')
+    parser.add_argument('--database-uri', help='defaults to a new temporary SQLite file; create_app does not connect to it')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='miniarchive_bench_'), 'bench.sqlite')
+    runs = [measure(database_uri) for _ in range(args.runs)]
+    total = statistics.median(run['import_ms'] + run['create_app_ms'] for run in runs)
+    eager = sorted({name for run in runs for name in run['modules']})
+
+    failed = bool(eager) or (args.max_ms is not None and total > args.max_ms)
+    print(json.dumps({
+        'runs': args.runs,
+        'median_import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+        'median_create_app_ms': round(statistics.median(run['create_app_ms'] for run in runs), 1),
+        'median_total_ms': round(total, 1),
+        'max_ms': args.max_ms,
+        'eagerly_imported': eager,
+        'ok': not failed,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+// Requests carrying these cookies belong to a logged-in user and are never served from the edge cache
+const SESSION_COOKIES = /(?:^|;\s*)(?:session|remember_token)=/;
+
 export default {
   async fetch(request, env, ctx) {
     // The target Cloud Run URL
@@ -9,12 +12,30 @@ export default {
     target.pathname = url.pathname;
     target.search = url.search;
 
+    // Anonymous GETs may be answered from the edge cache. The app marks the pages
+    // it allows this for with `Cache-Control: public, s-maxage=...`; the cache
+    // also answers `If-None-Match` with 304 using the app's ETag.
+    const cache = caches.default;
+    const cacheable = request.method === "GET" && !SESSION_COOKIES.test(request.headers.get("Cookie") || "");
+    if (cacheable) {
+      const cached = await cache.match(request);
+      if (cached) {
+        return cached;
+      }
+    }
+
     // Create a request object with the original headers, pointing to the new target URL
     const proxyRequest = new Request(target.toString(), request);
 
     // Fetch the response from the Cloud Run service
     const response = await fetch(proxyRequest);
 
+    // Store public pages; responses setting cookies are personal and skipped
+    const cacheControl = response.headers.get("Cache-Control") || "";
+    if (cacheable && response.status === 200 && /\bpublic\b/.test(cacheControl) && !response.headers.has("Set-Cookie")) {
+      ctx.waitUntil(cache.put(request, response.clone()));
+    }
+
     // Return the response, passing through the headers and status from Cloud Run
     return new Response(response.body, response);
   },
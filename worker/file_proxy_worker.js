@@ -3,13 +3,22 @@ export default {
     const url = new URL(request.url);
     const pathname = url.pathname;
 
+    if (request.method === "OPTIONS") {
+      // CORS preflight: pdf.js on the app's domain fetches byte ranges from here
+      return new Response(null, { status: 204, headers: CORS_HEADERS });
+    }
+
     if (pathname === "/generate-link") {
       // Handle link generation
       return await handleGenerateLink(request, env);
+    } else if (pathname.startsWith("/t/") && pathname.endsWith(".pdf")) {
+      // Handle a stateless token minted by the Flask app
+      const token = pathname.slice(3, -4); // Extract token after '/t/' and remove '.pdf'
+      return await handleTokenLink(token, request, env);
     } else if (pathname.startsWith("/tmp/") && pathname.endsWith(".pdf")) {
       // Handle accessing the temporary link
       const tmpKey = pathname.slice(5, -4); // Extract key after '/tmp/' and remove '.pdf'
-      return await handleProxyLink(tmpKey, env);
+      return await handleProxyLink(tmpKey, request, env);
     } else {
       return new Response("Invalid endpoint", { status: 404 });
     }
@@ -42,7 +51,7 @@ async function handleGenerateLink(request, env) {
   });
 }
 
-async function handleProxyLink(tmpKey, env) {
+async function handleProxyLink(tmpKey, request, env) {
   // Retrieve the signed URL from KV
   const signedUrl = await env.TEMP_LINKS.get(tmpKey);
 
@@ -50,15 +59,134 @@ async function handleProxyLink(tmpKey, env) {
     return new Response("Temporary link expired or invalid", { status: 404 });
   }
 
+  return await proxyFile(signedUrl, request);
+}
+
+// Fetches a signed URL, passing on range and conditional headers, and returns the file
+async function proxyFile(signedUrl, request) {
+  const upstreamHeaders = new Headers();
+  for (const name of FORWARDED_HEADERS) {
+    const value = request.headers.get(name);
+    if (value) {
+      upstreamHeaders.set(name, value);
+    }
+  }
+
   // Proxy the signed URL
-  const response = await fetch(signedUrl);
+  const response = await fetch(signedUrl, { headers: upstreamHeaders });
   const headers = new Headers(response.headers);
 
   // Ensure the Content-Disposition header forces a PDF filename
   headers.set("Content-Disposition", 'inline; filename="file.pdf"');
+  for (const [name, value] of Object.entries(CORS_HEADERS)) {
+    headers.set(name, value);
+  }
 
   return new Response(response.body, {
     status: response.status,
     headers,
   });
 }
+
+// Request headers passed on to the bucket, so viewers can fetch byte ranges
+const FORWARDED_HEADERS = ["Range", "If-Range", "If-None-Match", "If-Modified-Since"];
+
+const CORS_HEADERS = {
+  "Access-Control-Allow-Origin": "*",
+  "Access-Control-Allow-Headers": FORWARDED_HEADERS.join(", "),
+  "Access-Control-Expose-Headers": "Accept-Ranges, Content-Length, Content-Range, ETag",
+};
+
+// Validity of the signed URLs the worker creates for its own bucket requests
+const UPSTREAM_URL_EXPIRE_SECONDS = 300;
+
+function base64UrlDecode(text) {
+  const base64 = text.replace(/-/g, "+").replace(/_/g, "/");
+  const binary = atob(base64 + "=".repeat((4 - (base64.length % 4)) % 4));
+  return Uint8Array.from(binary, (c) => c.charCodeAt(0));
+}
+
+// Checks a token from application/proxy_tokens.py (mint_token) and returns the
+// blob name, or null if it is malformed, forged or expired.
+export async function verifyToken(token, secret, now = Date.now() / 1000) {
+  const [payload, signature, extra] = token.split(".");
+  if (!payload || !signature || extra !== undefined) {
+    return null;
+  }
+  const encoder = new TextEncoder();
+  const key = await crypto.subtle.importKey(
+    "raw", encoder.encode(secret), { name: "HMAC", hash: "SHA-256" }, false, ["verify"]
+  );
+  let claims;
+  try {
+    // subtle.verify compares in constant time
+    const valid = await crypto.subtle.verify("HMAC", key, base64UrlDecode(signature), encoder.encode(payload));
+    if (!valid) {
+      return null;
+    }
+    claims = JSON.parse(new TextDecoder().decode(base64UrlDecode(payload)));
+  } catch (e) {
+    return null;
+  }
+  if (typeof claims.b !== "string" || typeof claims.e !== "number" || claims.e < now) {
+    return null;
+  }
+  return claims.b;
+}
+
+// Percent-encodes like Python's urllib.parse.quote(value, safe="~"), as GCS expects
+function quoteParam(value, keepSlash = false) {
+  const quoted = encodeURIComponent(value).replace(/[!'()*]/g, (c) => "%" + c.charCodeAt(0).toString(16).toUpperCase());
+  return keepSlash ? quoted.replace(/%2F/g, "/") : quoted;
+}
+
+function toHex(buffer) {
+  return [...new Uint8Array(buffer)].map((b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+// Creates a V4 signed GET URL for an object with the service account key in
+// GCS_CLIENT_EMAIL / GCS_PRIVATE_KEY (PKCS#8 PEM), like Blob.generate_signed_url.
+export async function signGcsUrl(env, blobName, expireSeconds, date = new Date()) {
+  const host = "storage.googleapis.com";
+  const timestamp = date.toISOString().replace(/[-:]/g, "").replace(/\.\d{3}/, "");
+  const datestamp = timestamp.slice(0, 8);
+  const scope = `${datestamp}/auto/storage/goog4_request`;
+  const resource = `/${env.GCS_BUCKET}/${quoteParam(blobName, true)}`;
+
+  const params = {
+    "X-Goog-Algorithm": "GOOG4-RSA-SHA256",
+    "X-Goog-Credential": `${env.GCS_CLIENT_EMAIL}/${scope}`,
+    "X-Goog-Date": timestamp,
+    "X-Goog-Expires": String(expireSeconds),
+    "X-Goog-SignedHeaders": "host",
+  };
+  const query = Object.entries(params)
+    .map(([name, value]) => `${quoteParam(name)}=${quoteParam(value)}`)
+    .sort()
+    .join("&");
+  const canonicalRequest = ["GET", resource, query, `host:${host}\n`, "host", "UNSIGNED-PAYLOAD"].join("\n");
+
+  const encoder = new TextEncoder();
+  const requestHash = toHex(await crypto.subtle.digest("SHA-256", encoder.encode(canonicalRequest)));
+  const stringToSign = ["GOOG4-RSA-SHA256", timestamp, scope, requestHash].join("\n");
+
+  const pem = env.GCS_PRIVATE_KEY.replace(/\\n/g, "\n").replace(/-----[A-Z ]+-----/g, "").replace(/\s+/g, "");
+  const key = await crypto.subtle.importKey(
+    "pkcs8", Uint8Array.from(atob(pem), (c) => c.charCodeAt(0)),
+    { name: "RSASSA-PKCS1-v1_5", hash: "SHA-256" }, false, ["sign"]
+  );
+  const signature = toHex(await crypto.subtle.sign("RSASSA-PKCS1-v1_5", key, encoder.encode(stringToSign)));
+  return `https://${host}${resource}?${query}&X-Goog-Signature=${signature}`;
+}
+
+async function handleTokenLink(token, request, env) {
+  // Verify the token with the secret shared with the app (FILE_PROXY_SECRET)
+  const blobName = await verifyToken(token, env.TOKEN_SECRET);
+  if (!blobName) {
+    return new Response("Temporary link expired or invalid", { status: 404 });
+  }
+
+  // Sign the bucket request here instead of storing a signed URL in KV
+  const signedUrl = await signGcsUrl(env, blobName, UPSTREAM_URL_EXPIRE_SECONDS);
+  return await proxyFile(signedUrl, request);
+}